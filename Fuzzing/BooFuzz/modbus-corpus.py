@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# builds a seed corpus for modbus-tcp-request.boofuzz.py from a capture
+#
+# usage: modbus-corpus.py [-o modbus-corpus.json] [capture ...]
+#
+# Streams each capture once, reassembles the Modbus/TCP connections and
+# keeps one request per distinct (function, length, structure), the
+# structure being the PDU's shape without addresses or values: a read's
+# quantity, a multiple write's quantity and byte count. Every seed is
+# weighted by how often its class occurs, square root damped so the rare
+# ones still get a share:
+#
+#   [{"function": 4, "data": "0000006a", "length": 5, "structure": "read:106",
+#     "count": 86, "weight": 0.031}, ...]
+#
+# data is the PDU after the function code, in hex, which is what the
+# harness's Func_Data carries; feed the file to it with --corpus.
+
+import argparse
+import json
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Protocols'))
+from pcaptools import modbus, pcap, tcp
+
+PLANT1 = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      '..', '..', 'Protocols', 'Modbus', 'ModbusTCP', 'Plant1_ModbusTCP.pcap')
+
+
+def requests(path, port=modbus.PORT):
+    """Yield every Modbus request PDU sent to port in a capture."""
+    streams = tcp.Streams()
+    framers = {}
+    for _, packet in pcap.packets(path):
+        if packet.proto != pcap.TCP or packet.dport != port:
+            continue
+        key, data = streams.feed(packet)
+        framer = framers.get(key)
+        if framer is None:
+            framer = framers[key] = modbus.Framer()
+        for buf in data:
+            for _, _, pdu in framer.feed(buf):
+                if len(pdu):
+                    yield pdu
+        if key not in streams.streams:
+            # connection closed
+            framers.pop(key, None)
+
+
+def build(paths, port=modbus.PORT):
+    seeds = {}
+    for path in paths:
+        for pdu in requests(path, port):
+            key = (pdu[0], len(pdu), modbus.structure(pdu))
+            seed = seeds.get(key)
+            if seed is None:
+                seeds[key] = seed = {
+                    'function': pdu[0],
+                    'name': modbus.function_name(pdu[0]),
+                    'data': bytes(pdu[1:]).hex(),
+                    'length': len(pdu),
+                    'structure': key[2],
+                    'count': 0,
+                }
+            seed['count'] += 1
+    total = sum(math.sqrt(seed['count']) for seed in seeds.values()) or 1
+    for seed in seeds.values():
+        seed['weight'] = round(math.sqrt(seed['count']) / total, 6)
+    return sorted(seeds.values(), key=lambda seed: -seed['weight'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a Modbus seed corpus from captures")
+    parser.add_argument('captures', nargs='*', default=[PLANT1],
+                        help="pcap or pcapng files [default=Plant1_ModbusTCP.pcap]")
+    parser.add_argument('-o', '--output', default='modbus-corpus.json',
+                        help="corpus file [default=%(default)s]")
+    parser.add_argument('--port', type=int, default=modbus.PORT,
+                        help="Modbus server port in the captures [default=%(default)s]")
+    args = parser.parse_args()
+
+    seeds = build(args.captures, args.port)
+    with open(args.output, 'w') as f:
+        json.dump(seeds, f, indent=1)
+    print("%d seeds from %d requests in %s" % (
+        len(seeds), sum(seed['count'] for seed in seeds), args.output))
+
+
+if __name__ == '__main__':
+    main()
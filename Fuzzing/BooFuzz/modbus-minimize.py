@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# minimizes a boofuzz Modbus run down to the cases that crash the target
+#
+# usage: modbus-minimize.py [options] run.db [run.db ...]
+#
+# Reads the sent data of every test case from the boofuzz session
+# databases (boofuzz-results/*.db, or <logdir>/worker-N.db with -j), in
+# send order, and delta debugs the sequence to a smallest set of cases
+# that still crashes the target when replayed in order.
+#
+# Every attempt starts a fresh target from --target, a command with
+# {port} standing for the port to listen on, replays the cases one
+# connection each, as boofuzz sent them, and counts a crash if the
+# target exited or stopped answering a read of holding register 0. The
+# subsets and complements tried at each step of the bisection are
+# independent, so up to --jobs of them run at once, each against its own
+# target on its own port from --port up.
+
+import argparse
+import concurrent.futures
+import json
+import os
+import queue
+import shlex
+import socket
+import sqlite3
+import struct
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TARGET = '%s %s --port {port}' % (sys.executable, os.path.join(HERE, 'modbus-server.py'))
+HEALTH = struct.pack('>HHHBBHH', 0, 0, 6, 1, 3, 0, 1)
+
+
+def load_cases(paths, last=None, window=None):
+    """Sent data of every test case, as a list of lists of messages, in send order."""
+    steps = []
+    for k, path in enumerate(paths):
+        db = sqlite3.connect('file:%s?mode=ro' % path, uri=True)
+        try:
+            rows = db.execute("SELECT test_case_index, data, timestamp FROM steps "
+                              "WHERE type = 'send' ORDER BY rowid")
+            steps.extend((timestamp, k, index, bytes(data)) for index, data, timestamp in rows)
+        finally:
+            db.close()
+    steps.sort(key=lambda step: step[0])
+
+    cases = {}
+    order = []
+    for _, k, index, data in steps:
+        if last is not None and index > last:
+            continue
+        key = (k, index)
+        if key not in cases:
+            cases[key] = []
+            order.append(key)
+        cases[key].append(data)
+    sequence = [cases[key] for key in order]
+    if window:
+        sequence = sequence[-window:]
+    return sequence
+
+
+class Reproducer(object):
+    """Replays cases against fresh targets, one per free port."""
+
+    def __init__(self, command, host, ports, timeout=1.0, startup=10.0):
+        self.command = command
+        self.host = host
+        self.timeout = timeout
+        self.startup = startup
+        self.ports = queue.Queue()
+        for port in ports:
+            self.ports.put(port)
+        self.attempts = 0
+
+    def _ready(self, proc, port):
+        deadline = time.time() + self.startup
+        while time.time() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError("target exited on startup: %s" % self.command.format(port=port))
+            try:
+                socket.create_connection((self.host, port), self.timeout).close()
+                return
+            except OSError:
+                time.sleep(0.05)
+        raise RuntimeError("target did not listen on port %d within %.0f s" % (port, self.startup))
+
+    def _send(self, port, case):
+        try:
+            sock = socket.create_connection((self.host, port), self.timeout)
+        except OSError:
+            return False
+        try:
+            sock.settimeout(self.timeout)
+            for message in case:
+                sock.sendall(message)
+                try:
+                    sock.recv(4096)
+                except socket.timeout:
+                    pass
+        except OSError:
+            pass
+        finally:
+            sock.close()
+        return True
+
+    def _alive(self, proc, port):
+        if proc.poll() is not None:
+            return False
+        try:
+            sock = socket.create_connection((self.host, port), self.timeout)
+        except OSError:
+            return False
+        try:
+            sock.settimeout(self.timeout)
+            sock.sendall(HEALTH)
+            return len(sock.recv(4096)) > 0
+        except OSError:
+            return False
+        finally:
+            sock.close()
+
+    def __call__(self, cases):
+        """True if replaying cases crashes the target."""
+        port = self.ports.get()
+        proc = subprocess.Popen(shlex.split(self.command.format(port=port)),
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            self._ready(proc, port)
+            for case in cases:
+                if not self._send(port, case):
+                    return True
+            return not self._alive(proc, port)
+        finally:
+            self.attempts += 1
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+            self.ports.put(port)
+
+
+def ddmin(cases, crashes, pool, log=None):
+    """Delta debug cases to a 1-minimal crashing subsequence.
+
+    Each round splits the current sequence into n chunks and tries every
+    chunk, then every complement, all submitted to pool at once; the first
+    crashing candidate in that order wins. Results are memoized by the
+    case indices tried.
+    """
+    indices = list(range(len(cases)))
+    tried = {}
+
+    def test(subset):
+        key = tuple(subset)
+        if key not in tried:
+            tried[key] = pool.submit(crashes, [cases[k] for k in subset])
+        return tried[key]
+
+    n = 2
+    while len(indices) >= 2:
+        size = len(indices)
+        chunks = [indices[size * k // n:size * (k + 1) // n] for k in range(n)]
+        chunks = [chunk for chunk in chunks if chunk]
+        complements = []
+        if n > 2:
+            for chunk in chunks:
+                drop = set(chunk)
+                complements.append([k for k in indices if k not in drop])
+        candidates = chunks + complements
+        futures = [test(candidate) for candidate in candidates]
+
+        found = None
+        for candidate, future in zip(candidates, futures):
+            if future.result():
+                found = candidate
+                break
+        if found is not None:
+            indices = found
+            n = 2 if found in chunks else max(n - 1, 2)
+        elif n >= len(indices):
+            break
+        else:
+            n = min(2 * n, len(indices))
+        if log:
+            log("%d cases left, granularity %d" % (len(indices), n))
+    return indices
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Minimize a crashing boofuzz Modbus run")
+    parser.add_argument('databases', nargs='+', help="boofuzz session databases")
+    parser.add_argument('--target', default=TARGET,
+                        help="command starting the target, {port} for its port [default=the stand-in]")
+    parser.add_argument('--host', default='127.0.0.1', help="target address [default=%(default)s]")
+    parser.add_argument('--port', type=int, default=20502,
+                        help="first target port; attempt k of --jobs uses port + k [default=%(default)s]")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help="attempts run at once [default=%(default)s]")
+    parser.add_argument('--last', type=int, default=None,
+                        help="ignore cases after this test case index, the one that crashed")
+    parser.add_argument('--window', type=int, default=None,
+                        help="only consider the last WINDOW cases")
+    parser.add_argument('--timeout', type=float, default=1.0,
+                        help="seconds to wait for an answer [default=%(default)s]")
+    parser.add_argument('-o', '--output', default='minimized.json',
+                        help="file for the minimal cases, hex per message [default=%(default)s]")
+    args = parser.parse_args()
+
+    cases = load_cases(args.databases, args.last, args.window)
+    if not cases:
+        parser.error("no sent cases in %s" % ", ".join(args.databases))
+    reproduce = Reproducer(args.target, args.host, range(args.port, args.port + args.jobs), args.timeout)
+
+    start = time.time()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        if not reproduce(cases):
+            print("the %d cases do not crash the target, nothing to minimize" % len(cases))
+            return 1
+        indices = ddmin(cases, reproduce, pool, log=print)
+
+    minimal = [cases[k] for k in indices]
+    with open(args.output, 'w') as f:
+        json.dump([[message.hex() for message in case] for case in minimal], f, indent=1)
+    print("%d of %d cases reproduce the crash, %d attempts in %.1f s, written to %s" % (
+        len(minimal), len(cases), reproduce.attempts, time.time() - start, args.output))
+    for case in minimal:
+        print(" ".join(message.hex() for message in case))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# Modbus/TCP server to fuzz and benchmark against, in place of a PLC
+#
+# usage: modbus-server.py [--port 10502] [--map registers.json] [options]
+#
+# Serves the function codes the plant capture in
+# Protocols/Modbus/ModbusTCP/modbus.log uses, plus the single writes and
+# holding registers, from an in memory register map, to any unit id.
+# Requests on one connection are answered in order; connections are
+# served concurrently, thousands at a time.
+#
+# Faults are injected per request with the given probabilities:
+#
+#   --drop P        close the connection instead of answering
+#   --exception P   answer with exception 04, server device failure
+#   --garble P      answer with random bytes in place of the PDU
+#
+# and --latency/--jitter delay every answer. Counters per function code,
+# exception and fault are printed every --stats seconds and at exit, and
+# served as JSON to anything connecting to --stats-port.
+#
+# The register map is JSON with any of coils, discrete_inputs,
+# holding_registers and input_registers, each a list of values from
+# address 0, or an object of "address": value:
+#
+#   {"input_registers": [100, 200, 300], "coils": {"16": 1}}
+
+import argparse
+import array
+import asyncio
+import collections
+import json
+import random
+import signal
+import struct
+import sys
+import time
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# function code: name as in Zeek's modbus.log
+FUNCTIONS = {
+    1: 'READ_COILS',
+    2: 'READ_DISCRETE_INPUTS',
+    3: 'READ_HOLDING_REGISTERS',
+    4: 'READ_INPUT_REGISTERS',
+    5: 'WRITE_SINGLE_COIL',
+    6: 'WRITE_SINGLE_REGISTER',
+    15: 'WRITE_MULTIPLE_COILS',
+    16: 'WRITE_MULTIPLE_REGISTERS',
+}
+
+ILLEGAL_FUNCTION = 1
+ILLEGAL_DATA_ADDRESS = 2
+ILLEGAL_DATA_VALUE = 3
+SERVER_DEVICE_FAILURE = 4
+
+SIZE = 65536
+MBAP = struct.Struct('>HHHB')
+ADDRESS_COUNT = struct.Struct('>HH')
+
+
+class ModbusError(Exception):
+
+    def __init__(self, code):
+        Exception.__init__(self, code)
+        self.code = code
+
+
+class DataBank(object):
+    """The four Modbus tables: bits as bytearrays of 0/1, registers as arrays of uint16."""
+
+    TABLES = ('coils', 'discrete_inputs', 'holding_registers', 'input_registers')
+
+    def __init__(self, size=SIZE):
+        self.coils = bytearray(size)
+        self.discrete_inputs = bytearray(size)
+        self.holding_registers = array.array('H', bytes(2 * size))
+        self.input_registers = array.array('H', bytes(2 * size))
+
+    @classmethod
+    def from_json(cls, path, size=SIZE):
+        bank = cls(size)
+        with open(path) as f:
+            config = json.load(f)
+        for name, values in config.items():
+            if name not in cls.TABLES:
+                raise ValueError("%s: unknown table %r, expected one of %s"
+                                 % (path, name, ", ".join(cls.TABLES)))
+            if isinstance(values, dict):
+                values = {int(address): value for address, value in values.items()}
+            else:
+                values = dict(enumerate(values))
+            table = getattr(bank, name)
+            for address, value in values.items():
+                table[address] = int(bool(value)) if isinstance(table, bytearray) else value
+        return bank
+
+    @staticmethod
+    def _span(table, address, count, limit):
+        if not 1 <= count <= limit:
+            raise ModbusError(ILLEGAL_DATA_VALUE)
+        if address + count > len(table):
+            raise ModbusError(ILLEGAL_DATA_ADDRESS)
+
+    def read_bits(self, table, address, count):
+        self._span(table, address, count, 2000)
+        bits = table[address:address + count]
+        packed = bytearray((count + 7) // 8)
+        for k, bit in enumerate(bits):
+            if bit:
+                packed[k >> 3] |= 1 << (k & 7)
+        return bytes(packed)
+
+    def write_bits(self, table, address, count, packed):
+        self._span(table, address, count, 1968)
+        if len(packed) != (count + 7) // 8:
+            raise ModbusError(ILLEGAL_DATA_VALUE)
+        table[address:address + count] = bytes((packed[k >> 3] >> (k & 7)) & 1 for k in range(count))
+
+    def read_registers(self, table, address, count):
+        self._span(table, address, count, 125)
+        registers = table[address:address + count]
+        if sys.byteorder == 'little':
+            registers.byteswap()
+        return registers.tobytes()
+
+    def write_registers(self, table, address, count, data):
+        self._span(table, address, count, 123)
+        if len(data) != 2 * count:
+            raise ModbusError(ILLEGAL_DATA_VALUE)
+        registers = array.array('H', data)
+        if sys.byteorder == 'little':
+            registers.byteswap()
+        table[address:address + count] = registers
+
+
+class ModbusServer(object):
+
+    def __init__(self, bank, latency=0.0, jitter=0.0, drop=0.0, exception=0.0, garble=0.0, seed=None):
+        self.bank = bank
+        self.latency = latency
+        self.jitter = jitter
+        self.drop = drop
+        self.exception = exception
+        self.garble = garble
+        self.random = random.Random(seed)
+        self.counters = collections.Counter()
+        self.connections = 0
+        self.started = time.time()
+
+    def process(self, pdu):
+        """Answer one request PDU, raising ModbusError for an exception response."""
+        function = pdu[0]
+        body = pdu[1:]
+        bank = self.bank
+        if function not in FUNCTIONS:
+            raise ModbusError(ILLEGAL_FUNCTION)
+        if len(body) < 4:
+            raise ModbusError(ILLEGAL_DATA_VALUE)
+        address, value = ADDRESS_COUNT.unpack_from(body)
+
+        if function in (1, 2):
+            table = bank.coils if function == 1 else bank.discrete_inputs
+            data = bank.read_bits(table, address, value)
+            return bytes((function, len(data))) + data
+        if function in (3, 4):
+            table = bank.holding_registers if function == 3 else bank.input_registers
+            data = bank.read_registers(table, address, value)
+            return bytes((function, len(data))) + data
+        if function == 5:
+            if value not in (0x0000, 0xff00):
+                raise ModbusError(ILLEGAL_DATA_VALUE)
+            bank.write_bits(bank.coils, address, 1, bytes((value >> 15,)))
+            return pdu[:5]
+        if function == 6:
+            bank.write_registers(bank.holding_registers, address, 1, body[2:4])
+            return pdu[:5]
+        if len(body) < 5 or body[4] != len(body) - 5:
+            raise ModbusError(ILLEGAL_DATA_VALUE)
+        if function == 15:
+            bank.write_bits(bank.coils, address, value, body[5:])
+        else:
+            bank.write_registers(bank.holding_registers, address, value, body[5:])
+        return pdu[:5]
+
+    def respond(self, pdu):
+        """The response PDU, or None to drop the connection."""
+        function = pdu[0] if pdu else 0
+        name = FUNCTIONS.get(function, 'UNKNOWN')
+        self.counters['requests'] += 1
+        self.counters[name] += 1
+
+        roll = self.random.random()
+        if roll < self.drop:
+            self.counters['fault_drop'] += 1
+            return None
+        roll -= self.drop
+        if roll < self.exception:
+            self.counters['fault_exception'] += 1
+            return bytes((function | 0x80, SERVER_DEVICE_FAILURE))
+        roll -= self.exception
+        if roll < self.garble:
+            self.counters['fault_garble'] += 1
+            size = self.random.randint(1, 253)
+            return self.random.getrandbits(8 * size).to_bytes(size, 'little')
+
+        try:
+            if not pdu:
+                raise ModbusError(ILLEGAL_FUNCTION)
+            return self.process(pdu)
+        except ModbusError as e:
+            self.counters['exception_%02d' % e.code] += 1
+            return bytes(((function | 0x80) & 0xff, e.code))
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        self.counters['connections'] += 1
+        try:
+            while True:
+                header = await reader.readexactly(MBAP.size)
+                tid, protocol, length, unit = MBAP.unpack(header)
+                if protocol != 0 or not 2 <= length <= 254:
+                    self.counters['bad_frames'] += 1
+                    return
+                pdu = await reader.readexactly(length - 1)
+                response = self.respond(pdu)
+                if response is None:
+                    return
+                if self.latency or self.jitter:
+                    await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+                writer.write(MBAP.pack(tid, 0, len(response) + 1, unit) + response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    def stats(self):
+        elapsed = max(time.time() - self.started, 1e-9)
+        stats = dict(self.counters)
+        stats['open_connections'] = self.connections
+        stats['uptime'] = round(elapsed, 3)
+        stats['requests_per_second'] = round(self.counters['requests'] / elapsed, 1)
+        return stats
+
+    async def serve_stats(self, reader, writer):
+        writer.write(json.dumps(self.stats(), sort_keys=True).encode() + b'\n')
+        await writer.drain()
+        writer.close()
+
+
+async def report(server, interval):
+    while True:
+        await asyncio.sleep(interval)
+        print(json.dumps(server.stats(), sort_keys=True), flush=True)
+
+
+async def serve(args):
+    bank = DataBank.from_json(args.map) if args.map else DataBank()
+    server = ModbusServer(bank, args.latency / 1e3, args.jitter / 1e3,
+                          args.drop, args.exception, args.garble, args.seed)
+    listeners = [await asyncio.start_server(server.handle, args.host, args.port, backlog=args.backlog)]
+    if args.stats_port:
+        listeners.append(await asyncio.start_server(server.serve_stats, args.host, args.stats_port))
+    print("serving Modbus/TCP on %s:%d" % (args.host, args.port), flush=True)
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    reporter = asyncio.ensure_future(report(server, args.stats)) if args.stats else None
+    await stop.wait()
+
+    if reporter:
+        reporter.cancel()
+    for listener in listeners:
+        listener.close()
+    print(json.dumps(server.stats(), sort_keys=True), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Modbus/TCP stand-in target")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on [default=%(default)s]")
+    parser.add_argument('--port', type=int, default=10502, help="Modbus port [default=%(default)s]")
+    parser.add_argument('--map', default=None, help="JSON register map")
+    parser.add_argument('--latency', type=float, default=0, help="ms before every answer")
+    parser.add_argument('--jitter', type=float, default=0, help="up to this many more ms, uniformly")
+    parser.add_argument('--drop', type=float, default=0, help="probability of closing instead of answering")
+    parser.add_argument('--exception', type=float, default=0, help="probability of a device failure exception")
+    parser.add_argument('--garble', type=float, default=0, help="probability of a random PDU")
+    parser.add_argument('--seed', type=int, default=None, help="fault injection seed, for reproducible runs")
+    parser.add_argument('--stats', type=float, default=0, help="seconds between counter printouts, 0 for only at exit")
+    parser.add_argument('--stats-port', type=int, default=0, help="port serving the counters as JSON")
+    parser.add_argument('--backlog', type=int, default=4096, help="listen backlog [default=%(default)s]")
+    args = parser.parse_args()
+
+    if uvloop is not None:
+        uvloop.install()
+    asyncio.run(serve(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,415 @@
+#!/usr/bin/env python3
+# fuzzes a Modbus/TCP server with boofuzz
+#
+# usage: modbus-tcp-request.boofuzz.py [-j JOBS] [--ip IP] [--port PORT]
+#
+# with -j above 1 the mutation space of Modbus_Request is cut into JOBS
+# contiguous index ranges, each fuzzed by its own process over its own
+# connection. Every worker logs to <logdir>/worker-N.csv; when they are
+# done the logs are merged, by time, into <logdir>/merged.csv and every
+# failed case into <logdir>/failures.csv.
+#
+# modbus-server.py listens on the default address and port when there is
+# no PLC to fuzz.
+#
+# --corpus takes seeds written by modbus-corpus.py in place of the blind
+# Function x Func_Data walk: one request per seed, keeping its function
+# code, length, address, quantity and byte count and randomizing the
+# values for a share of --budget cases in proportion to the seed's weight.
+#
+# Every response is classified by its function or exception code, byte
+# count and latency bucket. The behaviors each branch, the primitive
+# being mutated, turned up are written to --feedback, or
+# <logdir>/feedback.json with -j. --patience N skips the rest of a branch
+# once N of its cases in a row turned up nothing new, and --prior takes
+# an earlier run's feedback to shift the corpus budget toward the seeds
+# whose branches kept finding new behaviors.
+
+import argparse
+import csv
+import json
+import math
+import multiprocessing
+import multiprocessing.connection
+import os
+import re
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
 from boofuzz import Target, Session, TCPSocketConnection, Request, Word, Size, Block, Byte, RandomData
+from boofuzz import FuzzLoggerCsv, FuzzLoggerText, IFuzzLoggerBackend
 
 IP = '127.0.0.1'
 PORT = 10502
 UNIT_ID = 1
+BUDGET = 100000
 
-target = Target(connection = TCPSocketConnection(IP, PORT))
-session = Session(target = target)
-
-request = Request('Modbus_Request', children=(
-    Word(name='Trans_ID', default_value=1, endian='>', fuzzable=False),
-    Word(name='Version', default_value=0, endian='>', fuzzable=False),
-    Size(name='Size', block_name='Modbus_PDU', length=2, endian='>', fuzzable=False),
-    Block(name='Modbus_PDU', children=(
-        Byte(name='Unit_ID', default_value=UNIT_ID, endian='>', fuzzable=False),
-        Byte(name='Function', default_value=3, full_range=True, endian='>'),
-        RandomData(name='Func_Data', default_value='\x00\x00\x00\x01', max_length=256, step=4),
+
+def modbus_request():
+    return Request('Modbus_Request', children=(
+        Word(name='Trans_ID', default_value=1, endian='>', fuzzable=False),
+        Word(name='Version', default_value=0, endian='>', fuzzable=False),
+        Size(name='Size', block_name='Modbus_PDU', length=2, endian='>', fuzzable=False),
+        Block(name='Modbus_PDU', children=(
+            Byte(name='Unit_ID', default_value=UNIT_ID, endian='>', fuzzable=False),
+            Byte(name='Function', default_value=3, full_range=True, endian='>'),
+            RandomData(name='Func_Data', default_value='\x00\x00\x00\x01', max_length=256, step=4),
+            ))
         ))
-    ))
 
-session.connect(request)
-session.fuzz()
\ No newline at end of file
+
+def load_corpus(path):
+    """(function, data, weight) for every seed in a modbus-corpus.py file."""
+    with open(path) as f:
+        return [(seed['function'], bytes.fromhex(seed['data']), seed['weight']) for seed in json.load(f)]
+
+
+def seed_fields(function, data, mutations):
+    """Func_Data of a seed, laid out as modbus.structure sees it.
+
+    The address, quantity and byte count keep the seed's values, so every
+    case takes the parser path the seed did; the register or coil values
+    are what gets randomized. Reads have no values, their address alone is
+    walked through boofuzz's boundary integers. Anything else is random
+    data of the seed's length.
+    """
+    mutations = max(1, mutations)
+    if function in (0x01, 0x02, 0x03, 0x04) and len(data) == 4:
+        address, quantity = struct.unpack('>HH', data)
+        return (
+            Word(name='Address', default_value=address, endian='>'),
+            Word(name='Quantity', default_value=quantity, endian='>', fuzzable=False),
+            )
+    if function in (0x05, 0x06) and len(data) == 4:
+        return (
+            Word(name='Address', default_value=struct.unpack('>H', data[:2])[0], endian='>', fuzzable=False),
+            RandomData(name='Value', default_value=data[2:], min_length=2, max_length=2, max_mutations=mutations),
+            )
+    if function in (0x0f, 0x10) and len(data) > 5:
+        address, quantity = struct.unpack('>HH', data[:4])
+        return (
+            Word(name='Address', default_value=address, endian='>', fuzzable=False),
+            Word(name='Quantity', default_value=quantity, endian='>', fuzzable=False),
+            Byte(name='Byte_Count', default_value=data[4], endian='>', fuzzable=False),
+            RandomData(name='Values', default_value=data[5:], min_length=len(data) - 5,
+                       max_length=len(data) - 5, max_mutations=mutations),
+            )
+    return (
+        RandomData(name='Func_Data', default_value=data, min_length=len(data),
+                   max_length=len(data), max_mutations=mutations),
+        )
+
+
+def seeded_requests(seeds, budget=BUDGET):
+    requests = []
+    for k, (function, data, weight) in enumerate(seeds):
+        requests.append(Request('Modbus_Request_%d' % k, children=(
+            Word(name='Trans_ID', default_value=1, endian='>', fuzzable=False),
+            Word(name='Version', default_value=0, endian='>', fuzzable=False),
+            Size(name='Size', block_name='Modbus_PDU', length=2, endian='>', fuzzable=False),
+            Block(name='Modbus_PDU', children=(
+                Byte(name='Unit_ID', default_value=UNIT_ID, endian='>', fuzzable=False),
+                Byte(name='Function', default_value=function, endian='>', fuzzable=False),
+                ) + seed_fields(function, data, int(round(budget * weight)))),
+            )))
+    return requests
+
+
+def reweight(seeds, prior):
+    """Scale seed weights by how well their branches found new behaviors in prior."""
+    yields = []
+    for k in range(len(seeds)):
+        prefix = 'Modbus_Request_%d:' % k
+        stats = [b for name, b in prior['branches'].items() if name.startswith(prefix)]
+        cases = sum(b['cases'] for b in stats)
+        new = sum(b['new'] for b in stats)
+        yields.append((new + 1) / (cases + 1))
+    total = sum(weight * y for (_, _, weight), y in zip(seeds, yields)) or 1
+    return [(function, data, weight * y / total) for (function, data, weight), y in zip(seeds, yields)]
+
+
+def requests(corpus=None, budget=BUDGET, prior=None):
+    if corpus is None:
+        return [modbus_request()]
+    seeds = load_corpus(corpus)
+    if prior is not None:
+        with open(prior) as f:
+            seeds = reweight(seeds, json.load(f))
+    return seeded_requests(seeds, budget)
+
+
+def connect(session, args):
+    for request in requests(args.corpus, args.budget, args.prior):
+        session.connect(request)
+
+
+def num_cases(args):
+    # a throwaway session, with its results database out of the way
+    scratch = tempfile.mkdtemp()
+    try:
+        session = Session(target=None, web_port=None, fuzz_loggers=[],
+                          db_filename=os.path.join(scratch, 'count.db'))
+        connect(session, args)
+        try:
+            # 0.4 counts the first depth only when asked to, and None otherwise
+            total = session.num_mutations(max_depth=1)
+        except TypeError:
+            total = None
+        if total is None:
+            total = session.num_mutations()
+        return total
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+class Feedback(IFuzzLoggerBackend):
+    """Fuzz logger backend classifying every response as a behavior.
+
+    A behavior is (outcome, byte count, latency bucket): the outcome is
+    the response's function code, its exception code, a short frame or no
+    answer, and latency buckets are powers of two in milliseconds. Each
+    branch keeps its number of cases, how many of them found a behavior
+    not seen before, and how long since the last one did. With patience
+    set, a branch that goes that many cases without finding anything is
+    skipped for the rest of the run, through the flag boofuzz's own
+    skip element control sets.
+    """
+
+    def __init__(self, patience=0):
+        self.session = None
+        self.patience = patience
+        self.seen = set()
+        self.branches = {}
+        self._branch = None
+        self._sent = None
+        self._recv = None
+
+    @staticmethod
+    def branch(name):
+        # Modbus_Request:[Modbus_Request.Modbus_PDU.Function:5] -> the part before :5
+        return re.sub(r':\d+\]$', ']', name)
+
+    def behavior(self):
+        if self._recv is None or not self._recv[1]:
+            return ('none', 0, None)
+        at, data = self._recv
+        latency = int(math.log2(1 + max(at - (self._sent or at), 0) * 1e3))
+        if len(data) < 8:
+            return ('short', len(data), latency)
+        if data[7] & 0x80:
+            return ('exception-%d' % (data[8] if len(data) > 8 else -1), len(data), latency)
+        return ('function-%d' % data[7], len(data), latency)
+
+    def open_test_case(self, test_case_id, name=None, index=None, *args, **kwargs):
+        self._branch = self.branch(name or str(test_case_id))
+        self._sent = None
+        self._recv = None
+
+    def log_send(self, data):
+        self._sent = time.time()
+
+    def log_recv(self, data):
+        self._recv = (time.time(), bytes(data))
+
+    def close_test_case(self):
+        if self._branch is None:
+            return
+        stats = self.branches.get(self._branch)
+        if stats is None:
+            stats = self.branches[self._branch] = {'cases': 0, 'new': 0, 'stale': 0, 'pruned': False}
+        behavior = self.behavior()
+        stats['cases'] += 1
+        if behavior in self.seen:
+            stats['stale'] += 1
+        else:
+            self.seen.add(behavior)
+            stats['new'] += 1
+            stats['stale'] = 0
+        if (self.patience and stats['stale'] >= self.patience and not stats['pruned']
+                and hasattr(self.session, '_skip_current_element_after_current_test_case')):
+            self.session._skip_current_element_after_current_test_case = True
+            stats['pruned'] = True
+        self._branch = None
+
+    def open_test_step(self, description):
+        pass
+
+    def log_check(self, description):
+        pass
+
+    def log_error(self, description):
+        pass
+
+    def log_fail(self, description=''):
+        pass
+
+    def log_info(self, description):
+        pass
+
+    def log_pass(self, description=''):
+        pass
+
+    def close_test(self):
+        pass
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump({
+                'distinct': len(self.seen),
+                'behaviors': sorted(map(list, self.seen), key=str),
+                'branches': self.branches,
+            }, f, indent=1)
+
+
+def merge_feedback(paths, path):
+    """Merge per worker feedback files; return the number of distinct behaviors."""
+    behaviors, branches = set(), {}
+    for part in paths:
+        with open(part) as f:
+            feedback = json.load(f)
+        behaviors.update(tuple(b) for b in feedback['behaviors'])
+        for name, stats in feedback['branches'].items():
+            merged = branches.setdefault(name, {'cases': 0, 'new': 0, 'stale': 0, 'pruned': False})
+            merged['cases'] += stats['cases']
+            merged['new'] += stats['new']
+            merged['stale'] = max(merged['stale'], stats['stale'])
+            merged['pruned'] = merged['pruned'] or stats['pruned']
+    with open(path, 'w') as f:
+        json.dump({'distinct': len(behaviors), 'behaviors': sorted(map(list, behaviors), key=str),
+                   'branches': branches}, f, indent=1)
+    return len(behaviors)
+
+
+def shards(total, jobs):
+    """Split test case indices 1..total into jobs contiguous (start, end) ranges."""
+    bounds = [1 + total * k // jobs for k in range(jobs + 1)]
+    return [(lo, hi - 1) for lo, hi in zip(bounds, bounds[1:]) if hi > lo]
+
+
+def _worker(worker, index_start, index_end, counter, args):
+    log = open(os.path.join(args.logdir, 'worker-%d.csv' % worker), 'w')
+    feedback = Feedback(args.patience)
+
+    def count(target, fuzz_data_logger, session, *args, **kwargs):
+        with counter.get_lock():
+            counter.value += 1
+
+    session = Session(
+        target=Target(connection=TCPSocketConnection(args.ip, args.port)),
+        fuzz_loggers=[FuzzLoggerCsv(file_handle=log), feedback],
+        web_port=None,
+        index_start=index_start,
+        index_end=index_end,
+        post_test_case_callbacks=[count],
+        receive_data_after_fuzz=True,
+        db_filename=os.path.join(args.logdir, 'worker-%d.db' % worker),
+    )
+    feedback.session = session
+    connect(session, args)
+    try:
+        session.fuzz()
+    finally:
+        log.close()
+        feedback.dump(os.path.join(args.logdir, 'feedback-%d.json' % worker))
+
+
+def merge_logs(logdir, workers):
+    """Merge the worker CSV logs by timestamp; return the number of failures.
+
+    FuzzLoggerCsv writes rows of timestamp, event, ... with failed checks
+    and target errors as 'fail' and 'error' events. Timestamps are
+    [YYYY-mm-dd HH:MM:SS,ffffff], so they sort as strings.
+    """
+    rows = []
+    for worker in workers:
+        with open(os.path.join(logdir, 'worker-%d.csv' % worker)) as f:
+            rows.extend([row[0], worker] + row[1:] for row in csv.reader(f) if row)
+    rows.sort(key=lambda row: row[0])
+    failures = 0
+    with open(os.path.join(logdir, 'merged.csv'), 'w') as merged, \
+            open(os.path.join(logdir, 'failures.csv'), 'w') as failed:
+        merged_csv, failed_csv = csv.writer(merged), csv.writer(failed)
+        for row in rows:
+            merged_csv.writerow(row)
+            if len(row) > 2 and row[2].strip().lower() in ('fail', 'error'):
+                failed_csv.writerow(row)
+                failures += 1
+    return failures
+
+
+def fuzz_parallel(args, interval=5.0):
+    total = num_cases(args)
+    ranges = shards(total, args.jobs)
+    logdir = args.logdir
+    os.makedirs(logdir, exist_ok=True)
+    counter = multiprocessing.Value('L', 0)
+    print("%d cases over %d workers, logs in %s" % (total, len(ranges), logdir))
+
+    start = time.time()
+    procs = [multiprocessing.Process(target=_worker, args=(k, lo, hi, counter, args))
+             for k, (lo, hi) in enumerate(ranges)]
+    for proc in procs:
+        proc.start()
+    last = (start, 0)
+    while True:
+        running = [proc.sentinel for proc in procs if proc.is_alive()]
+        if not running:
+            break
+        multiprocessing.connection.wait(running, timeout=interval)
+        now, done = time.time(), counter.value
+        if now - last[0] >= interval:
+            print("%d/%d cases, %.0f cases/s" % (done, total, (done - last[1]) / (now - last[0])))
+            last = (now, done)
+    elapsed = max(time.time() - start, 1e-9)
+
+    failures = merge_logs(logdir, range(len(ranges)))
+    parts = [os.path.join(logdir, 'feedback-%d.json' % k) for k in range(len(ranges))]
+    distinct = merge_feedback([p for p in parts if os.path.exists(p)],
+                              args.feedback or os.path.join(logdir, 'feedback.json'))
+    print("%d cases in %.1f s: %.0f cases/s, %d failures, %d distinct behaviors" % (
+        counter.value, elapsed, counter.value / elapsed, failures, distinct))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fuzz a Modbus/TCP server with boofuzz")
+    parser.add_argument('--ip', default=IP, help="target address [default=%(default)s]")
+    parser.add_argument('--port', type=int, default=PORT, help="target port [default=%(default)s]")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="parallel connections, each fuzzing its own share of the cases")
+    parser.add_argument('--logdir', default='boofuzz-results',
+                        help="directory for the worker and merged logs [default=%(default)s]")
+    parser.add_argument('--corpus', default=None,
+                        help="seed corpus from modbus-corpus.py, in place of the blind walk")
+    parser.add_argument('--budget', type=int, default=BUDGET,
+                        help="cases shared out over the corpus seeds by weight [default=%(default)s]")
+    parser.add_argument('--feedback', default=None,
+                        help="write the behaviors found per branch to this JSON file")
+    parser.add_argument('--patience', type=int, default=0,
+                        help="skip a branch after this many cases without a new behavior, 0 never")
+    parser.add_argument('--prior', default=None,
+                        help="feedback of an earlier run over the same corpus, to reweight its seeds")
+    args = parser.parse_args()
+
+    if args.jobs > 1:
+        fuzz_parallel(args)
+        return
+
+    feedback = Feedback(args.patience)
+    target = Target(connection=TCPSocketConnection(args.ip, args.port))
+    # the response is what Feedback classifies, so read it after every case
+    session = Session(target=target, fuzz_loggers=[FuzzLoggerText(), feedback], receive_data_after_fuzz=True)
+    feedback.session = session
+    connect(session, args)
+    try:
+        session.fuzz()
+    finally:
+        if args.feedback:
+            feedback.dump(args.feedback)
+        print("%d distinct behaviors" % len(feedback.seen))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
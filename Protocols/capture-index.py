@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# finds the captures under Protocols/ that hold a protocol, opcode, host or port
+#
+# usage: capture-index.py [--root DIR] [--index FILE] update
+#        capture-index.py find [--protocol P] [--opcode OP] [--host ADDR] [--port N]
+#        capture-index.py opcodes [--protocol P] [--host ADDR] [--port N]
+#        capture-index.py files
+#
+# Every command first brings the index (capture-index.npz in the root) up
+# to date, rescanning only captures that changed since the last run, so
+# after the first run a query costs a stat per capture and a load. Opcodes
+# are given by name or number, per protocol:
+#
+#   capture-index.py find --protocol modbus --opcode WRITE_MULTIPLE_REGISTERS
+#   capture-index.py find --protocol s7comm --opcode 0x1a
+#   capture-index.py find --protocol bacnet --opcode who-Is
+#   capture-index.py opcodes --protocol dnp3
+
+import argparse
+import os
+import sys
+import time
+
+from pcaptools import index, opcodes
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _time(ts):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index the captures under a tree by protocol opcode")
+    parser.add_argument('--root', default=HERE, help="directory with the captures [default=Protocols/]")
+    parser.add_argument('--index', default=None, help="index file [default=ROOT/capture-index.npz]")
+    parser.add_argument('--no-update', action='store_true', help="query the index as it is")
+    parser.add_argument('-q', '--quiet', action='store_true', help="do not list rescanned captures")
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    commands.add_parser('update', help="rescan new and changed captures")
+    commands.add_parser('files', help="captures, rows and protocols")
+    find = commands.add_parser('find', help="captures with matching packets")
+    summary = commands.add_parser('opcodes', help="opcodes seen, with packet and capture counts")
+    for command in (find, summary):
+        command.add_argument('-p', '--protocol', choices=opcodes.PROTOCOLS, default=None)
+        command.add_argument('--host', default=None, help="source or destination address")
+        command.add_argument('--port', type=int, default=None, help="source or destination port")
+    find.add_argument('-o', '--opcode', default=None, help="opcode name or number, needs --protocol")
+    args = parser.parse_args()
+
+    path = args.index or os.path.join(args.root, 'capture-index.npz')
+    start = time.time()
+    idx = index.Index.load(path)
+    if not args.no_update:
+        log = None if args.quiet else lambda capture: print("indexing %s" % capture, file=sys.stderr)
+        rescanned, removed = idx.update(args.root, log)
+        if rescanned or removed:
+            idx.save(path)
+    else:
+        rescanned = removed = ()
+    if args.command == 'update':
+        print("%d captures, %d rows; %d rescanned, %d removed, %.2f s" % (
+            len(idx.files), len(idx), len(rescanned), len(removed), time.time() - start))
+        for capture, _, _, error, _ in idx.files:
+            if error:
+                print("  %s: %s" % (capture, error))
+        return
+
+    if args.command == 'files':
+        protocol = idx.columns['protocol']
+        file = idx.file
+        for k, (capture, _, size, error, rows) in enumerate(idx.files):
+            seen = sorted(set(protocol[file == k].tolist()) - {-1})
+            print("%8d %10d  %-60s %s" % (rows, size, capture,
+                                          error or " ".join(opcodes.PROTOCOLS[p] for p in seen)))
+        return
+
+    protocol = opcode = None
+    if args.protocol:
+        protocol = opcodes.PROTOCOLS.index(args.protocol)
+    if getattr(args, 'opcode', None) is not None:
+        if protocol is None:
+            parser.error("--opcode needs --protocol")
+        try:
+            opcode = opcodes.code(protocol, args.opcode)
+        except ValueError as e:
+            parser.error(str(e))
+    mask = idx.select(protocol, opcode, args.host, args.port)
+
+    if args.command == 'find':
+        for capture, rows, first, last in idx.per_file(mask):
+            print("%8d  %s  %s  %s" % (rows, _time(first), _time(last), capture))
+    else:
+        for number, code, rows, files in idx.opcodes(mask):
+            print("%-7s %6d %-40s %8d rows %4d captures" % (
+                opcodes.PROTOCOLS[number], code, opcodes.name(number, code) if code >= 0 else '-', rows, files))
+    print("%.1f ms" % (1000 * (time.time() - start)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# one report over several captures: talkers, function mix, writes and traffic rate
+#
+# usage: capture-report.py [options] [capture ...]
+#
+# Summarizes every capture in its own process (pcaptools.summary), then
+# merges the summaries into one report. The default captures are the
+# three parts of Plant1; since they share one timeline, the merged rate
+# shows which protocol a spike belongs to. Summaries are cached by the
+# SHA-256 of the capture's content, in --cache, so only new or changed
+# captures are read again. -o also writes the merged summary as JSON.
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import struct
+import sys
+import time
+
+from pcaptools import pcap, summary
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PLANT1 = [os.path.join(HERE, *parts) for parts in (
+    ('Modbus', 'ModbusTCP', 'Plant1_ModbusTCP.pcap'),
+    ('EthernetIP', 'Plant1_EthernetIP.pcap'),
+    ('S7comm', 'Plant1_S7comm.pcap'),
+)]
+
+
+def digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cached(cache, key):
+    try:
+        with open(os.path.join(cache, key + '.json')) as f:
+            found = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return found if found.get('version') == summary.VERSION else None
+
+
+def store(cache, key, result):
+    os.makedirs(cache, exist_ok=True)
+    tmp = os.path.join(cache, key + '.json.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(result, f)
+    os.replace(tmp, os.path.join(cache, key + '.json'))
+
+
+def failed(path, error):
+    """An empty summary of a capture that could not be read, with its error."""
+    return {'version': summary.VERSION, 'path': path, 'error': str(error) or error.__class__.__name__,
+            'packets': 0, 'bytes': 0, 'first': None, 'last': None, 'protocols': {}, 'hosts': {},
+            'speaks': {}, 'talkers': {}, 'functions': {}, 'writes': {}, 'rate': {}, 'other': {}}
+
+
+def summaries(paths, cache, jobs, log=None):
+    """The summary of every path, in order, from the cache or a pool of jobs processes.
+
+    A capture that cannot be read gets an empty summary with its error,
+    which is not cached.
+    """
+    results = [None] * len(paths)
+    keys = [digest(path) for path in paths]
+    missing = []
+    for k, (path, key) in enumerate(zip(paths, keys)):
+        results[k] = cached(cache, key) if cache else None
+        if results[k] is None:
+            missing.append(k)
+        elif log:
+            log("%s: cached" % path)
+    if missing:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(jobs, len(missing))) as pool:
+            futures = {pool.submit(summary.summarize, paths[k]): k for k in missing}
+            for future in concurrent.futures.as_completed(futures):
+                k = futures[future]
+                try:
+                    results[k] = future.result()
+                except (pcap.CaptureError, ValueError, IndexError, struct.error) as e:
+                    results[k] = failed(paths[k], e)
+                    if log:
+                        log("%s: %s" % (paths[k], results[k]['error']))
+                    continue
+                if cache:
+                    store(cache, keys[k], results[k])
+                if log:
+                    log("%s: %d packets" % (paths[k], results[k]['packets']))
+    for path, result in zip(paths, results):
+        # the cache is by content, the same capture may sit elsewhere
+        result['path'] = path
+    return results
+
+
+def _time(ts):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts))
+
+
+def _top(counts, n):
+    return sorted(counts.items(), key=lambda item: -(item[1][0] if isinstance(item[1], list) else item[1]))[:n]
+
+
+def report(each, merged, bucket, top):
+    print("%d captures, %d packets, %d payload bytes, %s to %s" % (
+        len(each), merged['packets'], merged['bytes'], _time(merged['first'] or 0), _time(merged['last'] or 0)))
+    for s in each:
+        print("  %-40s %7d packets  %s" % (os.path.relpath(s['path'], HERE), s['packets'],
+                                          s.get('error') or
+                                          " ".join("%s %d" % item for item in _top(s['protocols'], 8))))
+
+    print("\nhosts, packets and bytes sent and received")
+    for host, (sent, sent_bytes, received, received_bytes) in _top(merged['hosts'], top):
+        print("  %-16s %7d %9d  %7d %9d  %s" % (host, sent, sent_bytes, received, received_bytes,
+                                              " ".join(merged['speaks'].get(host, ()))))
+
+    print("\ntalkers, packets and bytes")
+    for pair, (packets, size) in _top(merged['talkers'], top):
+        print("  %-33s %7d %9d" % (pair.replace(' ', ' > '), packets, size))
+
+    print("\nfunction mix")
+    for kind, counts in sorted(merged['functions'].items()):
+        for name, count in _top(counts, top):
+            print("  %-7s %-40s %7d" % (kind, name, count))
+
+    print("\nwrites")
+    if not any(merged['writes'].values()):
+        print("  none")
+    for kind, counts in sorted(merged['writes'].items()):
+        for what, count in _top(counts, top):
+            src, dst, name = what.split(' ')
+            print("  %-7s %-16s > %-16s %-28s %6d" % (kind, src, dst, name, count))
+
+    if merged['other']:
+        print("\nunidentified, by port")
+        for port, count in _top(merged['other'], top):
+            print("  %-12s %7d" % (port, count))
+
+    print("\npackets per %g s" % bucket)
+    kinds = sorted(merged['rate'])
+    buckets = {}
+    for kind in kinds:
+        for second, (packets, _) in merged['rate'][kind].items():
+            row = buckets.setdefault(int(int(second) // bucket), {})
+            row[kind] = row.get(kind, 0) + packets
+    if not buckets:
+        return
+    totals = {k: sum(row.values()) for k, row in buckets.items()}
+    mean = sum(totals.values()) / float(len(totals))
+    print("  %-19s %s %7s" % ('', " ".join("%7s" % kind for kind in kinds), 'total'))
+    previous = None
+    for k in sorted(buckets):
+        # captures far apart in time leave long gaps, one line each
+        if previous is not None and k > previous + 1:
+            print("  ... %.0f s idle" % ((k - previous - 1) * bucket))
+        previous = k
+        row = buckets[k]
+        mark = ' spike' if totals[k] > 2 * mean else ''
+        print("  %s %s %7d%s" % (_time(k * bucket), " ".join("%7d" % row.get(kind, 0) for kind in kinds),
+                                 totals[k], mark))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize captures in parallel into one report")
+    parser.add_argument('captures', nargs='*', default=PLANT1, help="captures [default=the Plant1 parts]")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help="captures summarized at once [default=%(default)s]")
+    parser.add_argument('--cache', default=os.path.join(HERE, 'report-cache'),
+                        help="summary cache directory, empty for none [default=Protocols/report-cache]")
+    parser.add_argument('-b', '--bucket', type=float, default=5.0,
+                        help="seconds per traffic rate bucket [default=%(default)s]")
+    parser.add_argument('--top', type=int, default=10, help="rows per table [default=%(default)s]")
+    parser.add_argument('-o', '--output', default=None, help="also write the merged summary as JSON")
+    args = parser.parse_args()
+
+    start = time.time()
+    each = summaries(args.captures, args.cache, args.jobs,
+                     log=lambda text: print(text, file=sys.stderr))
+    merged = summary.merge(each)
+    report(each, merged, args.bucket, args.top)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(merged, f, indent=1)
+    print("%.2f s" % (time.time() - start), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
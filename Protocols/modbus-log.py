@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# writes Zeek's modbus.log for Modbus/TCP captures, without Zeek
+#
+# usage: modbus-log.py [options] [capture ...]
+#
+# Reassembles every connection to --port and writes one row per response,
+# as Zeek's Modbus analyzer logs them: the same #fields, function and
+# exception names, and pdu_type. Exception responses are logged under the
+# function they answer, with the 0x80 bit stripped. uids are derived from
+# the connection rather than random, so they differ from a Zeek run but
+# are the same on every rerun. --requests adds a REQ row per request.
+#
+# --registers adds three columns at the end, address, quantity and
+# values: the registers or coils a request and its response touched,
+# values from the response for reads and from the request for writes.
+# REQ rows carry the request's own address and quantity, and its values
+# when it is a write.
+# Zeek readers ignore columns they do not know, zeek-query.py included.
+
+import argparse
+import os
+import sys
+import time
+
+from pcaptools import modbus, zeek
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PLANT1 = os.path.join(HERE, 'Modbus', 'ModbusTCP', 'Plant1_ModbusTCP.pcap')
+
+FIELDS = ('ts', 'uid', 'id.orig_h', 'id.orig_p', 'id.resp_h', 'id.resp_p',
+          'tid', 'unit', 'func', 'pdu_type', 'exception')
+TYPES = ('time', 'string', 'addr', 'port', 'addr', 'port', 'count', 'count', 'string', 'string', 'string')
+REGISTER_FIELDS = ('address', 'quantity', 'values')
+REGISTER_TYPES = ('count', 'count', 'vector[count]')
+
+# requests remembered per connection for --registers, oldest dropped first
+PENDING = 256
+
+
+def _registers(touched, unset):
+    if touched is None:
+        return unset
+    address, quantity, values = touched
+    if values is None:
+        return '\t%d\t%d\t-' % (address, quantity)
+    return '\t%d\t%d\t%s' % (address, quantity, ','.join(map(str, values)) if values else '(empty)')
+
+
+def extract(paths, log, port=modbus.PORT, requests=False, registers=False):
+    """Write the rows of every capture to a zeek.Writer; the number of PDUs seen."""
+    names = {code: modbus.function_name(code) for code in range(256)}
+    exceptions = {code: modbus.EXCEPTIONS.get(code, 'unknown-%d' % code) for code in range(256)}
+    unset = '\t-\t-\t-' if registers else ''
+    seen = 0
+    for path in paths:
+        for ts, connection, request, tid, unit, pdu in modbus.messages(path, port):
+            seen += 1
+            if not len(pdu):
+                continue
+            fields = connection.fields
+            if fields is None:
+                connection.uid = zeek.uid(connection.orig_h, connection.orig_p,
+                                          connection.resp_h, connection.resp_p, connection.start)
+                connection.pending = {}
+                fields = connection.fields = '\t%s\t%s\t%d\t%s\t%d\t' % (
+                    connection.uid, connection.orig_h, connection.orig_p, connection.resp_h, connection.resp_p)
+            function = pdu[0]
+            if request:
+                extra = unset
+                if registers:
+                    pending = connection.pending
+                    pending[tid] = bytes(pdu)
+                    if len(pending) > PENDING:
+                        del pending[next(iter(pending))]
+                    if requests:
+                        extra = _registers(modbus.registers(pdu), unset)
+                if requests:
+                    log.line('%.6f%s%d\t%d\t%s\tREQ\t-%s\n' % (ts, fields, tid, unit, names[function], extra))
+                continue
+            exception = '-'
+            if function & 0x80:
+                exception = exceptions[pdu[1]] if len(pdu) > 1 else 'unknown-0'
+                function &= 0x7f
+            extra = unset
+            if registers:
+                asked = connection.pending.pop(tid, None)
+                if asked is not None:
+                    extra = _registers(modbus.registers(asked, pdu), unset)
+            log.line('%.6f%s%d\t%d\t%s\tRESP\t%s%s\n' % (ts, fields, tid, unit, names[function], exception, extra))
+    return seen
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a Zeek modbus.log from Modbus/TCP captures")
+    parser.add_argument('captures', nargs='*', default=[PLANT1],
+                        help="pcap or pcapng files [default=Plant1_ModbusTCP.pcap]")
+    parser.add_argument('-o', '--output', default='modbus.log', help="log file, - for stdout [default=%(default)s]")
+    parser.add_argument('--port', type=int, default=modbus.PORT,
+                        help="Modbus server port in the captures [default=%(default)s]")
+    parser.add_argument('--requests', action='store_true', help="log requests too, as REQ rows")
+    parser.add_argument('--registers', action='store_true',
+                        help="add address, quantity and values columns")
+    args = parser.parse_args()
+
+    fields, types = FIELDS, TYPES
+    if args.registers:
+        fields, types = fields + REGISTER_FIELDS, types + REGISTER_TYPES
+    f = sys.stdout if args.output == '-' else open(args.output, 'w', buffering=1 << 20)
+    start = time.time()
+    try:
+        log = zeek.Writer(f, 'modbus', fields, types)
+        seen = extract(args.captures, log, args.port, args.requests, args.registers)
+        log.close()
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    elapsed = time.time() - start
+    print("%d PDUs, %d rows in %.2f s, %.0f PDUs/s" % (seen, log.rows, elapsed, seen / max(elapsed, 1e-9)),
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
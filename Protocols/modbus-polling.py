@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# request/response latency and poll cycle jitter of Modbus masters and slaves
+#
+# usage: modbus-polling.py [options] [capture or modbus.log ...]
+#
+# Pairs every request with its response by connection and transaction id
+# in one pass, and prints per slave latency, per master poll period, the
+# items polled with the most jitter, and the outliers. Captures are
+# reassembled directly; a Zeek modbus.log works only if it has REQ rows,
+# which Zeek's own does not, so write one with modbus-log.py --requests,
+# with --registers to tell items apart by address. -d also writes every
+# table as a Zeek log, for zeek-query.py:
+#
+#   modbus-polling.py -d polling Modbus/ModbusTCP/Plant1_ModbusTCP.pcap
+#   zeek-query.py polling/modbus_items.log count slave
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from pcaptools import modbus, polling, zeek
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PLANT1 = os.path.join(HERE, 'Modbus', 'ModbusTCP', 'Plant1_ModbusTCP.pcap')
+
+_CODES = {name: code for code, name in modbus.FUNCTIONS.items()}
+
+TABLES = {
+    'modbus_latency': (
+        ('slave', 'unit', 'n', 'min', 'p50', 'p90', 'p99', 'max', 'mean', 'exceptions'),
+        ('addr', 'count', 'count', 'interval', 'interval', 'interval', 'interval', 'interval', 'interval',
+         'count')),
+    'modbus_periods': (
+        ('master', 'items', 'n', 'min', 'p50', 'p99', 'max', 'mean', 'std'),
+        ('addr', 'count', 'count', 'interval', 'interval', 'interval', 'interval', 'interval', 'interval')),
+    'modbus_items': (
+        ('master', 'slave', 'unit', 'func', 'request', 'n', 'mean', 'std', 'jitter', 'min', 'max'),
+        ('addr', 'addr', 'count', 'string', 'string', 'count', 'interval', 'interval', 'double', 'interval',
+         'interval')),
+    'modbus_outliers': (
+        ('ts', 'kind', 'master', 'slave', 'unit', 'func', 'tid', 'value', 'ratio'),
+        ('time', 'string', 'addr', 'addr', 'count', 'string', 'count', 'interval', 'double')),
+}
+
+
+def feed_capture(path, analysis, port):
+    for ts, connection, request, tid, unit, pdu in modbus.messages(path, port):
+        if not len(pdu):
+            continue
+        analysis.feed(ts, connection, connection.orig_h, connection.resp_h, unit, request, tid, pdu[0],
+                      bytes(pdu[1:5]) if request else b'')
+
+
+def feed_log(path, analysis):
+    log = zeek.load(path)
+    if 'REQ' not in log.categories.get('pdu_type', ()):
+        raise ValueError("%s has no REQ rows; write one with modbus-log.py --requests" % path)
+    columns = [log[name] for name in ('ts', 'uid', 'id.orig_h', 'id.resp_h', 'unit', 'tid', 'func',
+                                      'pdu_type', 'exception')]
+    if 'address' in log.columns:
+        items = np.char.add(np.char.add(log['address'].astype(str), ':'), log['quantity'].astype(str))
+        items[log['address'] < 0] = ''
+    else:
+        items = np.full(len(log), '')
+    for ts, uid, master, slave, unit, tid, func, kind, exception, item in zip(*columns, items):
+        function = _CODES.get(func, 0)
+        if exception != '-':
+            function |= 0x80
+        request = kind == 'REQ'
+        analysis.feed(float(ts), uid, master, slave, int(unit), request, int(tid), function,
+                      item if request else '')
+
+
+def tables(analysis):
+    """The rows of every table, by name."""
+    latency = []
+    for (slave, unit), h in sorted(analysis.latency.items()):
+        latency.append((slave, unit, h.n, h.low, h.percentile(50), h.percentile(90), h.percentile(99), h.high,
+                        h.mean, analysis.exceptions[(slave, unit)]))
+
+    items_per_master = {}
+    items = []
+    for (master, slave, unit, function, body), item in analysis.items.items():
+        items_per_master[master] = items_per_master.get(master, 0) + 1
+        h = item.periods
+        if not h.n:
+            continue
+        request = body.hex() if isinstance(body, bytes) else body
+        items.append((master, slave, unit, modbus.function_name(function), request or '-', h.n, h.mean, h.std,
+                      h.std / h.mean if h.mean else 0.0, h.low, h.high))
+    items.sort(key=lambda row: -row[8])
+
+    periods = []
+    for master, h in sorted(analysis.periods.items()):
+        periods.append((master, items_per_master.get(master, 0), h.n, h.low, h.percentile(50), h.percentile(99),
+                        h.high, h.mean, h.std))
+
+    outliers = []
+    for ratio, kind, ts, master, slave, unit, function, tid, value in analysis.worst():
+        outliers.append((ts, kind, master, slave, unit, modbus.function_name(function), tid, value, ratio))
+    return {'modbus_latency': latency, 'modbus_periods': periods, 'modbus_items': items,
+            'modbus_outliers': outliers}
+
+
+def _ms(seconds):
+    return '%9.2f' % (1000 * seconds)
+
+
+def report(analysis, rows, items=10):
+    pending = analysis.pending
+    print("%d transactions matched, %d responses without a request, %d requests dropped, "
+          "%d outstanding at most" % (analysis.matched, pending.unmatched, pending.evicted, pending.peak))
+
+    print("\nlatency per slave, ms")
+    print("%-16s %4s %7s %9s %9s %9s %9s %9s %5s" % ('slave', 'unit', 'n', 'min', 'p50', 'p90', 'p99', 'max', 'exc'))
+    for slave, unit, n, low, p50, p90, p99, high, _, exceptions in rows['modbus_latency']:
+        print("%-16s %4d %7d %s %s %s %s %s %5d" % (slave, unit, n, _ms(low), _ms(p50), _ms(p90), _ms(p99),
+                                                   _ms(high), exceptions))
+
+    print("\npoll period per master, ms")
+    print("%-16s %5s %7s %9s %9s %9s %9s %9s" % ('master', 'items', 'n', 'min', 'p50', 'p99', 'max', 'std'))
+    for master, count, n, low, p50, p99, high, _, std in rows['modbus_periods']:
+        print("%-16s %5d %7d %s %s %s %s %s" % (master, count, n, _ms(low), _ms(p50), _ms(p99), _ms(high),
+                                                _ms(std)))
+
+    print("\nitems with the most jitter, ms")
+    print("%-16s %-16s %-24s %-10s %6s %9s %9s %7s" % ('master', 'slave', 'function', 'request', 'n', 'mean', 'std',
+                                                       'jitter'))
+    for master, slave, _, function, request, n, mean, std, jitter, _, _ in rows['modbus_items'][:items]:
+        print("%-16s %-16s %-24s %-10s %6d %s %s %6.1f%%" % (master, slave, function, request, n, _ms(mean),
+                                                             _ms(std), 100 * jitter))
+
+    print("\noutliers, times the mean of their slave or item")
+    for ts, kind, master, slave, _, function, tid, value, ratio in rows['modbus_outliers']:
+        print("%s.%06d %-8s %-16s %-16s %-24s tid %5d %s ms %6.1fx" % (
+            time.strftime('%H:%M:%S', time.gmtime(ts)), int(ts % 1 * 1e6), kind, master, slave, function, tid,
+            _ms(value), ratio))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Modbus request latency and poll cycle statistics")
+    parser.add_argument('inputs', nargs='*', default=[PLANT1],
+                        help="captures, or modbus.logs with REQ rows [default=Plant1_ModbusTCP.pcap]")
+    parser.add_argument('--port', type=int, default=modbus.PORT,
+                        help="Modbus server port in the captures [default=%(default)s]")
+    parser.add_argument('--pending', type=int, default=polling.PENDING,
+                        help="requests kept waiting for a response at most [default=%(default)s]")
+    parser.add_argument('--top', type=int, default=polling.TOP, help="outliers kept [default=%(default)s]")
+    parser.add_argument('--items', type=int, default=10, help="items printed [default=%(default)s]")
+    parser.add_argument('-d', '--directory', default=None,
+                        help="also write the tables as Zeek logs into this directory")
+    args = parser.parse_args()
+
+    analysis = polling.Polling(args.pending, args.top)
+    start = time.time()
+    for path in args.inputs:
+        try:
+            if path.endswith('.log'):
+                feed_log(path, analysis)
+            else:
+                feed_capture(path, analysis, args.port)
+        except ValueError as e:
+            parser.error(str(e))
+    rows = tables(analysis)
+    report(analysis, rows, args.items)
+
+    if args.directory:
+        os.makedirs(args.directory, exist_ok=True)
+        for name, (fields, types) in TABLES.items():
+            with open(os.path.join(args.directory, name + '.log'), 'w') as f:
+                log = zeek.Writer(f, name, fields, types)
+                for row in rows[name]:
+                    log.write(row)
+                log.close()
+    print("\n%.2f s" % (time.time() - start), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
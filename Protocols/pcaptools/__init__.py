@@ -0,0 +1 @@
+"""Streaming capture readers and protocol decoders shared by the Protocols/ tools."""
@@ -0,0 +1,212 @@
+"""A persistent packet index over a tree of captures.
+
+Every TCP and UDP packet of every capture under a root becomes one row
+per opcode found in it (see opcodes.classify), or one row with opcode -1
+if none is:
+
+    ts, src, dst, proto, sport, dport, protocol, opcode
+
+src and dst are codes into a table of address strings shared by all
+captures, and file, derived from the row ranges of the file table, says
+which capture a row came from. The index is a single .npz file, written
+without pickles. update() stats every capture and rescans only those
+whose mtime or size changed since the last run, so keeping the index
+current costs one stat per capture when nothing did. Captures are read
+record by record from a memory map; the index, not the captures, is
+what has to fit in memory.
+"""
+
+import array
+import os
+import struct
+
+import numpy as np
+
+from pcaptools import opcodes, pcap
+
+EXTENSIONS = ('.pcap', '.pcapng', '.cap')
+
+# an index of another version is rebuilt from scratch
+VERSION = 2
+
+COLUMNS = (
+    ('ts', 'd', np.float64),
+    ('src', 'i', np.int32),
+    ('dst', 'i', np.int32),
+    ('proto', 'B', np.uint8),
+    ('sport', 'H', np.uint16),
+    ('dport', 'H', np.uint16),
+    ('protocol', 'b', np.int8),
+    ('opcode', 'i', np.int32),
+)
+
+
+def captures(root):
+    """Paths of the captures under root, relative to it, sorted."""
+    found = []
+    for directory, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in files:
+            if name.lower().endswith(EXTENSIONS):
+                found.append(os.path.relpath(os.path.join(directory, name), root))
+    return sorted(found)
+
+
+def scan(path, addresses):
+    """The index columns of one capture; new addresses are added to addresses, a {text: code} dict."""
+    columns = {name: array.array(typecode) for name, typecode, _ in COLUMNS}
+    ts_, src_, dst_ = columns['ts'].append, columns['src'].append, columns['dst'].append
+    proto_, sport_, dport_ = columns['proto'].append, columns['sport'].append, columns['dport'].append
+    protocol_, opcode_ = columns['protocol'].append, columns['opcode'].append
+    local = {}
+    for ts, packet in pcap.packets(path):
+        ends = []
+        for packed in (packet.src, packet.dst):
+            number = local.get(packed)
+            if number is None:
+                number = local[packed] = addresses.setdefault(pcap.addr(packed), len(addresses))
+            ends.append(number)
+        protocol, codes = opcodes.classify(packet)
+        for opcode in codes or (-1,):
+            ts_(ts)
+            src_(ends[0])
+            dst_(ends[1])
+            proto_(packet.proto)
+            sport_(packet.sport)
+            dport_(packet.dport)
+            protocol_(protocol)
+            opcode_(opcode)
+    return {name: np.frombuffer(columns[name], dtype=dtype) if len(columns[name])
+            else np.zeros(0, dtype=dtype) for name, _, dtype in COLUMNS}
+
+
+class Index(object):
+
+    def __init__(self, files=None, columns=None, addresses=None):
+        # files: [(path, mtime, size, error, rows)], in row order
+        self.files = files or []
+        self.columns = columns or {name: np.zeros(0, dtype=dtype) for name, _, dtype in COLUMNS}
+        self.addresses = addresses or []
+        self._file = None
+
+    def __len__(self):
+        return len(self.columns['ts'])
+
+    @property
+    def file(self):
+        """The capture number of every row."""
+        if self._file is None:
+            self._file = np.repeat(np.arange(len(self.files), dtype=np.int32),
+                                   [entry[4] for entry in self.files])
+        return self._file
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return cls()
+        with np.load(path, allow_pickle=False) as npz:
+            if 'version' not in npz.files or int(npz['version']) != VERSION:
+                return cls()
+            files = list(zip(npz['paths'].tolist(), npz['mtimes'].tolist(), npz['sizes'].tolist(),
+                             npz['errors'].tolist(), npz['rows'].tolist()))
+            columns = {name: npz[name] for name, _, _ in COLUMNS}
+            addresses = npz['addresses'].tolist()
+        return cls(files, columns, addresses)
+
+    def save(self, path):
+        paths, mtimes, sizes, errors, rows = zip(*self.files) if self.files else ((),) * 5
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, version=np.array(VERSION),
+                 paths=np.array(paths, dtype=str), mtimes=np.array(mtimes, dtype=np.float64),
+                 sizes=np.array(sizes, dtype=np.int64), errors=np.array(errors, dtype=str),
+                 rows=np.array(rows, dtype=np.int64), addresses=np.array(self.addresses, dtype=str),
+                 **self.columns)
+        os.replace(tmp, path)
+
+    def update(self, root, log=None):
+        """Bring the index in line with the captures under root; (rescanned, removed) paths."""
+        old = {}
+        offset = 0
+        for path, mtime, size, error, rows in self.files:
+            old[path] = (mtime, size, error, rows, offset)
+            offset += rows
+        addresses = {text: number for number, text in enumerate(self.addresses)}
+
+        files, parts, rescanned = [], [], []
+        for path in captures(root):
+            stat = os.stat(os.path.join(root, path))
+            entry = old.pop(path, None)
+            if entry is not None and entry[:2] == (stat.st_mtime, stat.st_size):
+                mtime, size, error, rows, offset = entry
+                parts.append({name: column[offset:offset + rows] for name, column in self.columns.items()})
+                files.append((path, mtime, size, error, rows))
+                continue
+            if log:
+                log(path)
+            error = ''
+            try:
+                columns = scan(os.path.join(root, path), addresses)
+            except (pcap.CaptureError, ValueError, IndexError, struct.error) as e:
+                columns = {name: np.zeros(0, dtype=dtype) for name, _, dtype in COLUMNS}
+                error = str(e) or e.__class__.__name__
+            parts.append(columns)
+            files.append((path, stat.st_mtime, stat.st_size, error, len(columns['ts'])))
+            rescanned.append(path)
+
+        if rescanned or old:
+            self.files = files
+            self.columns = {name: np.concatenate([part[name] for part in parts]) if parts
+                            else np.zeros(0, dtype=dtype) for name, _, dtype in COLUMNS}
+            self.addresses = sorted(addresses, key=addresses.get)
+            self._file = None
+        return rescanned, sorted(old)
+
+    def address(self, text):
+        """The code of an address, or -1 if no capture has it."""
+        try:
+            return self.addresses.index(text)
+        except ValueError:
+            return -1
+
+    def select(self, protocol=None, opcode=None, host=None, port=None):
+        """Mask of the rows matching every condition given; protocol and opcode are numbers."""
+        mask = np.ones(len(self), dtype=bool)
+        if protocol is not None:
+            mask &= self.columns['protocol'] == protocol
+        if opcode is not None:
+            mask &= self.columns['opcode'] == opcode
+        if host is not None:
+            number = self.address(host)
+            mask &= (self.columns['src'] == number) | (self.columns['dst'] == number)
+        if port is not None:
+            mask &= (self.columns['sport'] == port) | (self.columns['dport'] == port)
+        return mask
+
+    def per_file(self, mask):
+        """[(path, rows, first ts, last ts)] of the captures with rows in mask, most rows first."""
+        counts = np.bincount(self.file[mask], minlength=len(self.files))
+        ts = self.columns['ts']
+        found = []
+        for k in np.flatnonzero(counts)[np.argsort(-counts[counts > 0], kind='stable')]:
+            rows = mask & (self.file == k)
+            found.append((self.files[k][0], int(counts[k]), float(ts[rows].min()), float(ts[rows].max())))
+        return found
+
+    def opcodes(self, mask=None):
+        """[(protocol, opcode, rows, captures)] over the rows in mask, by protocol then most rows."""
+        columns = self.columns
+        if mask is None:
+            mask = columns['protocol'] >= 0
+        else:
+            mask = mask & (columns['protocol'] >= 0)
+        keys = np.stack([columns['protocol'][mask].astype(np.int64), columns['opcode'][mask].astype(np.int64),
+                         self.file[mask].astype(np.int64)], axis=1)
+        if not len(keys):
+            return []
+        keys, counts = np.unique(keys, axis=0, return_counts=True)
+        pairs, inverse = np.unique(keys[:, :2], axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        rows = np.bincount(inverse, weights=counts, minlength=len(pairs)).astype(np.int64)
+        files = np.bincount(inverse, minlength=len(pairs))
+        order = np.lexsort((-rows, pairs[:, 0]))
+        return [(int(pairs[k, 0]), int(pairs[k, 1]), int(rows[k]), int(files[k])) for k in order]
@@ -0,0 +1,227 @@
+"""Modbus/TCP framing and PDU classification.
+
+Names follow Zeek's Modbus analyzer, so output lines up with modbus.log.
+messages() turns a capture into the Modbus PDUs of every connection to
+the server port, in capture order.
+"""
+
+import struct
+
+from pcaptools import pcap, tcp
+
+PORT = 502
+
+FUNCTIONS = {
+    0x01: 'READ_COILS',
+    0x02: 'READ_DISCRETE_INPUTS',
+    0x03: 'READ_HOLDING_REGISTERS',
+    0x04: 'READ_INPUT_REGISTERS',
+    0x05: 'WRITE_SINGLE_COIL',
+    0x06: 'WRITE_SINGLE_REGISTER',
+    0x07: 'READ_EXCEPTION_STATUS',
+    0x08: 'DIAGNOSTICS',
+    0x0b: 'GET_COMM_EVENT_COUNTER',
+    0x0c: 'GET_COMM_EVENT_LOG',
+    0x0f: 'WRITE_MULTIPLE_COILS',
+    0x10: 'WRITE_MULTIPLE_REGISTERS',
+    0x11: 'REPORT_SLAVE_ID',
+    0x14: 'READ_FILE_RECORD',
+    0x15: 'WRITE_FILE_RECORD',
+    0x16: 'MASK_WRITE_REGISTER',
+    0x17: 'READ_WRITE_MULTIPLE_REGISTERS',
+    0x18: 'READ_FIFO_QUEUE',
+    0x2b: 'ENCAP_INTERFACE_TRANSPORT',
+}
+
+EXCEPTIONS = {
+    0x01: 'ILLEGAL_FUNCTION',
+    0x02: 'ILLEGAL_DATA_ADDRESS',
+    0x03: 'ILLEGAL_DATA_VALUE',
+    0x04: 'SLAVE_DEVICE_FAILURE',
+    0x05: 'ACKNOWLEDGE',
+    0x06: 'SLAVE_DEVICE_BUSY',
+    0x08: 'MEMORY_PARITY_ERROR',
+    0x0a: 'GATEWAY_PATH_UNAVAILABLE',
+    0x0b: 'GATEWAY_TARGET_DEVICE_FAILED_TO_RESPOND',
+}
+
+READS = (0x01, 0x02, 0x03, 0x04)
+WRITES = (0x05, 0x06, 0x0f, 0x10, 0x15, 0x16, 0x17)
+
+MBAP = struct.Struct('>HHHB')
+_ADDRESS_COUNT = struct.Struct('>HH')
+
+
+def function_name(code):
+    return FUNCTIONS.get(code, 'unknown-%d' % code)
+
+
+class Framer(object):
+    """Cuts one direction of a reassembled stream into (tid, unit, pdu) frames.
+
+    A partial frame is kept until the rest arrives. Bytes that cannot be
+    an MBAP header, from a capture starting mid frame or a stream that is
+    not Modbus, are dropped up to the end of the buffer they came in.
+    """
+
+    __slots__ = ('buffer',)
+
+    def __init__(self):
+        self.buffer = b''
+
+    def feed(self, data):
+        if self.buffer:
+            data = self.buffer + bytes(data)
+            self.buffer = b''
+        frames = []
+        offset, end = 0, len(data)
+        while offset + 7 <= end:
+            tid, protocol, length, unit = MBAP.unpack_from(data, offset)
+            if protocol != 0 or not 2 <= length <= 254:
+                return frames
+            if offset + 6 + length > end:
+                break
+            frames.append((tid, unit, data[offset + 7:offset + 6 + length]))
+            offset += 6 + length
+        if offset < end:
+            self.buffer = bytes(data[offset:])
+        return frames
+
+
+def structure(pdu, request=True):
+    """A coarse shape of a PDU, without addresses and values.
+
+    Reads keep their quantity, multiple writes their quantity and byte
+    count; anything else is described by its length alone. Frames of one
+    function and shape exercise the same parser paths of a device.
+    """
+    if not len(pdu):
+        return ''
+    function = pdu[0]
+    if function & 0x80:
+        return 'exception'
+    body = pdu[1:]
+    if request:
+        if function in READS and len(body) == 4:
+            return 'read:%d' % _ADDRESS_COUNT.unpack_from(body)[1]
+        if function in (0x05, 0x06) and len(body) == 4:
+            return 'write1'
+        if function in (0x0f, 0x10) and len(body) >= 5:
+            return 'write:%d:%d' % (_ADDRESS_COUNT.unpack_from(body)[1], body[4])
+    elif function in READS and len(body):
+        return 'bytes:%d' % body[0]
+    elif function in (0x05, 0x06, 0x0f, 0x10) and len(body) == 4:
+        return 'echo'
+    return 'raw'
+
+
+_REGISTER = struct.Struct('>H')
+
+
+def _bits(data, count):
+    return [(data[k >> 3] >> (k & 7)) & 1 for k in range(min(count, 8 * len(data)))]
+
+
+def _words(data, count):
+    count = min(count, len(data) // 2)
+    return list(struct.unpack_from('>%dH' % count, data)) if count else []
+
+
+def registers(request, response=None):
+    """(address, quantity, values) a request and its response touched, or None.
+
+    Reads take the values from the response, writes from the request;
+    without a response, a read's values are None. Only the bit and
+    register functions 1 to 6, 15 and 16 are understood; an exception
+    response, or a PDU too short for its function, gives None.
+    """
+    if not len(request) or response is not None and (not len(response) or response[0] & 0x80):
+        return None
+    function = request[0]
+    body = request[1:]
+    if len(body) < 4:
+        return None
+    address, quantity = _ADDRESS_COUNT.unpack_from(body)
+    if function in (0x01, 0x02):
+        return address, quantity, None if response is None else _bits(response[2:], quantity)
+    if function in (0x03, 0x04):
+        return address, quantity, None if response is None else _words(response[2:], quantity)
+    if function == 0x05:
+        return address, 1, [1 if quantity == 0xff00 else 0]
+    if function == 0x06:
+        return address, 1, [quantity]
+    if function == 0x0f and len(body) >= 5:
+        return address, quantity, _bits(body[5:], quantity)
+    if function == 0x10 and len(body) >= 5:
+        return address, quantity, _words(body[5:], quantity)
+    return None
+
+
+class Connection(object):
+    """A Modbus/TCP connection; orig is the client, resp the server."""
+
+    __slots__ = ('orig_h', 'orig_p', 'resp_h', 'resp_p', 'start', 'uid', 'pending', 'fields',
+                 '_streams', '_framers', '_since', '_fins')
+
+    def __init__(self, orig_h, orig_p, resp_h, resp_p, start):
+        self.orig_h = orig_h
+        self.orig_p = orig_p
+        self.resp_h = resp_h
+        self.resp_p = resp_p
+        self.start = start
+        # free for callers: a Zeek uid, requests waiting for a response,
+        # the connection's part of a log line
+        self.uid = None
+        self.pending = None
+        self.fields = None
+        self._streams = (tcp.Stream(), tcp.Stream())
+        self._framers = (Framer(), Framer())
+        self._since = [start, start]
+        self._fins = 0
+
+
+def messages(path, port=PORT):
+    """Yield (ts, connection, is_request, tid, unit, pdu) for every Modbus PDU in a capture.
+
+    Connections are told apart by their addresses and ports and forgotten
+    after a RST or a FIN each way, so a reused port starts a new one. A
+    PDU is stamped with the time of the segment it starts in. pdu
+    is a memoryview into the capture or a bytes copy when it was
+    reassembled; copy it to keep it past the next message.
+    """
+    connections = {}
+    for ts, packet in pcap.packets(path):
+        if packet.proto != pcap.TCP:
+            continue
+        if packet.dport == port:
+            key = (packet.src, packet.sport, packet.dst, packet.dport)
+            request = True
+        elif packet.sport == port:
+            key = (packet.dst, packet.dport, packet.src, packet.sport)
+            request = False
+        else:
+            continue
+        connection = connections.get(key)
+        if connection is None:
+            connection = connections[key] = Connection(pcap.addr(key[0]), key[1], pcap.addr(key[2]),
+                                                       key[3], ts)
+        side = 0 if request else 1
+        flags = packet.flags
+        data = connection._streams[side].feed(packet.seq, flags, packet.payload)
+        if data:
+            framer = connection._framers[side]
+            for buf in data:
+                # a frame that began in an earlier segment is stamped with
+                # that segment's time, as Zeek does
+                since = connection._since[side] if framer.buffer else ts
+                for tid, unit, pdu in framer.feed(buf):
+                    yield since, connection, request, tid, unit, pdu
+                    since = ts
+                if framer.buffer:
+                    connection._since[side] = since
+        if flags & pcap.RST:
+            del connections[key]
+        elif flags & pcap.FIN:
+            connection._fins |= 1 << side
+            if connection._fins == 3:
+                del connections[key]
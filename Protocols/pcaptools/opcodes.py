@@ -0,0 +1,436 @@
+"""Protocol opcodes straight from packet payloads, without a dissector.
+
+    protocol, codes = classify(packet)
+
+picks the protocol by well known port and reads the operation of every
+PDU that starts in the payload: the Modbus function code, the S7comm
+function, the DNP3 application function code, the BACnet service or
+the EtherNet/IP encapsulation command. Only the headers in front of the
+opcode are walked, so a PDU split across segments is seen in the
+segment it starts in and a payload that does not fit the protocol gives
+no codes.
+
+Codes are small integers, one numbering per protocol; name() and code()
+convert. Modbus exception responses keep the 0x80 bit. BACnet codes are
+the APDU type times 256 plus the service choice, since confirmed and
+unconfirmed services share choice numbers; aborts and rejects, which
+carry no service, use choice 255.
+
+TCP/102 is ISO-TSAP, which carries IEC 61850 MMS as well as S7comm, so
+a packet there is s7comm only when it holds an S7 header and iso-tsap,
+with no codes, otherwise.
+"""
+
+import struct
+
+from pcaptools import modbus
+from pcaptools.pcap import TCP, UDP
+
+PROTOCOLS = ('modbus', 's7comm', 'dnp3', 'bacnet', 'enip', 'iso-tsap')
+MODBUS, S7COMM, DNP3, BACNET, ENIP, ISO_TSAP = range(len(PROTOCOLS))
+
+PORTS = {
+    (TCP, 502): MODBUS,
+    (TCP, 102): ISO_TSAP,
+    (TCP, 20000): DNP3,
+    (UDP, 20000): DNP3,
+    (UDP, 47808): BACNET,
+    (TCP, 44818): ENIP,
+    (UDP, 44818): ENIP,
+}
+
+S7_FUNCTIONS = {
+    0x00: 'CPU_SERVICES',
+    0x04: 'READ_VAR',
+    0x05: 'WRITE_VAR',
+    0x1a: 'REQUEST_DOWNLOAD',
+    0x1b: 'DOWNLOAD_BLOCK',
+    0x1c: 'DOWNLOAD_ENDED',
+    0x1d: 'START_UPLOAD',
+    0x1e: 'UPLOAD',
+    0x1f: 'END_UPLOAD',
+    0x28: 'PI_SERVICE',
+    0x29: 'PLC_STOP',
+    0xf0: 'SETUP_COMMUNICATION',
+}
+
+DNP3_FUNCTIONS = {
+    0: 'CONFIRM',
+    1: 'READ',
+    2: 'WRITE',
+    3: 'SELECT',
+    4: 'OPERATE',
+    5: 'DIRECT_OPERATE',
+    6: 'DIRECT_OPERATE_NR',
+    7: 'IMMED_FREEZE',
+    8: 'IMMED_FREEZE_NR',
+    9: 'FREEZE_CLEAR',
+    10: 'FREEZE_CLEAR_NR',
+    13: 'COLD_RESTART',
+    14: 'WARM_RESTART',
+    18: 'START_APPL',
+    19: 'STOP_APPL',
+    20: 'ENABLE_UNSOLICITED',
+    21: 'DISABLE_UNSOLICITED',
+    22: 'ASSIGN_CLASS',
+    23: 'DELAY_MEASURE',
+    24: 'RECORD_CURRENT_TIME',
+    25: 'OPEN_FILE',
+    26: 'CLOSE_FILE',
+    27: 'DELETE_FILE',
+    129: 'RESPONSE',
+    130: 'UNSOLICITED_RESPONSE',
+    131: 'AUTHENTICATE_RESP',
+}
+
+_BACNET_CONFIRMED = {
+    0: 'acknowledgeAlarm',
+    1: 'confirmedCOVNotification',
+    2: 'confirmedEventNotification',
+    3: 'getAlarmSummary',
+    4: 'getEnrollmentSummary',
+    5: 'subscribeCOV',
+    6: 'atomicReadFile',
+    7: 'atomicWriteFile',
+    8: 'addListElement',
+    9: 'removeListElement',
+    10: 'createObject',
+    11: 'deleteObject',
+    12: 'readProperty',
+    14: 'readPropertyMultiple',
+    15: 'writeProperty',
+    16: 'writePropertyMultiple',
+    17: 'deviceCommunicationControl',
+    18: 'confirmedPrivateTransfer',
+    19: 'confirmedTextMessage',
+    20: 'reinitializeDevice',
+    26: 'readRange',
+    28: 'subscribeCOVProperty',
+    29: 'getEventInformation',
+}
+
+_BACNET_UNCONFIRMED = {
+    0: 'i-Am',
+    1: 'i-Have',
+    2: 'unconfirmedCOVNotification',
+    3: 'unconfirmedEventNotification',
+    4: 'unconfirmedPrivateTransfer',
+    5: 'unconfirmedTextMessage',
+    6: 'timeSynchronization',
+    7: 'who-Has',
+    8: 'who-Is',
+    9: 'utcTimeSynchronization',
+    10: 'writeGroup',
+}
+
+_BACNET_TYPES = ('', '', 'simpleACK', 'complexACK', 'segmentACK', 'error', 'reject', 'abort')
+
+BACNET_SERVICES = {}
+for _choice, _name in _BACNET_CONFIRMED.items():
+    BACNET_SERVICES[_choice] = _name
+    for _type in (2, 3, 5):
+        BACNET_SERVICES[_type << 8 | _choice] = '%s-%s' % (_name, _BACNET_TYPES[_type])
+for _choice, _name in _BACNET_UNCONFIRMED.items():
+    BACNET_SERVICES[1 << 8 | _choice] = _name
+for _type in (4, 6, 7):
+    BACNET_SERVICES[_type << 8 | 0xff] = _BACNET_TYPES[_type]
+
+ENIP_COMMANDS = {
+    0x0000: 'NOP',
+    0x0004: 'LIST_SERVICES',
+    0x0063: 'LIST_IDENTITY',
+    0x0064: 'LIST_INTERFACES',
+    0x0065: 'REGISTER_SESSION',
+    0x0066: 'UNREGISTER_SESSION',
+    0x006f: 'SEND_RR_DATA',
+    0x0070: 'SEND_UNIT_DATA',
+    0x0072: 'INDICATE_STATUS',
+    0x0073: 'CANCEL',
+}
+
+CIP_SERVICES = {
+    0x01: 'GET_ATTRIBUTES_ALL',
+    0x02: 'SET_ATTRIBUTES_ALL',
+    0x03: 'GET_ATTRIBUTE_LIST',
+    0x04: 'SET_ATTRIBUTE_LIST',
+    0x05: 'RESET',
+    0x06: 'START',
+    0x07: 'STOP',
+    0x08: 'CREATE',
+    0x09: 'DELETE',
+    0x0a: 'MULTIPLE_SERVICE_PACKET',
+    0x0e: 'GET_ATTRIBUTE_SINGLE',
+    0x10: 'SET_ATTRIBUTE_SINGLE',
+    0x4b: 'EXECUTE_PCCC',
+    0x4c: 'READ_TAG',
+    0x4d: 'WRITE_TAG',
+    0x4e: 'READ_MODIFY_WRITE_TAG',
+    0x52: 'READ_TAG_FRAGMENTED',
+    0x53: 'WRITE_TAG_FRAGMENTED',
+    0x54: 'FORWARD_OPEN',
+    0x5b: 'LARGE_FORWARD_OPEN',
+}
+for _code, _name in list(CIP_SERVICES.items()):
+    CIP_SERVICES[_code | 0x80] = _name + '_REPLY'
+# the same service codes sent to the connection manager
+CIP_SERVICES[0x14e] = 'FORWARD_CLOSE'
+CIP_SERVICES[0x152] = 'UNCONNECTED_SEND'
+
+CIP_WRITES = (0x02, 0x04, 0x10, 0x4d, 0x4e, 0x53)
+
+MODBUS_FUNCTIONS = dict(modbus.FUNCTIONS)
+for _code, _name in modbus.FUNCTIONS.items():
+    MODBUS_FUNCTIONS[_code | 0x80] = _name + '_EXCEPTION'
+
+NAMES = {
+    MODBUS: MODBUS_FUNCTIONS,
+    S7COMM: S7_FUNCTIONS,
+    DNP3: DNP3_FUNCTIONS,
+    BACNET: BACNET_SERVICES,
+    ENIP: ENIP_COMMANDS,
+    ISO_TSAP: {},
+}
+
+
+def name(protocol, code):
+    return NAMES[protocol].get(code, 'unknown-%d' % code)
+
+
+def code(protocol, text):
+    """The code of an opcode given by name, in any case, or as a number."""
+    try:
+        return int(text, 0)
+    except ValueError:
+        pass
+    text = text.upper()
+    for number, known in NAMES[protocol].items():
+        if known.upper() == text:
+            return number
+    raise ValueError("no %s opcode %r" % (PROTOCOLS[protocol], text))
+
+
+def protocol(proto, sport, dport, payload=None):
+    """The protocol by port, or -1; with the payload, ISO-TSAP holding an S7 header is s7comm."""
+    found = PORTS.get((proto, dport))
+    if found is None:
+        found = PORTS.get((proto, sport), -1)
+    if found == ISO_TSAP and payload is not None and _is_s7comm(payload):
+        found = S7COMM
+    return found
+
+
+def _modbus(data):
+    codes = []
+    offset, end = 0, len(data)
+    while offset + 8 <= end:
+        _, protocol_id, length, _ = modbus.MBAP.unpack_from(data, offset)
+        if protocol_id != 0 or not 2 <= length <= 254:
+            break
+        codes.append(data[offset + 7])
+        offset += 6 + length
+    return codes
+
+
+_TPKT = struct.Struct('>BBH')
+_S7 = struct.Struct('>BBHHHH')
+# job, ack, ack data, userdata
+_ROSCTR = (1, 2, 3, 7)
+
+
+def _is_s7comm(data):
+    """Whether a COTP data transfer in the TPKTs of data holds an S7 header."""
+    offset, end = 0, len(data)
+    while offset + 7 <= end:
+        version, _, length = _TPKT.unpack_from(data, offset)
+        if version != 3 or length < 7:
+            break
+        cotp = offset + 4
+        s7 = cotp + 1 + data[cotp]
+        # a 0x32 protocol id with a known ROSCTR; a segment in the middle
+        # of a long MMS PDU can start with what looks like a TPKT
+        if data[cotp + 1] == 0xf0 and s7 + 10 <= end and data[s7] == 0x32 and data[s7 + 1] in _ROSCTR:
+            return True
+        offset += length
+    return False
+
+
+def _s7comm(data):
+    codes = []
+    offset, end = 0, len(data)
+    while offset + 7 <= end:
+        version, _, length = _TPKT.unpack_from(data, offset)
+        if version != 3 or length < 7:
+            break
+        cotp = offset + 4
+        # only COTP data transfers carry S7 PDUs
+        if data[cotp + 1] == 0xf0:
+            s7 = cotp + 1 + data[cotp]
+            if s7 + 10 <= end and data[s7] == 0x32:
+                _, rosctr, _, _, params, _ = _S7.unpack_from(data, s7)
+                header = 12 if rosctr in (2, 3) else 10
+                if params and s7 + header < end:
+                    codes.append(data[s7 + header])
+        offset += length
+    return codes
+
+
+def _dnp3(data):
+    codes = []
+    offset, end = 0, len(data)
+    while offset + 10 <= end:
+        if data[offset] != 0x05 or data[offset + 1] != 0x64 or data[offset + 2] < 5:
+            break
+        user = data[offset + 2] - 5
+        # link frames without user data carry no application function;
+        # the application header follows the transport header in the first block
+        if user >= 3 and offset + 13 <= end:
+            codes.append(data[offset + 12])
+        offset += 10 + user + 2 * ((user + 15) // 16)
+    return codes
+
+
+def _bacnet(data):
+    if len(data) < 4 or data[0] != 0x81:
+        return []
+    function = data[1]
+    if function in (0x0a, 0x0b):
+        npdu = 4
+    elif function == 0x04:
+        npdu = 10
+    else:
+        return []
+    if len(data) < npdu + 2 or data[npdu] != 0x01:
+        return []
+    control = data[npdu + 1]
+    if control & 0x80:
+        # network layer message, no APDU
+        return []
+    apdu = npdu + 2
+    if control & 0x20:
+        if len(data) < apdu + 3:
+            return []
+        apdu += 3 + data[apdu + 2]
+    if control & 0x08:
+        if len(data) < apdu + 3:
+            return []
+        apdu += 3 + data[apdu + 2]
+    if control & 0x20:
+        apdu += 1
+    if len(data) <= apdu:
+        return []
+    kind = data[apdu] >> 4
+    if kind == 0:
+        service = apdu + (5 if data[apdu] & 0x08 else 3)
+    elif kind == 1:
+        service = apdu + 1
+    elif kind in (2, 5):
+        service = apdu + 2
+    elif kind == 3:
+        service = apdu + (4 if data[apdu] & 0x08 else 2)
+    elif kind in (4, 6, 7):
+        return [kind << 8 | 0xff]
+    else:
+        return []
+    if len(data) <= service:
+        return []
+    return [kind << 8 | data[service]]
+
+
+_ENIP = struct.Struct('<HH')
+
+
+def _enip(data):
+    codes = []
+    offset, end = 0, len(data)
+    while offset + 24 <= end:
+        command, length = _ENIP.unpack_from(data, offset)
+        if command not in ENIP_COMMANDS:
+            break
+        codes.append(command)
+        offset += 24 + length
+    return codes
+
+
+def _none(data):
+    return []
+
+
+_EXTRACT = (_modbus, _s7comm, _dnp3, _bacnet, _enip, _none)
+
+_CPF = struct.Struct('<HH')
+_WORD = struct.Struct('<H')
+
+
+def _cip(data, start, stop, codes, depth=0):
+    """Append the service of the CIP message at start, or those it carries."""
+    if start >= stop:
+        return
+    service = data[start]
+    if depth < 4 and service & 0x7f == 0x0a:
+        # multiple service packet: a count and offsets, from the count, of the services
+        if service & 0x80:
+            base = start + 4 + 2 * data[start + 3] if start + 4 <= stop else stop
+        else:
+            base = start + 2 + 2 * data[start + 1] if start + 2 <= stop else stop
+        if base + 2 <= stop:
+            count = _WORD.unpack_from(data, base)[0]
+            for k in range(count):
+                if base + 4 + 2 * k > stop:
+                    break
+                _cip(data, base + _WORD.unpack_from(data, base + 2 + 2 * k)[0], stop, codes, depth + 1)
+            return
+    elif service in (0x4e, 0x52) and start + 4 <= stop and data[start + 2] == 0x20 and data[start + 3] == 0x06:
+        # a request to the connection manager, not a tag service
+        if service == 0x52 and depth < 4:
+            # unconnected send: the message is after the path, ticks and its size
+            base = start + 2 + 2 * data[start + 1]
+            if base + 4 <= stop:
+                _cip(data, base + 4, min(base + 4 + _WORD.unpack_from(data, base + 2)[0], stop), codes, depth + 1)
+                return
+        service |= 0x100
+    codes.append(service)
+
+
+def cip_services(data):
+    """The CIP service codes carried by the SendRRData and SendUnitData commands of an EtherNet/IP payload.
+
+    Connected data items start with a sequence count, unconnected ones
+    with the service. Multiple service packets and unconnected sends give
+    the services they carry rather than their own. Replies have the 0x80
+    bit set, as in CIP_SERVICES. Services 0x4e and 0x52 mean one thing for
+    tags and another for the connection manager; requests to the latter
+    are told apart by their path and given with 0x100 added, replies carry
+    no path and keep the tag service's name.
+    """
+    codes = []
+    offset, end = 0, len(data)
+    while offset + 24 <= end:
+        command, length = _ENIP.unpack_from(data, offset)
+        if command not in ENIP_COMMANDS:
+            break
+        stop = min(offset + 24 + length, end)
+        if command in (0x006f, 0x0070) and offset + 32 <= stop:
+            count = _ENIP.unpack_from(data, offset + 30)[0]
+            item = offset + 32
+            for _ in range(count):
+                if item + 4 > stop:
+                    break
+                kind, size = _CPF.unpack_from(data, item)
+                if kind in (0x00b1, 0x00b2):
+                    _cip(data, item + 4 + (2 if kind == 0x00b1 else 0), min(item + 4 + size, stop), codes)
+                item += 4 + size
+        offset += 24 + length
+    return codes
+
+
+def extract(protocol, payload):
+    """The opcodes in a payload of a protocol, a number."""
+    return _EXTRACT[protocol](payload)
+
+
+def classify(packet):
+    """(protocol, [opcode, ...]) of a decoded packet; protocol is -1 if no port matches."""
+    found = protocol(packet.proto, packet.sport, packet.dport, packet.payload)
+    if found < 0 or not len(packet.payload):
+        return found, []
+    return found, _EXTRACT[found](packet.payload)
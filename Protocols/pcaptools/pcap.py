@@ -0,0 +1,252 @@
+"""Record by record pcap and pcapng reading, and packet header decoding.
+
+The capture is memory mapped and every record is handed out as a
+memoryview of the mapping, so nothing is copied and memory use does not
+grow with the capture. Views are only valid while the Capture is open;
+copy what has to outlive it.
+
+    with Capture(path) as capture:
+        for ts, linktype, data in capture:
+            packet = decode(linktype, data)
+
+decode() understands Ethernet (with 802.1Q tags), Linux cooked and raw
+IP link layers, IPv4 and IPv6, and TCP and UDP, which covers the
+captures in this tree. Anything else decodes to None.
+"""
+
+import collections
+import mmap
+import socket
+import struct
+
+# link types
+ETHERNET = 1
+RAW = 101
+LINUX_SLL = 113
+IPV4 = 228
+IPV6 = 229
+
+TCP = 6
+UDP = 17
+
+# TCP flags
+FIN = 0x01
+SYN = 0x02
+RST = 0x04
+PSH = 0x08
+ACK = 0x10
+
+_PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+_PCAPNG_SHB = b'\x0a\x0d\x0d\x0a'
+
+Packet = collections.namedtuple('Packet', 'src dst proto sport dport flags seq payload')
+Packet.__doc__ = """One decoded packet.
+
+src and dst are packed addresses, 4 or 16 bytes; see addr(). sport,
+dport, flags and seq are 0 where the transport has none, and payload is
+a memoryview of the transport payload.
+"""
+
+
+class CaptureError(ValueError):
+    pass
+
+
+class Capture(object):
+    """Iterates over (timestamp, linktype, data) records of a pcap or pcapng file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = None
+        size = self._file.seek(0, 2)
+        if size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._map)
+        else:
+            self._view = memoryview(b'')
+        magic = bytes(self._view[:4])
+        if magic in _PCAP_MAGIC:
+            self.format = 'pcap'
+        elif magic == _PCAPNG_SHB:
+            self.format = 'pcapng'
+        else:
+            self.close()
+            raise CaptureError("%s: not a pcap or pcapng capture" % path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._view)
+
+    def close(self):
+        if self._map is not None:
+            try:
+                self._view.release()
+                self._map.close()
+            except BufferError:
+                # records are still referenced; the mapping goes with them
+                pass
+            self._map = None
+        self._file.close()
+
+    def __iter__(self):
+        if self.format == 'pcap':
+            return self._pcap()
+        return self._pcapng()
+
+    def _pcap(self):
+        view = self._view
+        order, resolution = _PCAP_MAGIC[bytes(view[:4])]
+        linktype = struct.unpack_from(order + 'I', view, 20)[0] & 0x0fffffff
+        record = struct.Struct(order + 'IIII')
+        offset, end = 24, len(view)
+        while offset + 16 <= end:
+            sec, frac, caplen, _ = record.unpack_from(view, offset)
+            offset += 16
+            if offset + caplen > end:
+                # truncated last record
+                return
+            yield sec + frac * resolution, linktype, view[offset:offset + caplen]
+            offset += caplen
+
+    def _pcapng(self):
+        view = self._view
+        offset, end = 0, len(view)
+        order = '<'
+        interfaces = []
+        while offset + 12 <= end:
+            if bytes(view[offset:offset + 4]) == _PCAPNG_SHB:
+                order = '<' if bytes(view[offset + 8:offset + 12]) == b'\x4d\x3c\x2b\x1a' else '>'
+                interfaces = []
+            kind, length = struct.unpack_from(order + 'II', view, offset)
+            if length < 12 or offset + length > end:
+                return
+            body = offset + 8
+            if kind == 1:
+                linktype = struct.unpack_from(order + 'H', view, body)[0]
+                interfaces.append((linktype, _tsresol(view, body + 8, offset + length - 4, order)))
+            elif kind == 6:
+                iface, high, low, caplen, _ = struct.unpack_from(order + 'IIIII', view, body)
+                linktype, resolution = interfaces[iface]
+                data = body + 20
+                yield ((high << 32) | low) * resolution, linktype, view[data:data + caplen]
+            elif kind == 3 and interfaces:
+                # simple packet block: no timestamp, snapped to the block
+                origlen = struct.unpack_from(order + 'I', view, body)[0]
+                data = body + 4
+                yield 0.0, interfaces[0][0], view[data:data + min(origlen, length - 16)]
+            elif kind == 2:
+                iface, _, high, low, caplen, _ = struct.unpack_from(order + 'HHIIII', view, body)
+                linktype, resolution = interfaces[iface]
+                data = body + 20
+                yield ((high << 32) | low) * resolution, linktype, view[data:data + caplen]
+            offset += length
+
+
+def _tsresol(view, offset, end, order):
+    """The if_tsresol option of an interface description block, in seconds."""
+    while offset + 4 <= end:
+        code, length = struct.unpack_from(order + 'HH', view, offset)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            value = view[offset + 4]
+            return 2.0 ** -(value & 0x7f) if value & 0x80 else 10.0 ** -value
+        offset += 4 + (length + 3) // 4 * 4
+    return 1e-6
+
+
+_ETHERTYPE = struct.Struct('>H')
+_TCP = struct.Struct('>HHIIBB')
+_UDP = struct.Struct('>HH')
+
+
+def decode(linktype, data):
+    """The Packet carried by one record, or None if it is not TCP or UDP over IP."""
+    if linktype == ETHERNET:
+        if len(data) < 14:
+            return None
+        ethertype = _ETHERTYPE.unpack_from(data, 12)[0]
+        offset = 14
+        while ethertype in (0x8100, 0x88a8) and len(data) >= offset + 4:
+            ethertype = _ETHERTYPE.unpack_from(data, offset + 2)[0]
+            offset += 4
+    elif linktype == LINUX_SLL:
+        if len(data) < 16:
+            return None
+        ethertype = _ETHERTYPE.unpack_from(data, 14)[0]
+        offset = 16
+    elif linktype in (RAW, 12, IPV4, IPV6):
+        if not len(data):
+            return None
+        ethertype = 0x0800 if data[0] >> 4 == 4 else 0x86dd
+        offset = 0
+    else:
+        return None
+
+    if ethertype == 0x0800:
+        if len(data) < offset + 20:
+            return None
+        ihl = (data[offset] & 0x0f) * 4
+        total = _ETHERTYPE.unpack_from(data, offset + 2)[0]
+        proto = data[offset + 9]
+        # fragments after the first carry no transport header
+        if _ETHERTYPE.unpack_from(data, offset + 6)[0] & 0x1fff:
+            return None
+        src = bytes(data[offset + 12:offset + 16])
+        dst = bytes(data[offset + 16:offset + 20])
+        end = min(offset + total, len(data)) if total else len(data)
+        offset += ihl
+    elif ethertype == 0x86dd:
+        if len(data) < offset + 40:
+            return None
+        proto = data[offset + 6]
+        end = min(offset + 40 + _ETHERTYPE.unpack_from(data, offset + 4)[0], len(data))
+        src = bytes(data[offset + 8:offset + 24])
+        dst = bytes(data[offset + 24:offset + 40])
+        offset += 40
+    else:
+        return None
+
+    if proto == TCP:
+        if end < offset + 20:
+            return None
+        sport, dport, seq, _, hlen, flags = _TCP.unpack_from(data, offset)
+        return Packet(src, dst, proto, sport, dport, flags, seq, data[offset + (hlen >> 4) * 4:end])
+    if proto == UDP:
+        if end < offset + 8:
+            return None
+        sport, dport = _UDP.unpack_from(data, offset)
+        return Packet(src, dst, proto, sport, dport, 0, 0, data[offset + 8:end])
+    return None
+
+
+_addresses = {}
+
+
+def addr(packed):
+    """Dotted or colon notation for a packed address, memoized."""
+    text = _addresses.get(packed)
+    if text is None:
+        family = socket.AF_INET if len(packed) == 4 else socket.AF_INET6
+        text = _addresses[packed] = socket.inet_ntop(family, packed)
+    return text
+
+
+def packets(path):
+    """Yield (timestamp, Packet) for every TCP or UDP packet in a capture."""
+    with Capture(path) as capture:
+        for ts, linktype, data in capture:
+            packet = decode(linktype, data)
+            if packet is not None:
+                yield ts, packet
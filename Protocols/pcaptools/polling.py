@@ -0,0 +1,187 @@
+"""Request/response latency and poll cycle statistics for Modbus traffic.
+
+Polling.feed() takes one PDU at a time, in capture order, and keeps
+
+    latency     per slave and unit, request to response times
+    items       per polled item, the time between successive requests
+                for it; an item is a master, slave, unit, function and
+                request body (a read's address and quantity), so a
+                master polling the same registers on a cycle gives one
+                item with one period distribution
+    periods     per master, the poll periods of all its items
+    outliers    the TOP transactions and polls furthest above the mean
+                of their slave or item at the time, as a ratio
+
+Requests wait in a table keyed by connection and transaction id until
+their response arrives. The table holds at most its limit of requests
+and drops the oldest when full, so memory follows the outstanding
+requests, the slaves and the items, never the length of the traffic.
+Distributions are Histograms of fixed log spaced bins.
+"""
+
+import collections
+import heapq
+import math
+
+PENDING = 4096
+TOP = 20
+
+
+class Histogram(object):
+    """Counts in BINS_PER_DECADE log spaced bins from FLOOR seconds up, with exact moments."""
+
+    BINS_PER_DECADE = 10
+    FLOOR = 1e-6
+    BINS = 9 * BINS_PER_DECADE
+
+    __slots__ = ('counts', 'n', 'total', 'squares', 'low', 'high')
+
+    def __init__(self):
+        self.counts = [0] * (self.BINS + 2)
+        self.n = 0
+        self.total = 0.0
+        self.squares = 0.0
+        self.low = math.inf
+        self.high = -math.inf
+
+    def add(self, value):
+        if value <= self.FLOOR:
+            k = 0
+        else:
+            k = min(int(math.log10(value / self.FLOOR) * self.BINS_PER_DECADE) + 1, self.BINS + 1)
+        self.counts[k] += 1
+        self.n += 1
+        self.total += value
+        self.squares += value * value
+        if value < self.low:
+            self.low = value
+        if value > self.high:
+            self.high = value
+
+    @property
+    def mean(self):
+        return self.total / self.n if self.n else math.nan
+
+    @property
+    def std(self):
+        if self.n < 2:
+            return 0.0
+        return math.sqrt(max(self.squares / self.n - self.mean ** 2, 0.0))
+
+    def percentile(self, q):
+        """The q-th percentile, 0 to 100, to the bin: the geometric middle of its bin."""
+        if not self.n:
+            return math.nan
+        rank = q / 100.0 * self.n
+        seen = 0
+        for k, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                break
+        if k == 0:
+            return self.low
+        if k == self.BINS + 1:
+            return self.high
+        middle = self.FLOOR * 10 ** ((k - 0.5) / self.BINS_PER_DECADE)
+        return min(max(middle, self.low), self.high)
+
+
+class Pending(object):
+    """Requests waiting for their response, at most limit of them."""
+
+    def __init__(self, limit=PENDING):
+        self.limit = limit
+        self.table = collections.OrderedDict()
+        self.evicted = 0
+        self.unmatched = 0
+        self.peak = 0
+
+    def __len__(self):
+        return len(self.table)
+
+    def request(self, key, value):
+        table = self.table
+        if key in table:
+            # tid reused before an answer: the first request is lost
+            del table[key]
+            self.evicted += 1
+        table[key] = value
+        if len(table) > self.limit:
+            table.popitem(last=False)
+            self.evicted += 1
+        if len(table) > self.peak:
+            self.peak = len(table)
+
+    def response(self, key):
+        value = self.table.pop(key, None)
+        if value is None:
+            self.unmatched += 1
+        return value
+
+
+class _Item(object):
+
+    __slots__ = ('last', 'periods')
+
+    def __init__(self, last):
+        self.last = last
+        self.periods = Histogram()
+
+
+class Polling(object):
+
+    def __init__(self, limit=PENDING, top=TOP, warmup=10):
+        self.pending = Pending(limit)
+        self.top = top
+        self.warmup = warmup
+        self.latency = {}
+        self.exceptions = collections.Counter()
+        self.items = {}
+        self.periods = {}
+        self.outliers = []
+        self.matched = 0
+
+    def _outlier(self, ratio, row):
+        if len(self.outliers) < self.top:
+            heapq.heappush(self.outliers, (ratio, row))
+        elif ratio > self.outliers[0][0]:
+            heapq.heapreplace(self.outliers, (ratio, row))
+
+    def feed(self, ts, connection, master, slave, unit, request, tid, function, body=b''):
+        """Account one PDU; connection is anything telling connections apart, body the request after the function."""
+        if request:
+            key = (master, slave, unit, function, body)
+            item = self.items.get(key)
+            if item is None:
+                self.items[key] = _Item(ts)
+            else:
+                period = ts - item.last
+                item.last = ts
+                periods = item.periods
+                if periods.n >= self.warmup and periods.mean > 0:
+                    self._outlier(period / periods.mean, ('period', ts, master, slave, unit, function, tid, period))
+                periods.add(period)
+                histogram = self.periods.get(master)
+                if histogram is None:
+                    histogram = self.periods[master] = Histogram()
+                histogram.add(period)
+            self.pending.request((connection, tid), ts)
+            return
+        asked = self.pending.response((connection, tid))
+        if function & 0x80:
+            self.exceptions[(slave, unit)] += 1
+        if asked is None:
+            return
+        self.matched += 1
+        latency = ts - asked
+        histogram = self.latency.get((slave, unit))
+        if histogram is None:
+            histogram = self.latency[(slave, unit)] = Histogram()
+        if histogram.n >= self.warmup and histogram.mean > 0:
+            self._outlier(latency / histogram.mean, ('latency', ts, master, slave, unit, function & 0x7f, tid,
+                                                     latency))
+        histogram.add(latency)
+
+    def worst(self):
+        """The outliers, furthest above the mean first, as (ratio, kind, ts, master, slave, unit, function, tid, value)."""
+        return [(ratio,) + row for ratio, row in sorted(self.outliers, reverse=True)]
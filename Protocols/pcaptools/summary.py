@@ -0,0 +1,166 @@
+"""Per capture traffic summaries, and merging them into one.
+
+summarize() streams a capture once and returns plain dicts and lists,
+ready for JSON:
+
+    packets, bytes, first, last
+    protocols   packets per protocol, by well known port as in opcodes
+    hosts       address: [packets sent, bytes sent, packets received, bytes received]
+    speaks      address: [protocols it sent or received]
+    talkers     "src dst": [packets, bytes]
+    functions   protocol: {"REQ name" or "RESP name": PDUs}
+    writes      protocol: {"src dst name": requests}, requests that change state
+    rate        protocol: {second: [packets, bytes]}, "other" for the rest
+    other       "tcp/port" or "udp/port": packets of no known protocol,
+                by the lower port
+
+EtherNet/IP functions are the CIP services carried, or the encapsulation
+command when there are none. merge() adds summaries up; the rates stay
+per second, so buckets of any width can be drawn from the result.
+"""
+
+import collections
+
+from pcaptools import modbus, opcodes, pcap
+
+VERSION = 3
+
+WRITES = {
+    opcodes.MODBUS: frozenset(modbus.WRITES),
+    opcodes.S7COMM: frozenset((0x05, 0x1a, 0x1b, 0x1c, 0x28, 0x29)),
+    opcodes.DNP3: frozenset((2, 3, 4, 5, 6, 13, 14)),
+    opcodes.BACNET: frozenset((7, 8, 9, 10, 11, 15, 16, 17, 20)),
+    opcodes.ENIP: frozenset(opcodes.CIP_WRITES),
+    opcodes.ISO_TSAP: frozenset(),
+}
+
+_PROTOCOLS = {pcap.TCP: 'tcp', pcap.UDP: 'udp'}
+
+
+def _functions(protocol, payload):
+    """(codes, names) of the functions in a payload."""
+    if protocol == opcodes.ENIP:
+        codes = opcodes.cip_services(payload)
+        if codes:
+            return codes, opcodes.CIP_SERVICES
+    return opcodes.extract(protocol, payload), opcodes.NAMES[protocol]
+
+
+def _request(protocol, code, names, by_port):
+    """Whether the function code was sent by the client.
+
+    BACnet/IP and DNP3 over UDP often use the well known port on both
+    ends, so where the PDU tells its direction that wins: BACnet's
+    confirmed and unconfirmed requests are APDU types 0 and 1, DNP3
+    responses are function codes 0x81 and up, CIP replies have bit 0x80
+    set. Otherwise by_port decides.
+    """
+    if protocol == opcodes.BACNET:
+        return code >> 8 in (0, 1)
+    if protocol == opcodes.DNP3:
+        return code < 0x81
+    if names is opcodes.CIP_SERVICES:
+        return not code & 0x80
+    return by_port
+
+
+def summarize(path):
+    """The summary of one capture."""
+    hosts = collections.defaultdict(lambda: [0, 0, 0, 0])
+    talkers = collections.defaultdict(lambda: [0, 0])
+    protocols = collections.Counter()
+    functions = collections.defaultdict(collections.Counter)
+    writes = collections.defaultdict(collections.Counter)
+    rate = collections.defaultdict(lambda: collections.defaultdict(lambda: [0, 0]))
+    other = collections.Counter()
+    speaks = collections.defaultdict(set)
+    packets = size = 0
+    first = last = None
+
+    for ts, packet in pcap.packets(path):
+        length = len(packet.payload)
+        src, dst = pcap.addr(packet.src), pcap.addr(packet.dst)
+        packets += 1
+        size += length
+        if first is None:
+            first = ts
+        last = ts
+        sent, received = hosts[src], hosts[dst]
+        sent[0] += 1
+        sent[1] += length
+        received[2] += 1
+        received[3] += length
+        pair = talkers[src + ' ' + dst]
+        pair[0] += 1
+        pair[1] += length
+
+        protocol = opcodes.protocol(packet.proto, packet.sport, packet.dport, packet.payload)
+        if protocol < 0:
+            kind = 'other'
+            other['%s/%d' % (_PROTOCOLS[packet.proto], min(packet.sport, packet.dport))] += 1
+        else:
+            kind = opcodes.PROTOCOLS[protocol]
+            speaks[src].add(kind)
+            speaks[dst].add(kind)
+            if length:
+                # to the well known port, from another or a higher one
+                by_port = (packet.proto, packet.dport) in opcodes.PORTS and (
+                    (packet.proto, packet.sport) not in opcodes.PORTS or packet.sport > packet.dport)
+                codes, names = _functions(protocol, packet.payload)
+                for code in codes:
+                    name = names.get(code, 'unknown-%d' % code)
+                    request = _request(protocol, code, names, by_port)
+                    functions[kind][('REQ ' if request else 'RESP ') + name] += 1
+                    if request and code in WRITES[protocol]:
+                        writes[kind]['%s %s %s' % (src, dst, name)] += 1
+        protocols[kind] += 1
+        second = rate[kind][int(ts)]
+        second[0] += 1
+        second[1] += length
+
+    return {
+        'version': VERSION,
+        'path': path,
+        'packets': packets,
+        'bytes': size,
+        'first': first,
+        'last': last,
+        'protocols': dict(protocols),
+        'hosts': dict(hosts),
+        'speaks': {host: sorted(kinds) for host, kinds in speaks.items()},
+        'talkers': dict(talkers),
+        'functions': {kind: dict(counts) for kind, counts in functions.items()},
+        'writes': {kind: dict(counts) for kind, counts in writes.items()},
+        'rate': {kind: {str(second): counts for second, counts in seconds.items()}
+                 for kind, seconds in rate.items()},
+        'other': dict(other),
+    }
+
+
+def _add(total, part):
+    for key, value in part.items():
+        if isinstance(value, dict):
+            _add(total.setdefault(key, {}), value)
+        elif isinstance(value, list):
+            into = total.setdefault(key, [0] * len(value))
+            for k, v in enumerate(value):
+                into[k] += v
+        else:
+            total[key] = total.get(key, 0) + value
+
+
+def merge(summaries):
+    """One summary of all."""
+    merged = {'captures': [s['path'] for s in summaries], 'packets': 0, 'bytes': 0,
+              'first': None, 'last': None, 'speaks': {}}
+    for s in summaries:
+        merged['packets'] += s['packets']
+        merged['bytes'] += s['bytes']
+        if s['first'] is not None:
+            merged['first'] = s['first'] if merged['first'] is None else min(merged['first'], s['first'])
+            merged['last'] = s['last'] if merged['last'] is None else max(merged['last'], s['last'])
+        for key in ('protocols', 'hosts', 'talkers', 'functions', 'writes', 'rate', 'other'):
+            _add(merged.setdefault(key, {}), s[key])
+        for host, kinds in s['speaks'].items():
+            merged['speaks'][host] = sorted(set(merged['speaks'].get(host, ())) | set(kinds))
+    return merged
@@ -0,0 +1,86 @@
+"""In order TCP payload reassembly.
+
+Stream.feed() takes the segments of one direction of a connection and
+returns the bytes that became contiguous. Retransmitted bytes are
+dropped, and segments arriving ahead of a gap are held, up to
+MAX_PENDING of them, until the gap fills. If it never fills the stream
+skips ahead rather than stalling. Memory per stream is bounded by those
+held segments.
+
+Streams keeps one Stream per (src, sport, dst, dport) and forgets it on
+FIN or RST, so memory follows the number of open connections.
+"""
+
+from pcaptools.pcap import FIN, RST, SYN
+
+MAX_PENDING = 32
+_MOD = 1 << 32
+
+
+class Stream(object):
+
+    __slots__ = ('next', 'pending')
+
+    def __init__(self):
+        self.next = None
+        self.pending = {}
+
+    def feed(self, seq, flags, payload):
+        """The payload bytes now contiguous, as a list of buffers."""
+        if self.next is None:
+            # first segment seen, maybe mid connection
+            self.next = (seq + 1) % _MOD if flags & SYN else seq
+            if flags & SYN:
+                return []
+        if not len(payload):
+            return []
+        out = []
+        offset = (seq - self.next) % _MOD
+        if offset >= _MOD // 2:
+            # starts before next: retransmission, keep any new tail
+            skip = _MOD - offset
+            if skip >= len(payload):
+                return []
+            payload = payload[skip:]
+            offset = 0
+        if offset:
+            self.pending[seq] = bytes(payload)
+            if len(self.pending) <= MAX_PENDING:
+                return []
+            # the gap is not filling, skip to the earliest held segment
+            self.next = min(self.pending, key=lambda s: (s - self.next) % _MOD)
+        else:
+            out.append(payload)
+            self.next = (self.next + len(payload)) % _MOD
+        while self.pending:
+            ready = None
+            for start in self.pending:
+                if (self.next - start) % _MOD < _MOD // 2:
+                    ready = start
+                    break
+            if ready is None:
+                break
+            data = self.pending.pop(ready)
+            skip = (self.next - ready) % _MOD
+            if skip < len(data):
+                out.append(data[skip:])
+                self.next = (self.next + len(data) - skip) % _MOD
+        return out
+
+
+class Streams(object):
+    """Reassembles every TCP connection direction seen."""
+
+    def __init__(self):
+        self.streams = {}
+
+    def feed(self, packet):
+        """(key, contiguous buffers) for a decoded TCP packet; key is (src, sport, dst, dport)."""
+        key = (packet.src, packet.sport, packet.dst, packet.dport)
+        stream = self.streams.get(key)
+        if stream is None:
+            stream = self.streams[key] = Stream()
+        data = stream.feed(packet.seq, packet.flags, packet.payload)
+        if packet.flags & (FIN | RST):
+            del self.streams[key]
+        return key, data
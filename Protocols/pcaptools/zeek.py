@@ -0,0 +1,301 @@
+"""Zeek TSV logs as typed numpy columns.
+
+    log = zeek.load('modbus.log')
+    writes = log.filter(log.contains('func', 'WRITE'))
+    for (master, slave), n in writes.count('id.orig_h', 'id.resp_h'):
+        ...
+
+The header directives give the separator, the unset and empty markers,
+and the field names and types. Columns are stored by Zeek type:
+
+    time, interval, double          float64, unset as NaN
+    count, int, port                int64, unset as -1
+    bool                            int8, T 1, F 0, unset -1
+    anything else                   dictionary encoded: int32 codes into
+                                    a table of distinct strings, the
+                                    unset and empty markers included
+
+so filters and group-bys compare integers, never strings. load() saves
+the columns next to the log as <log>.cols.npz and reuses them until the
+log changes, which makes a repeat load a single file read. Logs are
+parsed CHUNK lines at a time, so a long log never needs more than the
+columns plus one chunk of text in memory.
+
+Writer goes the other way, producing logs Zeek's own readers accept.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+CHUNK = 1 << 20
+
+_FLOAT = ('time', 'interval', 'double')
+_INT = ('count', 'int', 'port')
+
+
+def cache_path(path):
+    return path + '.cols.npz'
+
+
+class Log(object):
+    """Columns of one Zeek log; strings are (codes, categories) pairs."""
+
+    def __init__(self, meta, fields, types, columns, categories):
+        self.meta = meta
+        self.fields = fields
+        self.types = types
+        self.columns = columns
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.columns[self.fields[0]]) if self.fields else 0
+
+    def __repr__(self):
+        return "<zeek.Log %s: %d rows, %d fields>" % (self.meta.get('path', '?'), len(self), len(self.fields))
+
+    def __getitem__(self, name):
+        """A column as values, strings decoded."""
+        column = self.columns[name]
+        if name in self.categories:
+            return self.categories[name][column]
+        return column
+
+    def code(self, name, value):
+        """The code of a string value in a column, or -1 if it never occurs."""
+        hits = np.flatnonzero(self.categories[name] == value)
+        return int(hits[0]) if len(hits) else -1
+
+    def equals(self, name, value):
+        if name in self.categories:
+            return self.columns[name] == self.code(name, value)
+        return self.columns[name] == np.asarray(value, dtype=self.columns[name].dtype)
+
+    def contains(self, name, text):
+        """Rows of a string column whose value contains text."""
+        categories = self.categories[name]
+        hits = np.flatnonzero(np.char.find(categories, text) >= 0)
+        return np.isin(self.columns[name], hits)
+
+    def filter(self, mask):
+        return Log(self.meta, self.fields, self.types,
+                   {name: column[mask] for name, column in self.columns.items()}, self.categories)
+
+    def _keys(self, names):
+        """Integer keys, one column per name, and how to turn them back into values."""
+        keys, values = [], []
+        for name in names:
+            column = self.columns[name]
+            if name in self.categories:
+                values.append(self.categories[name])
+            elif column.dtype.kind == 'f':
+                uniques, column = np.unique(column, return_inverse=True)
+                values.append(uniques)
+            else:
+                values.append(None)
+            keys.append(column.reshape(-1).astype(np.int64))
+        return np.stack(keys, axis=1), values
+
+    @staticmethod
+    def _decode(values, key):
+        return tuple(int(k) if v is None else v[k].item() for v, k in zip(values, key))
+
+    def count(self, *names):
+        """[(values, rows)] for every distinct combination of names, most rows first."""
+        if not len(self):
+            return []
+        keys, values = self._keys(names)
+        keys, counts = np.unique(keys, axis=0, return_counts=True)
+        order = np.argsort(-counts, kind='stable')
+        return [(self._decode(values, keys[k]), int(counts[k])) for k in order]
+
+    def sum(self, value, *names):
+        """[(values, rows, sum of value)] per distinct combination of names, largest sum first.
+
+        Unset values add nothing.
+        """
+        if not len(self):
+            return []
+        keys, values = self._keys(names)
+        keys, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+        weights = self.columns[value].astype(np.float64)
+        if self.types[self.fields.index(value)] in ('count', 'port'):
+            weights[weights < 0] = 0
+        sums = np.bincount(inverse.reshape(-1), weights=np.nan_to_num(weights), minlength=len(keys))
+        order = np.argsort(-sums, kind='stable')
+        return [(self._decode(values, keys[k]), int(counts[k]), float(sums[k])) for k in order]
+
+    def buckets(self, width, name='ts'):
+        """(bucket start times, rows per bucket) over width second buckets."""
+        ts = self.columns[name]
+        ts = ts[~np.isnan(ts)]
+        if not len(ts):
+            return np.zeros(0), np.zeros(0, dtype=np.int64)
+        first = np.floor(ts.min() / width) * width
+        counts = np.bincount(((ts - first) // width).astype(np.int64))
+        return first + width * np.arange(len(counts)), counts
+
+
+def _header(lines):
+    meta = {'separator': '\t', 'set_separator': ',', 'empty_field': '(empty)', 'unset_field': '-'}
+    fields = types = None
+    for line in lines:
+        if not line.startswith('#'):
+            break
+        if line.startswith('#separator'):
+            meta['separator'] = line.split(' ', 1)[1].encode().decode('unicode_escape')
+            continue
+        key, _, value = line[1:].partition(meta['separator'])
+        if key == 'fields':
+            fields = value.split(meta['separator'])
+        elif key == 'types':
+            types = value.split(meta['separator'])
+        else:
+            meta[key] = value
+    if fields is None:
+        raise ValueError("no #fields line")
+    return meta, fields, types or ['string'] * len(fields)
+
+
+def _convert(values, kind, unset, index):
+    if kind in _FLOAT:
+        return np.array([v if v != unset else 'nan' for v in values], dtype=np.float64)
+    if kind in _INT:
+        return np.array([v if v != unset else -1 for v in values], dtype=np.int64)
+    if kind == 'bool':
+        return np.array([1 if v == 'T' else 0 if v == 'F' else -1 for v in values], dtype=np.int8)
+    return np.fromiter((index.setdefault(v, len(index)) for v in values), dtype=np.int32, count=len(values))
+
+
+def parse(path, chunk=CHUNK):
+    """Read a Zeek log into a Log, without the cache."""
+    with open(path) as f:
+        header = []
+        for line in f:
+            header.append(line.rstrip('\n'))
+            if line.startswith('#types'):
+                break
+        meta, fields, types = _header(header)
+        sep, unset = meta['separator'], meta['unset_field']
+        indexes = {name: {} for name, kind in zip(fields, types) if kind not in _FLOAT + _INT + ('bool',)}
+        parts = {name: [] for name in fields}
+
+        def flush(rows):
+            for name, kind, values in zip(fields, types, zip(*rows)):
+                parts[name].append(_convert(values, kind, unset, indexes.get(name)))
+
+        rows = []
+        for line in f:
+            if line.startswith('#'):
+                continue
+            rows.append(line.rstrip('\n').split(sep))
+            if len(rows) >= chunk:
+                flush(rows)
+                rows = []
+        if rows:
+            flush(rows)
+
+    columns, categories = {}, {}
+    for name, kind in zip(fields, types):
+        if parts[name]:
+            columns[name] = np.concatenate(parts[name])
+        else:
+            columns[name] = np.zeros(0, dtype=np.float64 if kind in _FLOAT else np.int64)
+        if name in indexes:
+            columns[name] = columns[name].astype(np.int32)
+            categories[name] = np.array(sorted(indexes[name], key=indexes[name].get) or [''], dtype=str)
+    return Log(meta, fields, types, columns, categories)
+
+
+def save(path, log):
+    arrays = {'meta': np.array(json.dumps({'meta': log.meta, 'fields': log.fields, 'types': log.types}))}
+    for k, name in enumerate(log.fields):
+        arrays['c%d' % k] = log.columns[name]
+        if name in log.categories:
+            arrays['d%d' % k] = log.categories[name]
+    np.savez(cache_path(path), **arrays)
+
+
+def load(path, cache=True):
+    """The Log of path, from its sidecar cache when that is up to date."""
+    sidecar = cache_path(path)
+    if cache and os.path.exists(sidecar) and os.path.getmtime(sidecar) >= os.path.getmtime(path):
+        with np.load(sidecar, allow_pickle=False) as npz:
+            header = json.loads(str(npz['meta']))
+            fields = header['fields']
+            columns, categories = {}, {}
+            for k, name in enumerate(fields):
+                columns[name] = npz['c%d' % k]
+                if 'd%d' % k in npz:
+                    categories[name] = npz['d%d' % k]
+        return Log(header['meta'], fields, header['types'], columns, categories)
+    log = parse(path)
+    if cache:
+        try:
+            save(path, log)
+        except OSError:
+            # read only tree, parse every time
+            pass
+    return log
+
+
+_BASE62 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+
+def uid(*key):
+    """A Zeek style connection uid, derived from key instead of random, so reruns agree."""
+    number = int.from_bytes(hashlib.blake2b(repr(key).encode(), digest_size=12).digest(), 'big')
+    text = []
+    while number:
+        number, digit = divmod(number, 62)
+        text.append(_BASE62[digit])
+    return 'C' + ''.join(reversed(text))
+
+
+class Writer(object):
+    """Writes a Zeek TSV log: the header directives, one line per row, and #close.
+
+    Rows are sequences in field order. None is written as the unset
+    marker, lists and tuples as sets or vectors, an empty one as the
+    empty marker, and floats of time fields with microseconds.
+    """
+
+    def __init__(self, f, path, fields, types):
+        self.f = f
+        self.fields = fields
+        self.types = types
+        self._time = [kind in _FLOAT for kind in types]
+        self.rows = 0
+        stamp = time.strftime('%Y-%m-%d-%H-%M-%S')
+        f.write('#separator \\x09\n#set_separator\t,\n#empty_field\t(empty)\n#unset_field\t-\n')
+        f.write('#path\t%s\n#open\t%s\n' % (path, stamp))
+        f.write('#fields\t%s\n#types\t%s\n' % ('\t'.join(fields), '\t'.join(types)))
+
+    def format(self, row):
+        """The line of a row, without the newline."""
+        values = []
+        for value, floating in zip(row, self._time):
+            if value is None:
+                values.append('-')
+            elif floating:
+                values.append('%.6f' % value)
+            elif isinstance(value, (list, tuple)):
+                values.append(','.join(str(v) for v in value) if value else '(empty)')
+            else:
+                values.append(str(value))
+        return '\t'.join(values)
+
+    def write(self, row):
+        self.f.write(self.format(row) + '\n')
+        self.rows += 1
+
+    def line(self, text):
+        """Write a formatted line, newline included, for callers that build the fixed parts once."""
+        self.f.write(text)
+        self.rows += 1
+
+    def close(self):
+        self.f.write('#close\t%s\n' % time.strftime('%Y-%m-%d-%H-%M-%S'))
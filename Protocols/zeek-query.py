@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# answers questions about Zeek logs from their columns instead of grep/awk
+#
+# usage: zeek-query.py LOG summary
+#        zeek-query.py LOG count FIELD [FIELD ...] [--where ...] [--top N]
+#        zeek-query.py LOG sum VALUE FIELD [FIELD ...] [--where ...]
+#        zeek-query.py LOG bucket SECONDS [--where ...]
+#
+# The first run on a log parses it and saves the columns as
+# <log>.cols.npz; later runs load that in milliseconds. --where takes
+# field=value for equality and field~text for a substring of a string
+# field, and may be repeated. For Plant1_ModbusTCP:
+#
+#   zeek-query.py Modbus/ModbusTCP/modbus.log count id.orig_h             # the master
+#   zeek-query.py Modbus/ModbusTCP/modbus.log count id.resp_h             # the slaves
+#   zeek-query.py Modbus/ModbusTCP/modbus.log count func id.resp_h --where func~WRITE
+#   zeek-query.py Modbus/ModbusTCP/modbus.log bucket 60                   # the spike
+#   zeek-query.py Modbus/ModbusTCP/conn.log bucket 60 --where service=modbus
+
+import argparse
+import re
+import sys
+import time
+
+import numpy as np
+
+from pcaptools import zeek
+
+_WHERE = re.compile(r'^([^=~]+)([=~])(.*)$')
+
+
+def where(log, conditions):
+    mask = np.ones(len(log), dtype=bool)
+    for condition in conditions:
+        match = _WHERE.match(condition)
+        if match is None:
+            raise ValueError("bad condition %r, want field=value or field~text" % condition)
+        name, op, value = match.groups()
+        if name not in log.columns:
+            raise ValueError("no field %r, the log has %s" % (name, " ".join(log.fields)))
+        if op == '~':
+            if name not in log.categories:
+                raise ValueError("%s is not a string field" % name)
+            mask &= log.contains(name, value)
+        else:
+            mask &= log.equals(name, value)
+    return log.filter(mask)
+
+
+def summary(log):
+    ts = log.columns.get('ts')
+    print("%s: %d rows" % (log.meta.get('path', '?'), len(log)))
+    if ts is not None and len(ts):
+        print("  %s to %s, %.1f s" % (_time(np.nanmin(ts)), _time(np.nanmax(ts)),
+                                      np.nanmax(ts) - np.nanmin(ts)))
+    for name, kind in zip(log.fields, log.types):
+        if name in log.categories:
+            distinct = len(np.unique(log.columns[name]))
+            print("  %-24s %-14s %d distinct" % (name, kind, distinct))
+        else:
+            column = log.columns[name]
+            print("  %-24s %-14s %s" % (name, kind, "%g to %g" % (np.nanmin(column), np.nanmax(column))
+                                        if len(column) else "empty"))
+
+
+def _time(ts):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query a Zeek log")
+    parser.add_argument('log', help="Zeek TSV log")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="parse the log and do not read or write the column cache")
+    parser.add_argument('-t', '--timing', action='store_true', help="print load and query times")
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    commands.add_parser('summary', help="rows, time span and fields")
+    count = commands.add_parser('count', help="rows per distinct combination of fields")
+    count.add_argument('fields', nargs='+')
+    total = commands.add_parser('sum', help="sum of a numeric field per distinct combination of fields")
+    total.add_argument('value')
+    total.add_argument('fields', nargs='+')
+    bucket = commands.add_parser('bucket', help="rows per time bucket")
+    bucket.add_argument('seconds', type=float)
+    bucket.add_argument('--field', default='ts', help="time field [default=%(default)s]")
+    for command in (count, total, bucket):
+        command.add_argument('-w', '--where', action='append', default=[],
+                             help="field=value or field~text, repeatable")
+        command.add_argument('--top', type=int, default=None, help="only print the first TOP results")
+    args = parser.parse_args()
+
+    start = time.time()
+    log = zeek.load(args.log, cache=not args.no_cache)
+    loaded = time.time()
+    try:
+        if args.command != 'summary':
+            log = where(log, args.where)
+            for name in getattr(args, 'fields', []) + [getattr(args, 'value', None) or log.fields[0]]:
+                if name not in log.columns:
+                    raise ValueError("no field %r, the log has %s" % (name, " ".join(log.fields)))
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.command == 'summary':
+        summary(log)
+    elif args.command == 'count':
+        for values, rows in log.count(*args.fields)[:args.top]:
+            print("%8d  %s" % (rows, "\t".join(str(value) for value in values)))
+    elif args.command == 'sum':
+        for values, rows, value in log.sum(args.value, *args.fields)[:args.top]:
+            print("%14.6g %8d  %s" % (value, rows, "\t".join(str(v) for v in values)))
+    else:
+        starts, counts = log.buckets(args.seconds, args.field)
+        peak = counts.max() if len(counts) else 0
+        for first, rows in list(zip(starts, counts))[:args.top]:
+            print("%s %8d %s" % (_time(first), rows, '#' * int(50 * rows // peak if peak else 0)))
+    if args.timing:
+        print("load %.1f ms, query %.1f ms" % (1000 * (loaded - start), 1000 * (time.time() - loaded)),
+              file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -16,26 +16,143 @@ if __name__ == '__main__':
         except:
             print "Warning: failed to XInitThreads()"
 
-from PyQt4 import Qt
 from gnuradio import analog
 from gnuradio import audio
+from gnuradio import blocks
 from gnuradio import eng_notation
 from gnuradio import filter
 from gnuradio import gr
-from gnuradio import qtgui
 from gnuradio.eng_option import eng_option
 from gnuradio.filter import firdes
-from gnuradio.qtgui import Range, RangeWidget
+from fractions import Fraction
 from optparse import OptionParser
-import osmosdr
-import sip
+import os
 import sys
+import threading
 import time
 
+try:
+    import osmosdr
+except ImportError:
+    # only needed with an SDR attached, see --replay
+    osmosdr = None
 
-class top_block(gr.top_block, Qt.QWidget):
+try:
+    from PyQt4 import Qt
+    from gnuradio import qtgui
+    from gnuradio.qtgui import Range, RangeWidget
+    import sip
+    _widget = Qt.QWidget
+except ImportError:
+    # headless boxes without Qt can still run --headless
+    Qt = None
+    _widget = object
 
-    def __init__(self):
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rftools import instrument
+from rftools import taps
+
+# receive chains selectable with --chain
+CHAINS = ('direct', 'decimating')
+# the decimating chain tunes this far below the station, off the DC spike
+LO_OFFSET = 250e3
+QUAD_RATE = 250e3
+AUDIO_RATE = 48000
+
+class decimating_rx(gr.hier_block2):
+    """Wideband FM receiver decimating as early as each stage allows.
+
+    The frequency translating FIR shifts the station from lo_offset down
+    to baseband and decimates straight to about QUAD_RATE, with a 50 kHz
+    transition band instead of the direct chain's 10 kHz, so it needs a
+    fifth of the taps. wfm_rcv decimates its audio filter by 5 and a
+    polyphase rational resampler takes what is left to AUDIO_RATE, so no
+    filter runs at more than its output rate. The decimations, and the
+    quadrature rate wfm_rcv and the resampler are built for, follow from
+    samp_rate and are fixed when built, so set_samp_rate() refuses any
+    other rate; build a new decimating_rx for it instead.
+    """
+
+    def __init__(self, samp_rate=1e6, lo_offset=LO_OFFSET):
+        gr.hier_block2.__init__(self, "decimating_rx",
+            gr.io_signature(1, 1, gr.sizeof_gr_complex*1),
+            gr.io_signature(1, 1, gr.sizeof_float*1))
+
+        self.samp_rate = samp_rate
+        self.lo_offset = lo_offset
+        self.decimation = max(1, int(samp_rate // QUAD_RATE))
+        quad_rate = samp_rate / self.decimation
+        audio_decimation = 5
+        ratio = Fraction(AUDIO_RATE) / Fraction(quad_rate / audio_decimation).limit_denominator(1000)
+        interpolation, decimation = ratio.numerator, ratio.denominator
+
+        self.freq_xlating_fir_filter_0 = filter.freq_xlating_fir_filter_ccf(
+        	self.decimation, self.channel_taps(samp_rate), lo_offset, samp_rate)
+        self.analog_wfm_rcv_0 = analog.wfm_rcv(
+        	quad_rate=quad_rate,
+        	audio_decimation=audio_decimation,
+        )
+        self.rational_resampler_xxx_0 = filter.rational_resampler_fff(
+                interpolation=interpolation,
+                decimation=decimation,
+                taps=taps.low_pass(interpolation, interpolation * quad_rate / audio_decimation,
+                                   16e3, 4e3),
+                fractional_bw=None,
+        )
+
+        self.connect((self, 0), (self.freq_xlating_fir_filter_0, 0))
+        self.connect((self.freq_xlating_fir_filter_0, 0), (self.analog_wfm_rcv_0, 0))
+        self.connect((self.analog_wfm_rcv_0, 0), (self.rational_resampler_xxx_0, 0))
+        self.connect((self.rational_resampler_xxx_0, 0), (self, 0))
+
+    # channel filter cutoff and transition
+    CHANNEL = (100e3, 50e3)
+
+    @classmethod
+    def channel_taps(cls, samp_rate):
+        return taps.low_pass(1, samp_rate, *cls.CHANNEL)
+
+    def set_samp_rate(self, samp_rate):
+        if samp_rate != self.samp_rate:
+            raise ValueError("decimating_rx is built for %g S/s, cannot run at %g S/s" % (
+                self.samp_rate, samp_rate))
+
+
+def direct_rates(samp_rate):
+    """(decimation, quad_rate, interpolation, audio decimation) of the direct chain at samp_rate.
+
+    1e6 gives the GRC flowgraph's 4 and 250e3, and its 48/250 as 24/125.
+    """
+    decimation = max(1, int(samp_rate // QUAD_RATE))
+    quad_rate = samp_rate / decimation
+    ratio = Fraction(AUDIO_RATE) / Fraction(quad_rate).limit_denominator(1000)
+    return decimation, quad_rate, ratio.numerator, ratio.denominator
+
+
+def make_source(samp_rate, freq, replay_file=None, replay_rate=None, repeat=True):
+    """The osmosdr source, or a replay of replay_file through the same setters."""
+    if replay_file:
+        from rftools import replay
+        source = replay.source(replay_file, replay_rate, repeat=repeat)
+    else:
+        source = osmosdr.source( args="numchan=" + str(1) + " " + '' )
+    source.set_sample_rate(samp_rate)
+    source.set_center_freq(freq, 0)
+    source.set_freq_corr(0, 0)
+    source.set_dc_offset_mode(0, 0)
+    source.set_iq_balance_mode(0, 0)
+    source.set_gain_mode(False, 0)
+    source.set_gain(10, 0)
+    source.set_if_gain(20, 0)
+    source.set_bb_gain(20, 0)
+    source.set_antenna('', 0)
+    source.set_bandwidth(0, 0)
+    return source
+
+
+class top_block(gr.top_block, _widget):
+
+    def __init__(self, replay_file=None, replay_rate=None, chain='direct'):
         gr.top_block.__init__(self, "Top Block")
         Qt.QWidget.__init__(self)
         self.setWindowTitle("Top Block")
@@ -63,6 +180,13 @@ class top_block(gr.top_block, Qt.QWidget):
         ##################################################
         self.samp_rate = samp_rate = 1e6
         self.freq = freq = 97.8e6
+        self.chain = chain
+        # a replayed capture is centered where it was recorded
+        self.lo_offset = lo_offset = LO_OFFSET if chain == 'decimating' and not replay_file else 0
+        # set_samp_rate to any usual rate finds its taps ready; the
+        # decimating chain is fixed to its rate
+        if chain != 'decimating':
+            taps.precompute(100e3, 10e3)
 
         ##################################################
         # Blocks
@@ -70,16 +194,10 @@ class top_block(gr.top_block, Qt.QWidget):
         self._freq_range = Range(87.5e6, 107.9e6, 100e3, 97.8e6, 200)
         self._freq_win = RangeWidget(self._freq_range, self.set_freq, "freq", "counter_slider", float)
         self.top_layout.addWidget(self._freq_win)
-        self.rational_resampler_xxx_0 = filter.rational_resampler_fff(
-                interpolation=48,
-                decimation=250,
-                taps=None,
-                fractional_bw=None,
-        )
         self.qtgui_sink_x_0 = qtgui.sink_c(
         	1024, #fftsize
         	firdes.WIN_BLACKMAN_hARRIS, #wintype
-        	freq, #fc
+        	freq - lo_offset, #fc
         	samp_rate, #bw
         	"", #name
         	True, #plotfreq
@@ -95,35 +213,37 @@ class top_block(gr.top_block, Qt.QWidget):
         
         
           
-        self.osmosdr_source_0 = osmosdr.source( args="numchan=" + str(1) + " " + '' )
-        self.osmosdr_source_0.set_sample_rate(samp_rate)
-        self.osmosdr_source_0.set_center_freq(freq, 0)
-        self.osmosdr_source_0.set_freq_corr(0, 0)
-        self.osmosdr_source_0.set_dc_offset_mode(0, 0)
-        self.osmosdr_source_0.set_iq_balance_mode(0, 0)
-        self.osmosdr_source_0.set_gain_mode(False, 0)
-        self.osmosdr_source_0.set_gain(10, 0)
-        self.osmosdr_source_0.set_if_gain(20, 0)
-        self.osmosdr_source_0.set_bb_gain(20, 0)
-        self.osmosdr_source_0.set_antenna('', 0)
-        self.osmosdr_source_0.set_bandwidth(0, 0)
-          
-        self.low_pass_filter_0 = filter.fir_filter_ccf(4, firdes.low_pass(
-        	1, samp_rate, 100e3, 10e3, firdes.WIN_HAMMING, 6.76))
+        self.osmosdr_source_0 = make_source(samp_rate, freq - lo_offset, replay_file, replay_rate)
         self.audio_sink_0 = audio.sink(48000, '', False)
-        self.analog_wfm_rcv_0 = analog.wfm_rcv(
-        	quad_rate=250e3,
-        	audio_decimation=1,
-        )
+          
+        if chain == 'decimating':
+            self.decimating_rx_0 = decimating_rx(samp_rate, lo_offset)
+        else:
+            self.rational_resampler_xxx_0 = filter.rational_resampler_fff(
+                    interpolation=48,
+                    decimation=250,
+                    taps=None,
+                    fractional_bw=None,
+            )
+            self.low_pass_filter_0 = filter.fir_filter_ccf(4, taps.low_pass(
+            	1, samp_rate, 100e3, 10e3, firdes.WIN_HAMMING, 6.76))
+            self.analog_wfm_rcv_0 = analog.wfm_rcv(
+            	quad_rate=250e3,
+            	audio_decimation=1,
+            )
 
         ##################################################
         # Connections
         ##################################################
-        self.connect((self.analog_wfm_rcv_0, 0), (self.rational_resampler_xxx_0, 0))    
-        self.connect((self.low_pass_filter_0, 0), (self.analog_wfm_rcv_0, 0))    
-        self.connect((self.osmosdr_source_0, 0), (self.low_pass_filter_0, 0))    
         self.connect((self.osmosdr_source_0, 0), (self.qtgui_sink_x_0, 0))    
-        self.connect((self.rational_resampler_xxx_0, 0), (self.audio_sink_0, 0))    
+        if chain == 'decimating':
+            self.connect((self.osmosdr_source_0, 0), (self.decimating_rx_0, 0))
+            self.connect((self.decimating_rx_0, 0), (self.audio_sink_0, 0))
+        else:
+            self.connect((self.analog_wfm_rcv_0, 0), (self.rational_resampler_xxx_0, 0))    
+            self.connect((self.low_pass_filter_0, 0), (self.analog_wfm_rcv_0, 0))    
+            self.connect((self.osmosdr_source_0, 0), (self.low_pass_filter_0, 0))    
+            self.connect((self.rational_resampler_xxx_0, 0), (self.audio_sink_0, 0))    
 
     def closeEvent(self, event):
         self.settings = Qt.QSettings("GNU Radio", "top_block")
@@ -134,21 +254,173 @@ class top_block(gr.top_block, Qt.QWidget):
         return self.samp_rate
 
     def set_samp_rate(self, samp_rate):
+        if self.chain == 'decimating':
+            # raises before anything is retuned
+            self.decimating_rx_0.set_samp_rate(samp_rate)
         self.samp_rate = samp_rate
-        self.qtgui_sink_x_0.set_frequency_range(self.freq, self.samp_rate)
+        self.qtgui_sink_x_0.set_frequency_range(self.freq - self.lo_offset, self.samp_rate)
         self.osmosdr_source_0.set_sample_rate(self.samp_rate)
-        self.low_pass_filter_0.set_taps(firdes.low_pass(1, self.samp_rate, 100e3, 10e3, firdes.WIN_HAMMING, 6.76))
+        if self.chain != 'decimating':
+            self.low_pass_filter_0.set_taps(taps.low_pass(1, self.samp_rate, 100e3, 10e3, firdes.WIN_HAMMING, 6.76))
 
     def get_freq(self):
         return self.freq
 
     def set_freq(self, freq):
         self.freq = freq
-        self.qtgui_sink_x_0.set_frequency_range(self.freq, self.samp_rate)
-        self.osmosdr_source_0.set_center_freq(self.freq, 0)
+        self.qtgui_sink_x_0.set_frequency_range(self.freq - self.lo_offset, self.samp_rate)
+        self.osmosdr_source_0.set_center_freq(self.freq - self.lo_offset, 0)
+
+
+class headless_block(gr.top_block):
+    """The top_block receive chain without the GUI.
+
+    Audio goes to a wav file, or is discarded. A replayed capture is
+    played once, so the flowgraph stops at EOF. source replaces the SDR
+    or replay with any complex source block.
+    """
+
+    def __init__(self, replay_file=None, replay_rate=None, wav=None,
+                 samp_rate=1e6, freq=97.8e6, chain='direct', source=None):
+        gr.top_block.__init__(self, "FM Radio Headless")
+
+        self.samp_rate = samp_rate
+        self.freq = freq
+        self.chain = chain
+        live = source is None and not replay_file
+        self.lo_offset = lo_offset = LO_OFFSET if chain == 'decimating' and live else 0
+
+        if source is None:
+            source = make_source(samp_rate, freq - lo_offset, replay_file, replay_rate, repeat=False)
+        self.osmosdr_source_0 = source
+        if wav:
+            self.audio_sink_0 = blocks.wavfile_sink(wav, 1, 48000, 16)
+        else:
+            self.audio_sink_0 = blocks.null_sink(gr.sizeof_float*1)
+
+        if chain == 'decimating':
+            self.decimating_rx_0 = decimating_rx(samp_rate, lo_offset)
+            self.connect((self.osmosdr_source_0, 0), (self.decimating_rx_0, 0))
+            self.connect((self.decimating_rx_0, 0), (self.audio_sink_0, 0))
+            return
+
+        # the GUI flowgraph's chain, decimating by whatever samp_rate needs
+        decimation, quad_rate, interpolation, audio_decimation = direct_rates(samp_rate)
+        self.low_pass_filter_0 = filter.fir_filter_ccf(decimation, taps.low_pass(
+        	1, samp_rate, 100e3, 10e3, firdes.WIN_HAMMING, 6.76))
+        self.analog_wfm_rcv_0 = analog.wfm_rcv(
+        	quad_rate=quad_rate,
+        	audio_decimation=1,
+        )
+        self.rational_resampler_xxx_0 = filter.rational_resampler_fff(
+                interpolation=interpolation,
+                decimation=audio_decimation,
+                taps=None,
+                fractional_bw=None,
+        )
+
+        self.connect((self.osmosdr_source_0, 0), (self.low_pass_filter_0, 0))
+        self.connect((self.low_pass_filter_0, 0), (self.analog_wfm_rcv_0, 0))
+        self.connect((self.analog_wfm_rcv_0, 0), (self.rational_resampler_xxx_0, 0))
+        self.connect((self.rational_resampler_xxx_0, 0), (self.audio_sink_0, 0))
+
+
+def run_headless(options):
+    tb = headless_block(options.replay, options.replay_rate, options.wav, chain=options.chain)
+    # the whole receive chain, the replay's own blocks included
+    report = instrument.Throughput(tb).report
+    done = threading.Event()
+
+    def reporter():
+        while not done.wait(options.report):
+            report()
+
+    if options.report:
+        instrument.enable()
+        thread = threading.Thread(target=reporter)
+        thread.daemon = True
+        thread.start()
+    start = time.time()
+    with instrument.recording(tb, options.instrument, options.interval):
+        tb.start()
+        try:
+            tb.wait()
+        except KeyboardInterrupt:
+            tb.stop()
+            tb.wait()
+    done.set()
+    print "ran %.2f s" % (time.time() - start)
+    report()
+
+
+def benchmark(seconds, replay_file=None, samp_rate=1e6):
+    """Push seconds of input through each chain unthrottled.
+
+    Prints the process CPU time, summed over all scheduler threads, spent
+    per second of audio. Without a capture the input is noise, which costs
+    the filters the same as a station does.
+    """
+    results = []
+    for chain in CHAINS:
+        if replay_file:
+            from rftools import replay
+            source = replay.source(replay_file, 0, repeat=False)
+            samp_rate = source.capture_rate or samp_rate
+        else:
+            source = analog.noise_source_c(analog.GR_GAUSSIAN, 1, 0)
+        head = blocks.head(gr.sizeof_gr_complex*1, int(seconds * samp_rate))
+        tb = headless_block(samp_rate=samp_rate, chain=chain, source=head)
+        tb.connect((source, 0), (head, 0))
+
+        before = os.times()
+        start = time.time()
+        tb.run()
+        elapsed = max(time.time() - start, 1e-9)
+        after = os.times()
+        cpu = (after[0] - before[0]) + (after[1] - before[1])
+        audio = tb.audio_sink_0.nitems_read(0) / float(AUDIO_RATE)
+        results.append((chain, cpu / max(audio, 1e-9)))
+        print "%-10s %.2f s of audio in %.2f s, %.3f CPU s per audio s, %.1fx real time" % (
+            chain, audio, elapsed, cpu / max(audio, 1e-9), audio / elapsed)
+    (_, direct), (_, decimating) = results
+    print "decimating chain uses %.1f%% of the direct chain's CPU" % (100 * decimating / direct)
+
+
+def argument_parser():
+    parser = OptionParser(option_class=eng_option, usage="%prog: [options]")
+    parser.add_option("--headless", action="store_true", default=False,
+        help="run the receive chain without the GUI")
+    parser.add_option("--replay", default=None, metavar="CAPTURE",
+        help="replay a recorded capture instead of using the SDR")
+    parser.add_option("--replay-rate", type="eng_float", default=None,
+        help="replay rate, 0 for as fast as possible [default=follow samp_rate]")
+    parser.add_option("--chain", type="choice", choices=CHAINS, default='direct',
+        help="receive chain: %s [default=%%default]" % ", ".join(CHAINS))
+    parser.add_option("--benchmark", type="eng_float", default=None, metavar="SECONDS",
+        help="time both chains on SECONDS of input and exit")
+    parser.add_option("--wav", default=None,
+        help="write the audio to a wav file in headless mode")
+    parser.add_option("--report", type="eng_float", default=0,
+        help="seconds between per block throughput reports in headless mode, 0 for only at exit")
+    parser.add_option("--instrument", default=None, metavar="CSV",
+        help="sample per block counters into CSV and print a summary at exit")
+    parser.add_option("--interval", type="eng_float", default=1.0,
+        help="seconds between instrument samples [default=%default]")
+    return parser
 
 
 def main(top_block_cls=top_block, options=None):
+    parser = argument_parser()
+    if options is None:
+        options, _ = parser.parse_args()
+    if options.benchmark:
+        benchmark(options.benchmark, options.replay)
+        return
+    if osmosdr is None and not options.replay:
+        parser.error("gr-osmosdr is not installed; --replay a capture instead")
+    if options.headless:
+        run_headless(options)
+        return
 
     from distutils.version import StrictVersion
     if StrictVersion(Qt.qVersion()) >= StrictVersion("4.5.0"):
@@ -156,15 +428,16 @@ def main(top_block_cls=top_block, options=None):
         Qt.QApplication.setGraphicsSystem(style)
     qapp = Qt.QApplication(sys.argv)
 
-    tb = top_block_cls()
-    tb.start()
-    tb.show()
+    tb = top_block_cls(options.replay, options.replay_rate, options.chain)
+    with instrument.recording(tb, options.instrument, options.interval):
+        tb.start()
+        tb.show()
 
-    def quitting():
-        tb.stop()
-        tb.wait()
-    qapp.connect(qapp, Qt.SIGNAL("aboutToQuit()"), quitting)
-    qapp.exec_()
+        def quitting():
+            tb.stop()
+            tb.wait()
+        qapp.connect(qapp, Qt.SIGNAL("aboutToQuit()"), quitting)
+        qapp.exec_()
 
 
 if __name__ == '__main__':
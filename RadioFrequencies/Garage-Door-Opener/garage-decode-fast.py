@@ -0,0 +1,433 @@
+#!/usr/bin/env python
+# decodes 66 bit remote keyless entry signal
+# pulse width modulation
+# numpy version of garage-decode.py, to be used with garage.grc demodulator
+#
+# usage: garage-decode-fast.py [options] [/tmp/garage.out]
+
+from __future__ import print_function
+
+import binascii
+import json
+import multiprocessing
+import os
+import stat
+import struct
+import sys
+import time
+from optparse import OptionParser
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rftools import linecode
+
+FRAME_BITS = 66
+FRAME_SYMBOLS = FRAME_BITS * 3
+PREAMBLE = 0xaaaaaa00
+
+# number of candidate frames gathered at once, bounds the working set
+BATCH = 1 << 16
+# symbols read per chunk in streaming mode
+CHUNK = 1 << 20
+
+# one bit is encoded in a triple: short pulse 0, long pulse 1
+PWM = linecode.pwm(zero=(1, 0, 0), one=(1, 1, 0))
+
+# preamble bits shifted in ahead of the symbols for the raw ook dump
+_PREAMBLE_BITS = np.unpackbits(
+    np.array([PREAMBLE], dtype='>u4').view(np.uint8))
+
+
+def map_symbols(path, offset=0, length=None):
+    """Memory map length symbols of path starting at offset.
+
+    The mapping extends FRAME_SYMBOLS past the range so that a frame
+    starting inside it can be decoded without touching a neighbouring
+    range. Returns (symbols, limit), limit being the number of frame start
+    positions that belong to the range.
+    """
+    size = os.path.getsize(path)
+    offset = min(offset, size)
+    if length is None:
+        length = size - offset
+    end = min(offset + length + FRAME_SYMBOLS, size)
+    if end == offset:
+        return np.zeros(0, dtype=np.uint8), 0
+    symbols = np.memmap(path, dtype=np.uint8, mode='r',
+                        offset=offset, shape=(end - offset,))
+    return symbols, max(min(length, end - offset - FRAME_SYMBOLS), 0)
+
+
+def find_frames(symbols):
+    # look for correlations flagged by gr_correlate_access_code_bb
+    return linecode.find_flags(symbols, len(symbols) - FRAME_SYMBOLS)
+
+
+def decode_frames(symbols, starts):
+    """Decode the frames beginning at each offset in starts.
+
+    Returns (ok, bits, raw) where ok flags frames made entirely of valid
+    triples, bits holds the 66 pwm bits per frame and raw the 198 stripped
+    symbols the raw ook dump is built from.
+    """
+    raw = linecode.windows(symbols, starts, FRAME_SYMBOLS)
+    bits, ok = PWM.decode(raw)
+    return ok, bits, raw
+
+
+def pwm_bytes(bits):
+    # 66 bits left padded to 72, the leading nibble is always zero
+    return linecode.pack(bits).tobytes()
+
+
+def ook_bytes(raw):
+    # preamble, one zero bit, the symbols, one zero bit: 232 bits, 29 bytes
+    frame = np.concatenate((_PREAMBLE_BITS, [0], raw, [0]))
+    return linecode.pack(frame).tobytes()
+
+
+def pwm_hex(bits):
+    return binascii.hexlify(pwm_bytes(bits)).decode('ascii')[1:]
+
+
+def ook_hex(raw):
+    return binascii.hexlify(ook_bytes(raw)).decode('ascii')
+
+
+def iter_frames(symbols, batch=BATCH, base=0):
+    """Yield (start, ok, bits, raw) for every flagged frame in symbols.
+
+    base is added to each start, so offsets stay absolute when symbols is
+    a window into a longer capture.
+    """
+    return _decode_starts(symbols, find_frames(symbols), batch, base)
+
+
+def scan_frames(symbols, limit=None, chunk=CHUNK, batch=BATCH, base=0):
+    """Decode frames straight out of a memory mapped symbol array.
+
+    Only frames starting before limit are decoded. Flags are searched one
+    chunk at a time so temporaries stay bounded, and frame windows are
+    gathered from the mapping itself, so no carry-over is needed.
+    """
+    if limit is None:
+        limit = max(len(symbols) - FRAME_SYMBOLS, 0)
+    for lo in range(0, limit, chunk):
+        hi = min(lo + chunk, limit)
+        starts = lo + linecode.find_flags(symbols[lo:hi])
+        for frame in _decode_starts(symbols, starts, batch, base):
+            yield frame
+
+
+def _decode_shard(job):
+    path, offset, length, chunk = job
+    symbols, limit = map_symbols(path, offset, length)
+    frames = list(scan_frames(symbols, limit, chunk, base=offset))
+    if not frames:
+        return [], [], [], []
+    starts, ok, bits, raw = zip(*frames)
+    return (np.array(starts), np.array(ok),
+            np.array(bits, dtype=np.uint8), np.array(raw, dtype=np.uint8))
+
+
+def parallel_frames(path, jobs=0, shard=None, offset=0, length=None, chunk=CHUNK):
+    """Decode a symbol file on a process pool, yielding frames in file order.
+
+    The file is split into shards of frame start positions. Each worker maps
+    its shard plus the FRAME_SYMBOLS that follow it, so frames crossing a
+    shard boundary are decoded by the shard they start in. Frames at or
+    before the last start already yielded are dropped.
+    """
+    size = os.path.getsize(path)
+    end = size if length is None else min(offset + length, size)
+    jobs = jobs or multiprocessing.cpu_count()
+    if shard is None:
+        # a few shards per worker keeps the pool busy when hits are uneven
+        shard = max(-(-(end - offset) // (jobs * 4)), FRAME_SYMBOLS)
+    shards = [(path, lo, min(shard, end - lo), chunk) for lo in range(offset, end, shard)]
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        last = -1
+        for starts, ok, bits, raw in pool.imap(_decode_shard, shards):
+            for j in range(len(starts)):
+                if starts[j] <= last:
+                    continue
+                last = starts[j]
+                yield int(starts[j]), bool(ok[j]), bits[j], raw[j]
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
+
+
+def _decode_starts(symbols, starts, batch, base):
+    for i in range(0, len(starts), batch):
+        chunk = starts[i:i + batch]
+        ok, bits, raw = decode_frames(symbols, chunk)
+        for j in range(len(chunk)):
+            yield base + int(chunk[j]), bool(ok[j]), bits[j], raw[j]
+
+
+def read_chunks(path, chunk=CHUNK, follow=False, poll=0.25):
+    """Yield symbol chunks from a file or fifo as the demodulator writes them.
+
+    A fifo ends when the writer closes it. A regular file ends at EOF unless
+    follow is set, in which case it is polled for growth like tail -f.
+    """
+    fifo = stat.S_ISFIFO(os.stat(path).st_mode)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        while True:
+            data = os.read(fd, chunk)
+            if data:
+                yield np.frombuffer(data, dtype=np.uint8)
+            elif follow and not fifo:
+                time.sleep(poll)
+            else:
+                return
+    finally:
+        os.close(fd)
+
+
+def stream_frames(chunks, batch=BATCH):
+    """Decode frames from an iterable of symbol chunks in constant memory.
+
+    The last FRAME_SYMBOLS symbols of each chunk are carried into the next
+    one, so a frame straddling a chunk boundary is decoded once its tail
+    arrives.
+    """
+    carry = np.zeros(0, dtype=np.uint8)
+    base = 0
+    for chunk in chunks:
+        window = np.concatenate((carry, chunk))
+        for frame in iter_frames(window, batch, base):
+            yield frame
+        keep = min(len(window), FRAME_SYMBOLS)
+        base += len(window) - keep
+        carry = window[len(window) - keep:].copy()
+
+
+class Sink(object):
+    """Buffers formatted frames and writes them to out in batches."""
+
+    binary = False
+
+    def __init__(self, out, batch=4096):
+        self.out = out
+        self.batch = batch
+        self.rows = []
+
+    def format(self, start, ok, bits, raw):
+        raise NotImplementedError
+
+    def write(self, start, ok, bits, raw):
+        self.rows.append(self.format(start, ok, bits, raw))
+        if len(self.rows) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.out.write((b'' if self.binary else '').join(self.rows))
+            self.rows = []
+        self.out.flush()
+
+    def close(self):
+        self.flush()
+
+
+class TextSink(Sink):
+    """The human readable output of garage-decode.py."""
+
+    def format(self, start, ok, bits, raw):
+        if not ok:
+            return "\ndecoding frame\npwm decoding error\n"
+        return "\ndecoding frame\n%s\npwm hex: %s\nraw ook hex: %s\n" % (
+            bits.tolist(), pwm_hex(bits), ook_hex(raw))
+
+
+class JsonSink(Sink):
+    """One JSON object per line; code is hex, null for frames that failed to decode."""
+
+    def format(self, start, ok, bits, raw):
+        return json.dumps({
+            'offset': start,
+            # hex, a 66 bit integer is past what JSON readers keep exactly
+            'code': pwm_hex(bits) if ok else None,
+            'ook': ook_hex(raw),
+            'error': not ok,
+        }) + "\n"
+
+
+class CsvSink(Sink):
+    """offset,code,ook,error rows; code is empty for frames that failed to decode."""
+
+    def __init__(self, out, batch=4096):
+        Sink.__init__(self, out, batch)
+        self.rows.append("offset,code,ook,error\n")
+
+    def format(self, start, ok, bits, raw):
+        return "%d,%s,%s,%d\n" % (
+            start, linecode.to_int(bits) if ok else '', ook_hex(raw), not ok)
+
+
+class BinarySink(Sink):
+    """Fixed 47 byte little endian records.
+
+    u64 symbol offset, u8 error flag, the 66 bit code as 9 big endian bytes
+    (zero on error) and the 232 bit raw ook frame as 29 big endian bytes.
+    """
+
+    binary = True
+    record = struct.Struct('<QB9s29s')
+
+    def format(self, start, ok, bits, raw):
+        return self.record.pack(start, not ok, pwm_bytes(bits * ok), ook_bytes(raw))
+
+
+SINKS = {
+    'text': TextSink,
+    'jsonl': JsonSink,
+    'csv': CsvSink,
+    'bin': BinarySink,
+}
+
+
+def decode_loop(symbols):
+    """The per-symbol loop from garage-decode.py, kept for benchmarking."""
+    frames = []
+    for i in range(len(symbols) - FRAME_SYMBOLS):
+        if not symbols[i] & 2:
+            continue
+        bits = []
+        for k in range(FRAME_BITS):
+            j = (k * 3) + i
+            stripped = (symbols[j] & 1, symbols[j + 1] & 1, symbols[j + 2] & 1)
+            if stripped == (1, 0, 0):
+                bits.append(0)
+            elif stripped == (1, 1, 0):
+                bits.append(1)
+            else:
+                break
+        else:
+            frame = PREAMBLE << 1
+            for sym in symbols[i:i + FRAME_SYMBOLS]:
+                frame <<= 1
+                frame |= (sym & 1)
+            frame <<= 1
+            frames.append((i, bits, frame))
+    return frames
+
+
+def synth_symbols(length, frames, seed=0):
+    """Build a noisy symbol stream with valid frames flagged by the correlator."""
+    rng = np.random.RandomState(seed)
+    symbols = rng.randint(0, 2, length).astype(np.uint8)
+    # sprinkle false correlator hits over the noise
+    symbols[rng.randint(0, length, frames)] |= 2
+    patterns = np.array([[1, 0, 0], [1, 1, 0]], dtype=np.uint8)
+    for start in rng.randint(0, length - FRAME_SYMBOLS, frames):
+        code = patterns[rng.randint(0, 2, FRAME_BITS)].ravel()
+        symbols[start:start + FRAME_SYMBOLS] = code
+        symbols[start] |= 2
+    return symbols
+
+
+def benchmark(symbols, out=sys.stdout):
+    t0 = time.time()
+    reference = decode_loop(bytearray(symbols.tobytes()))
+    t1 = time.time()
+    decoded = [(s, b, r) for s, ok, b, r in iter_frames(symbols) if ok]
+    t2 = time.time()
+
+    assert [f[0] for f in reference] == [f[0] for f in decoded]
+    for (_, bits, frame), (_, b, r) in zip(reference, decoded):
+        assert bits == b.tolist()
+        assert "%058x" % frame == ook_hex(r)
+
+    out.write("symbols: %d, frames: %d\n" % (len(symbols), len(decoded)))
+    out.write("loop:    %8.3f s\n" % (t1 - t0))
+    out.write("numpy:   %8.3f s (%.1fx)\n" % (t2 - t1, (t1 - t0) / max(t2 - t1, 1e-9)))
+
+
+def main():
+    parser = OptionParser(usage="%prog: [options] [symbol file]")
+    parser.add_option("--benchmark", action="store_true", default=False,
+                      help="time the numpy decoder against the original loop")
+    parser.add_option("--synthetic", type="int", default=0, metavar="N",
+                      help="benchmark on N synthetic symbols instead of a file")
+    parser.add_option("--stream", action="store_true", default=False,
+                      help="decode in fixed size chunks (default for a fifo)")
+    parser.add_option("--follow", action="store_true", default=False,
+                      help="keep reading as the file sink grows, implies --stream")
+    parser.add_option("--chunk", type="int", default=CHUNK,
+                      help="symbols searched per chunk [default=%default]")
+    parser.add_option("--offset", type="int", default=0,
+                      help="first symbol of the range to decode [default=%default]")
+    parser.add_option("--length", type="int", default=None,
+                      help="symbols in the range to decode [default=to EOF]")
+    parser.add_option("-f", "--format", type="choice", choices=sorted(SINKS), default="text",
+                      help="output format: %s [default=%%default]" % ", ".join(sorted(SINKS)))
+    parser.add_option("-o", "--output", default=None,
+                      help="write frames to a file instead of stdout")
+    parser.add_option("-j", "--jobs", type="int", default=1,
+                      help="decode shards on N processes, 0 for all cores [default=%default]")
+    parser.add_option("--shard", type="int", default=None,
+                      help="symbols per shard with --jobs [default=auto]")
+    (options, args) = parser.parse_args()
+    path = args[0] if args else '/tmp/garage.out'
+
+    if options.synthetic:
+        benchmark(synth_symbols(options.synthetic, max(options.synthetic // 5000, 1)))
+        return
+
+    if options.shard is not None and options.shard < FRAME_SYMBOLS:
+        parser.error("--shard must be at least one frame, %d symbols" % FRAME_SYMBOLS)
+
+    streaming = options.stream or options.follow or stat.S_ISFIFO(os.stat(path).st_mode)
+    if streaming and (options.offset or options.length is not None):
+        parser.error("--offset and --length need a regular file, not --stream, --follow or a fifo")
+
+    if options.benchmark and not streaming:
+        benchmark(map_symbols(path, options.offset, options.length)[0])
+        return
+
+    cls = SINKS[options.format]
+    if options.output:
+        out = open(options.output, 'wb' if cls.binary else 'w')
+    else:
+        out = getattr(sys.stdout, 'buffer', sys.stdout) if cls.binary else sys.stdout
+    sink = cls(out)
+    try:
+        if streaming:
+            def flushed(chunks):
+                # stream_frames asks for the next chunk once every frame of
+                # this one is written: flush then, before the read blocks
+                for chunk in chunks:
+                    yield chunk
+                    sink.flush()
+
+            chunks = read_chunks(path, options.chunk, options.follow)
+            try:
+                for frame in stream_frames(flushed(chunks)):
+                    sink.write(*frame)
+            except KeyboardInterrupt:
+                pass
+        else:
+            if options.jobs != 1:
+                frames = parallel_frames(path, options.jobs, options.shard,
+                                         options.offset, options.length, options.chunk)
+            else:
+                symbols, limit = map_symbols(path, options.offset, options.length)
+                frames = scan_frames(symbols, limit, options.chunk, base=options.offset)
+            for frame in frames:
+                sink.write(*frame)
+        sink.close()
+    finally:
+        if options.output:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -10,20 +10,59 @@ from gnuradio import digital
 from gnuradio import eng_notation
 from gnuradio import filter
 from gnuradio import gr
-from gnuradio import wxgui
 from gnuradio.eng_option import eng_option
 from gnuradio.fft import window
 from gnuradio.filter import firdes
-from gnuradio.wxgui import fftsink2
-from gnuradio.wxgui import forms
-from grc_gnuradio import wxgui as grc_wxgui
 from optparse import OptionParser
-import osmosdr
-import wx
+import os
+import sys
+import threading
+import time
 
-class top_block(grc_wxgui.top_block_gui):
+try:
+    import osmosdr
+except ImportError:
+    # only needed with an SDR attached, see --replay
+    osmosdr = None
 
-    def __init__(self):
+try:
+    from gnuradio import wxgui
+    from gnuradio.wxgui import fftsink2
+    from gnuradio.wxgui import forms
+    from grc_gnuradio import wxgui as grc_wxgui
+    import wx
+    _gui_block = grc_wxgui.top_block_gui
+except ImportError:
+    # headless boxes without wx can still run --headless
+    _gui_block = gr.top_block
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rftools import instrument
+from rftools import taps
+
+def make_source(samp_rate, freq, replay_file=None, replay_rate=None, repeat=True):
+    """The RTL-SDR source, or a replay of replay_file through the same setters."""
+    if replay_file:
+        from rftools import replay
+        source = replay.source(replay_file, replay_rate, repeat=repeat)
+    else:
+        source = osmosdr.source( args="numchan=" + str(1) + " " + "" )
+    source.set_sample_rate(samp_rate)
+    source.set_center_freq(freq, 0)
+    source.set_freq_corr(0, 0)
+    source.set_dc_offset_mode(0, 0)
+    source.set_iq_balance_mode(0, 0)
+    source.set_gain_mode(0, 0)
+    source.set_gain(10, 0)
+    source.set_if_gain(20, 0)
+    source.set_bb_gain(20, 0)
+    source.set_antenna("", 0)
+    source.set_bandwidth(0, 0)
+    return source
+
+class top_block(_gui_block):
+
+    def __init__(self, replay_file=None, replay_rate=None):
         grc_wxgui.top_block_gui.__init__(self, title="Top Block")
         _icon_path = "/usr/share/icons/hicolor/32x32/apps/gnuradio-grc.png"
         self.SetIcon(wx.Icon(_icon_path, wx.BITMAP_TYPE_ANY))
@@ -33,6 +72,8 @@ class top_block(grc_wxgui.top_block_gui):
         ##################################################
         self.samp_rate = samp_rate = 500e3
         self.freq = freq = 905.998e6
+        # set_samp_rate to any usual rate finds its taps ready
+        taps.precompute(150e3, 100e3)
 
         ##################################################
         # Blocks
@@ -76,20 +117,9 @@ class top_block(grc_wxgui.top_block_gui):
         	peak_hold=True,
         )
         self.Add(self.wxgui_fftsink2_0.win)
-        self.rtlsdr_source_0 = osmosdr.source( args="numchan=" + str(1) + " " + "" )
-        self.rtlsdr_source_0.set_sample_rate(samp_rate)
-        self.rtlsdr_source_0.set_center_freq(freq, 0)
-        self.rtlsdr_source_0.set_freq_corr(0, 0)
-        self.rtlsdr_source_0.set_dc_offset_mode(0, 0)
-        self.rtlsdr_source_0.set_iq_balance_mode(0, 0)
-        self.rtlsdr_source_0.set_gain_mode(0, 0)
-        self.rtlsdr_source_0.set_gain(10, 0)
-        self.rtlsdr_source_0.set_if_gain(20, 0)
-        self.rtlsdr_source_0.set_bb_gain(20, 0)
-        self.rtlsdr_source_0.set_antenna("", 0)
-        self.rtlsdr_source_0.set_bandwidth(0, 0)
+        self.rtlsdr_source_0 = make_source(samp_rate, freq, replay_file, replay_rate)
           
-        self.low_pass_filter_0 = filter.fir_filter_ccf(1, firdes.low_pass(
+        self.low_pass_filter_0 = filter.fir_filter_ccf(1, taps.low_pass(
         	1, samp_rate, 150e3, 100e3, firdes.WIN_HAMMING, 6.76))
         self.gr_file_sink_0 = blocks.file_sink(gr.sizeof_char*1, "/tmp/chronos.bits")
         self.gr_file_sink_0.set_unbuffered(False)
@@ -121,7 +151,7 @@ class top_block(grc_wxgui.top_block_gui):
     def set_samp_rate(self, samp_rate):
         self.samp_rate = samp_rate
         self.rtlsdr_source_0.set_sample_rate(self.samp_rate)
-        self.low_pass_filter_0.set_taps(firdes.low_pass(1, self.samp_rate, 150e3, 100e3, firdes.WIN_HAMMING, 6.76))
+        self.low_pass_filter_0.set_taps(taps.low_pass(1, self.samp_rate, 150e3, 100e3, firdes.WIN_HAMMING, 6.76))
         self.wxgui_fftsink2_0.set_sample_rate(self.samp_rate)
 
     def get_freq(self):
@@ -134,18 +164,97 @@ class top_block(grc_wxgui.top_block_gui):
         self.rtlsdr_source_0.set_center_freq(self.freq, 0)
         self.wxgui_fftsink2_0.set_baseband_freq(self.freq)
 
+class headless_block(gr.top_block):
+    """The top_block receive chain without the GUI or FFT sink.
+
+    A replayed capture is played once, so the flowgraph stops at EOF.
+    """
+
+    def __init__(self, replay_file=None, replay_rate=None, outfile="/tmp/chronos.bits",
+                 samp_rate=500e3, freq=905.998e6):
+        gr.top_block.__init__(self, "Chronos Headless")
+
+        self.samp_rate = samp_rate
+        self.freq = freq
+
+        self.rtlsdr_source_0 = make_source(samp_rate, freq, replay_file, replay_rate, repeat=False)
+        self.low_pass_filter_0 = filter.fir_filter_ccf(1, taps.low_pass(
+            1, samp_rate, 150e3, 100e3, firdes.WIN_HAMMING, 6.76))
+        self.gr_file_sink_0 = blocks.file_sink(gr.sizeof_char*1, outfile)
+        self.gr_file_sink_0.set_unbuffered(False)
+        self.digital_gfsk_demod_0 = digital.gfsk_demod(
+            samples_per_symbol=2,
+            sensitivity=1.0,
+            gain_mu=0.175,
+            mu=0.5,
+            omega_relative_limit=0.005,
+            freq_error=0.0,
+            verbose=False,
+            log=False,
+        )
+
+        self.connect((self.rtlsdr_source_0, 0), (self.low_pass_filter_0, 0))
+        self.connect((self.low_pass_filter_0, 0), (self.digital_gfsk_demod_0, 0))
+        self.connect((self.digital_gfsk_demod_0, 0), (self.gr_file_sink_0, 0))
+
+def run_headless(options):
+    tb = headless_block(options.replay, options.replay_rate, options.output)
+    # the whole receive chain, the replay's own blocks included
+    report = instrument.Throughput(tb).report
+    done = threading.Event()
+
+    def reporter():
+        while not done.wait(options.report):
+            report()
+
+    if options.report:
+        instrument.enable()
+        thread = threading.Thread(target=reporter)
+        thread.daemon = True
+        thread.start()
+    start = time.time()
+    with instrument.recording(tb, options.instrument, options.interval):
+        tb.start()
+        try:
+            tb.wait()
+        except KeyboardInterrupt:
+            tb.stop()
+            tb.wait()
+    done.set()
+    print "ran %.2f s" % (time.time() - start)
+    report()
+
 if __name__ == '__main__':
     import ctypes
-    import sys
+    parser = OptionParser(option_class=eng_option, usage="%prog: [options]")
+    parser.add_option("--headless", action="store_true", default=False,
+        help="run the receive chain without the GUI")
+    parser.add_option("--replay", default=None, metavar="CAPTURE",
+        help="replay a recorded capture instead of using the RTL-SDR")
+    parser.add_option("--replay-rate", type="eng_float", default=None,
+        help="replay rate, 0 for as fast as possible [default=follow samp_rate]")
+    parser.add_option("-o", "--output", default="/tmp/chronos.bits",
+        help="bit file in headless mode [default=%default]")
+    parser.add_option("--report", type="eng_float", default=0,
+        help="seconds between per block throughput reports in headless mode, 0 for only at exit")
+    parser.add_option("--instrument", default=None, metavar="CSV",
+        help="sample per block counters into CSV and print a summary at exit")
+    parser.add_option("--interval", type="eng_float", default=1.0,
+        help="seconds between instrument samples [default=%default]")
+    (options, args) = parser.parse_args()
+    if osmosdr is None and not options.replay:
+        parser.error("gr-osmosdr is not installed; --replay a capture instead")
+    if options.headless:
+        run_headless(options)
+        sys.exit(0)
     if sys.platform.startswith('linux'):
         try:
             x11 = ctypes.cdll.LoadLibrary('libX11.so')
             x11.XInitThreads()
         except:
             print "Warning: failed to XInitThreads()"
-    parser = OptionParser(option_class=eng_option, usage="%prog: [options]")
-    (options, args) = parser.parse_args()
-    tb = top_block()
-    tb.Start(True)
-    tb.Wait()
+    tb = top_block(options.replay, options.replay_rate)
+    with instrument.recording(tb, options.instrument, options.interval):
+        tb.Start(True)
+        tb.Wait()
 
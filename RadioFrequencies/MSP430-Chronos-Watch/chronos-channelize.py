@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# channelizes a wideband 900 MHz capture and runs the ChronosWatch.py
+# gfsk_demod chain on every channel at once
+#
+# usage: chronos-channelize.py [options] capture|fifo
+#
+# a 26 Msps capture centered on 915 MHz splits into 52 channels of
+# 500 ksps, the same rate ChronosWatch.py demodulates at, covering the
+# 902-928 MHz range of its freq slider. One bit file per channel is
+# written as <outdir>/chronos-<MHz>.bits.
+
+from __future__ import division, print_function
+
+import multiprocessing
+import os
+import stat
+import sys
+import time
+from optparse import OptionParser
+
+import numpy as np
+
+try:
+    import queue as Queue
+except ImportError:
+    import Queue
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rftools import demod
+from rftools.channelizer import Channelizer, channel_offsets
+from rftools.iqfile import FORMATS, IQFile
+
+# ChronosWatch.py: 500 ksps, gfsk_demod samples_per_symbol=2
+SYMBOL_RATE = 250e3
+CHUNK = 1 << 20
+
+
+def fifo_blocks(path, chunk=CHUNK):
+    """complex64 blocks from a fifo fed by a file sink, until the writer closes it."""
+    fd = os.open(path, os.O_RDONLY)
+    itemsize = np.dtype(np.complex64).itemsize
+    partial = b''
+    try:
+        while True:
+            data = os.read(fd, chunk * itemsize)
+            if not data:
+                return
+            data = partial + data
+            whole = len(data) // itemsize * itemsize
+            partial = data[whole:]
+            if whole:
+                yield np.frombuffer(data[:whole], dtype=np.complex64)
+    finally:
+        os.close(fd)
+
+
+def _demod_worker(queue, freqs, rate, outdir):
+    sps = rate / SYMBOL_RATE
+    chains = [demod.gfsk_chain(rate, sps) for _ in freqs]
+    files = [open(os.path.join(outdir, "chronos-%.3f.bits" % (f / 1e6)), 'wb') for f in freqs]
+    try:
+        while True:
+            block = queue.get()
+            if block is None:
+                return
+            for chain, out, column in zip(chains, files, block.T):
+                out.write(chain.work(np.ascontiguousarray(column)).tobytes())
+    finally:
+        for out in files:
+            out.close()
+
+
+class WorkerDied(RuntimeError):
+    pass
+
+
+def _put(queue, proc, item, poll=1.0):
+    """queue.put that gives up once the worker reading the queue has died."""
+    while True:
+        try:
+            queue.put(item, timeout=poll)
+            return
+        except Queue.Full:
+            if not proc.is_alive():
+                # nobody will drain what is buffered, do not wait on it at exit
+                queue.cancel_join_thread()
+                raise WorkerDied("demod worker %d exited with %s" % (proc.pid, proc.exitcode))
+
+
+def channelize(blocks, samp_rate, center, nchan, lo, hi, outdir, jobs=0):
+    """Split blocks into channels and demodulate those between lo and hi Hz.
+
+    Channels are shared out over jobs worker processes, each owning the
+    demod chains and bit files of its channels. Queues are bounded, so
+    memory stays constant however long the input runs. WorkerDied is
+    raised if a worker exits early or fails.
+    """
+    freqs = center + channel_offsets(nchan, samp_rate)
+    keep = np.flatnonzero((freqs >= lo) & (freqs <= hi))
+    if not len(keep):
+        raise ValueError("no channel between %.3f and %.3f MHz" % (lo / 1e6, hi / 1e6))
+    jobs = min(jobs or multiprocessing.cpu_count(), len(keep))
+    groups = np.array_split(keep, jobs)
+
+    workers = []
+    for group in groups:
+        queue = multiprocessing.Queue(maxsize=4)
+        proc = multiprocessing.Process(target=_demod_worker,
+                                       args=(queue, freqs[group], samp_rate / nchan, outdir))
+        proc.start()
+        workers.append((queue, proc, group))
+
+    channelizer = Channelizer(nchan)
+    samples = 0
+    try:
+        for block in blocks:
+            samples += len(block)
+            out = channelizer.work(block)
+            for queue, proc, group in workers:
+                _put(queue, proc, out[:, group])
+    finally:
+        for queue, proc, _ in workers:
+            try:
+                _put(queue, proc, None)
+            except WorkerDied:
+                pass
+        for queue, proc, _ in workers:
+            proc.join()
+    for _, proc, _ in workers:
+        if proc.exitcode:
+            raise WorkerDied("demod worker %d exited with %s" % (proc.pid, proc.exitcode))
+    return samples, freqs[keep]
+
+
+def main():
+    parser = OptionParser(usage="%prog: [options] capture|fifo")
+    parser.add_option("-f", "--format", type="choice", choices=sorted(FORMATS), default=None,
+                      help="sample format: %s [default=from extension]" % ", ".join(sorted(FORMATS)))
+    parser.add_option("-s", "--samp-rate", type="float", default=None,
+                      help="wideband sample rate [default=from name, else 26e6]")
+    parser.add_option("-c", "--center", type="float", default=None,
+                      help="capture center frequency [default=from name, else 915e6]")
+    parser.add_option("-n", "--nchan", type="int", default=None,
+                      help="number of channels [default=500 ksps per channel]")
+    parser.add_option("--low", type="float", default=902e6,
+                      help="lowest channel to demodulate [default=%default]")
+    parser.add_option("--high", type="float", default=928e6,
+                      help="highest channel to demodulate [default=%default]")
+    parser.add_option("-o", "--outdir", default="/tmp",
+                      help="directory for the bit files [default=%default]")
+    parser.add_option("-j", "--jobs", type="int", default=0,
+                      help="demod processes, 0 for all cores [default=%default]")
+    (options, args) = parser.parse_args()
+    if len(args) != 1:
+        parser.error("need one capture or fifo")
+    path = args[0]
+
+    if stat.S_ISFIFO(os.stat(path).st_mode):
+        blocks = fifo_blocks(path)
+        samp_rate = options.samp_rate or 26e6
+        center = options.center or 915e6
+    else:
+        iq = IQFile(path, options.format, options.samp_rate, options.center)
+        blocks = (b for _, b in iq.chunks(CHUNK))
+        samp_rate = iq.samp_rate or 26e6
+        center = iq.center_freq or 915e6
+    nchan = options.nchan or int(round(samp_rate / 500e3))
+
+    start = time.time()
+    try:
+        samples, freqs = channelize(blocks, samp_rate, center, nchan,
+                                    options.low, options.high, options.outdir, options.jobs)
+    except WorkerDied as e:
+        sys.exit("chronos-channelize.py: %s" % e)
+    elapsed = max(time.time() - start, 1e-9)
+    print("%d channels of %.1f ksps, %.3f-%.3f MHz, into %s" % (
+        len(freqs), samp_rate / nchan / 1e3, freqs.min() / 1e6, freqs.max() / 1e6, options.outdir))
+    print("%d samples in %.2f s: %.2f Msps, %.1fx real time" % (
+        samples, elapsed, samples / elapsed / 1e6, samples / elapsed / samp_rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -11,13 +11,26 @@ from gnuradio import gr
 from gnuradio import window
 from gnuradio.eng_option import eng_option
 from gnuradio.gr import firdes
-from gnuradio.wxgui import fftsink2
-from gnuradio.wxgui import forms
-from grc_gnuradio import wxgui as grc_wxgui
 from optparse import OptionParser
-import wx
+import os
+import sys
+import time
 
-class top_block(grc_wxgui.top_block_gui):
+try:
+	from gnuradio.wxgui import fftsink2
+	from gnuradio.wxgui import forms
+	from grc_gnuradio import wxgui as grc_wxgui
+	import wx
+	_gui_block = grc_wxgui.top_block_gui
+except ImportError:
+	# headless boxes without wx can still run --headless
+	_gui_block = gr.top_block
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rftools import instrument
+from rftools import taps
+
+class top_block(_gui_block):
 
 	def __init__(self):
 		grc_wxgui.top_block_gui.__init__(self, title="Top Block")
@@ -29,6 +42,8 @@ class top_block(grc_wxgui.top_block_gui):
 		##################################################
 		self.squelch = squelch = -20
 		self.samp_rate = samp_rate = 1e6
+		# set_samp_rate to any usual rate finds its taps ready
+		taps.precompute(150e3, 100e3)
 
 		##################################################
 		# Blocks
@@ -72,7 +87,7 @@ class top_block(grc_wxgui.top_block_gui):
 			peak_hold=False,
 		)
 		self.Add(self.wxgui_fftsink2_0.win)
-		self.low_pass_filter_0 = gr.fir_filter_ccf(1, firdes.low_pass(
+		self.low_pass_filter_0 = gr.fir_filter_ccf(1, taps.low_pass(
 			1, samp_rate, 150e3, 100e3, firdes.WIN_HAMMING, 6.76))
 		self.gr_throttle_0 = gr.throttle(gr.sizeof_gr_complex*1, samp_rate)
 		self.gr_sig_source_x_0 = gr.sig_source_c(samp_rate, gr.GR_COS_WAVE, 20e3, 1, 0)
@@ -117,12 +132,77 @@ class top_block(grc_wxgui.top_block_gui):
 	def set_samp_rate(self, samp_rate):
 		self.samp_rate = samp_rate
 		self.gr_sig_source_x_0.set_sampling_freq(self.samp_rate)
-		self.low_pass_filter_0.set_taps(firdes.low_pass(1, self.samp_rate, 150e3, 100e3, firdes.WIN_HAMMING, 6.76))
+		self.low_pass_filter_0.set_taps(taps.low_pass(1, self.samp_rate, 150e3, 100e3, firdes.WIN_HAMMING, 6.76))
 		self.wxgui_fftsink2_0.set_sample_rate(self.samp_rate)
 
+class headless_block(gr.top_block):
+	"""The top_block decode chain without the GUI, FFT sink or throttle.
+
+	The file source does not repeat, so run() returns once the capture has
+	been pushed through as fast as the CPU allows.
+	"""
+
+	def __init__(self, infile, outfile="/tmp/bits", squelch=-20, samp_rate=1e6):
+		gr.top_block.__init__(self, "Xyloc Headless")
+
+		self.squelch = squelch
+		self.samp_rate = samp_rate
+
+		self.low_pass_filter_0 = gr.fir_filter_ccf(1, taps.low_pass(
+			1, samp_rate, 150e3, 100e3, firdes.WIN_HAMMING, 6.76))
+		self.gr_sig_source_x_0 = gr.sig_source_c(samp_rate, gr.GR_COS_WAVE, 20e3, 1, 0)
+		self.gr_quadrature_demod_cf_0 = gr.quadrature_demod_cf(1)
+		self.gr_pwr_squelch_xx_0 = gr.pwr_squelch_cc(squelch, .1, 0, True)
+		self.gr_multiply_xx_0 = gr.multiply_vcc(1)
+		self.gr_file_source_0 = gr.file_source(gr.sizeof_gr_complex*1, infile, False)
+		self.gr_file_sink_0 = gr.file_sink(gr.sizeof_char*1, outfile)
+		self.gr_file_sink_0.set_unbuffered(False)
+		self.digital_correlate_access_code_bb_0 = digital.correlate_access_code_bb("0011001101010101", 0)
+		self.digital_clock_recovery_mm_xx_0 = digital.clock_recovery_mm_ff(8, .008, 0, .175, .005)
+		self.digital_binary_slicer_fb_0 = digital.binary_slicer_fb()
+
+		self.connect((self.gr_file_source_0, 0), (self.gr_pwr_squelch_xx_0, 0))
+		self.connect((self.gr_pwr_squelch_xx_0, 0), (self.gr_multiply_xx_0, 0))
+		self.connect((self.gr_sig_source_x_0, 0), (self.gr_multiply_xx_0, 1))
+		self.connect((self.gr_multiply_xx_0, 0), (self.low_pass_filter_0, 0))
+		self.connect((self.low_pass_filter_0, 0), (self.gr_quadrature_demod_cf_0, 0))
+		self.connect((self.gr_quadrature_demod_cf_0, 0), (self.digital_clock_recovery_mm_xx_0, 0))
+		self.connect((self.digital_clock_recovery_mm_xx_0, 0), (self.digital_binary_slicer_fb_0, 0))
+		self.connect((self.digital_binary_slicer_fb_0, 0), (self.digital_correlate_access_code_bb_0, 0))
+		self.connect((self.digital_correlate_access_code_bb_0, 0), (self.gr_file_sink_0, 0))
+
+def run_headless(options):
+	tb = headless_block(options.input, options.output, options.squelch, options.samp_rate)
+	samples = os.path.getsize(options.input) // gr.sizeof_gr_complex
+	start = time.time()
+	with instrument.recording(tb, options.instrument, options.interval):
+		tb.run()
+	elapsed = max(time.time() - start, 1e-9)
+	print "%d samples in %.2f s: %.3f Msps, %.1fx real time" % (
+		samples, elapsed, samples / elapsed / 1e6, samples / elapsed / options.samp_rate)
+
 if __name__ == '__main__':
 	parser = OptionParser(option_class=eng_option, usage="%prog: [options]")
+	parser.add_option("--headless", action="store_true", default=False,
+		help="decode the input file without GUI or throttle and exit at EOF")
+	parser.add_option("-i", "--input", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+		"sample", "xyloc-clip-1Msps-rtl.cfile"),
+		help="complex capture to decode in headless mode [default=%default]")
+	parser.add_option("-o", "--output", default="/tmp/bits",
+		help="correlator output file in headless mode [default=%default]")
+	parser.add_option("--squelch", type="eng_float", default=-20,
+		help="power squelch threshold in dB [default=%default]")
+	parser.add_option("-s", "--samp-rate", type="eng_float", default=1e6,
+		help="capture sample rate [default=%default]")
+	parser.add_option("--instrument", default=None, metavar="CSV",
+		help="sample per block counters into CSV and print a summary at exit")
+	parser.add_option("--interval", type="eng_float", default=1.0,
+		help="seconds between instrument samples [default=%default]")
 	(options, args) = parser.parse_args()
-	tb = top_block()
-	tb.Run(True)
+	if options.headless:
+		run_headless(options)
+	else:
+		tb = top_block()
+		with instrument.recording(tb, options.instrument, options.interval):
+			tb.Run(True)
 
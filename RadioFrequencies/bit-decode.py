@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# decodes fixed length frames from the bit files written by the flowgraphs
+#
+# usage: bit-decode.py [options] garage|xyloc|chronos [bit file]
+#
+#   garage   /tmp/garage.out    3 chip pwm, correlator flagged (garage.grc)
+#   xyloc    /tmp/bits          nrz, correlator flagged (Xyloc top_block.py)
+#   chronos  /tmp/chronos.bits  nrz, raw gfsk_demod output searched for the
+#                               CC1111 sync word (ChronosWatch.py)
+
+from __future__ import print_function
+
+import binascii
+import collections
+import os
+import sys
+from optparse import OptionParser
+
+import numpy as np
+
+from rftools import linecode
+
+Profile = collections.namedtuple('Profile', 'path code bits access_code')
+
+PROFILES = {
+    'garage': Profile('/tmp/garage.out', linecode.pwm((1, 0, 0), (1, 1, 0)), 66, None),
+    'xyloc': Profile('/tmp/bits', linecode.NRZ, 64, None),
+    'chronos': Profile('/tmp/chronos.bits', linecode.NRZ, 256,
+                       '11010011100100011101001110010001'),
+}
+
+CODES = {
+    'nrz': linecode.NRZ,
+    'manchester': linecode.manchester(),
+    'manchester-thomas': linecode.manchester(ieee=False),
+}
+
+BATCH = 1 << 16
+
+
+def load(path):
+    if not os.path.getsize(path):
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode='r')
+
+
+def decode(symbols, profile, threshold=0, batch=BATCH):
+    """Yield (start, ok, bits) batches for every frame found in symbols."""
+    chips = profile.bits * profile.code.width
+    if profile.access_code:
+        starts = linecode.find_access_code(symbols, profile.access_code, threshold)
+        starts = starts[starts <= len(symbols) - chips]
+    else:
+        starts = linecode.find_flags(symbols, len(symbols) - chips + 1)
+    for i in range(0, len(starts), batch):
+        chunk = starts[i:i + batch]
+        bits, ok = profile.code.decode(linecode.windows(symbols, chunk, chips))
+        yield chunk, ok, bits
+
+
+def parse_field(option, opt, value, parser):
+    start, length = value.split(':')
+    parser.values.fields.append((int(start), int(length)))
+
+
+def main():
+    parser = OptionParser(usage="%prog: [options] " + "|".join(sorted(PROFILES)) + " [bit file]")
+    parser.add_option("--bits", type="int", default=None,
+                      help="frame length in bits [default=per profile]")
+    parser.add_option("--code", type="choice", choices=sorted(CODES), default=None,
+                      help="line code: %s [default=per profile]" % ", ".join(sorted(CODES)))
+    parser.add_option("--threshold", type="int", default=0,
+                      help="access code bit errors allowed [default=%default]")
+    parser.add_option("--field", type="string", action="callback", callback=parse_field,
+                      metavar="START:LEN", dest="fields", default=[],
+                      help="also print an integer field, may be repeated")
+    (options, args) = parser.parse_args()
+    if not args or args[0] not in PROFILES:
+        parser.error("pick a profile: " + ", ".join(sorted(PROFILES)))
+
+    profile = PROFILES[args[0]]
+    if options.bits:
+        profile = profile._replace(bits=options.bits)
+    if options.code:
+        profile = profile._replace(code=CODES[options.code])
+    symbols = load(args[1] if len(args) > 1 else profile.path)
+
+    out = sys.stdout
+    for starts, ok, bits in decode(symbols, profile, options.threshold):
+        packed = linecode.pack(bits)
+        fields = [linecode.field(bits, s, n) for s, n in options.fields]
+        lines = []
+        for j in range(len(starts)):
+            if not ok[j]:
+                lines.append("%d decoding error\n" % starts[j])
+                continue
+            row = "%d %s" % (starts[j], binascii.hexlify(packed[j].tobytes()).decode('ascii'))
+            lines.append(" ".join([row] + ["%d" % f[j] for f in fields]) + "\n")
+        out.write("".join(lines))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# indexes the bursts in IQ captures so decoders can skip the silence
+#
+# usage: burst-index.py [options] capture [capture ...]
+#
+# writes <capture>.bursts.npz next to each capture and prints the bursts;
+# an index made with other options than a decoder asks for is rebuilt
+
+from __future__ import print_function
+
+import time
+from optparse import OptionParser
+
+from rftools import bursts
+from rftools.iqfile import FORMATS, IQFile
+
+
+def main():
+    parser = OptionParser(usage="%prog: [options] capture [capture ...]")
+    parser.add_option("-f", "--format", type="choice", choices=sorted(FORMATS), default=None,
+                      help="sample format: %s [default=from extension]" % ", ".join(sorted(FORMATS)))
+    parser.add_option("-s", "--samp-rate", type="float", default=None,
+                      help="sample rate for the frequency offsets [default=from name]")
+    parser.add_option("-w", "--window", type="int", default=bursts.WINDOW,
+                      help="power averaging window in samples [default=%default]")
+    parser.add_option("--high", type="float", default=bursts.HIGH,
+                      help="dB above the noise floor that opens a burst [default=%default]")
+    parser.add_option("--low", type="float", default=bursts.LOW,
+                      help="dB above the noise floor that closes a burst [default=%default]")
+    parser.add_option("--floor", type="float", default=None,
+                      help="noise floor in dB [default=estimated]")
+    parser.add_option("-m", "--min-length", type="int", default=bursts.MIN_LENGTH,
+                      help="shortest burst kept, in samples [default=%default]")
+    parser.add_option("-q", "--quiet", action="store_true", default=False,
+                      help="only print one summary line per capture")
+    (options, args) = parser.parse_args()
+    if not args:
+        parser.error("need at least one capture")
+
+    for path in args:
+        iq = IQFile(path, options.format, options.samp_rate)
+        start = time.time()
+        params = dict(window=options.window, high=options.high, low=options.low,
+                      min_length=options.min_length, floor=options.floor)
+        found = bursts.find_bursts(iq, **params)
+        elapsed = time.time() - start
+        bursts.save_index(path, found, **params)
+
+        covered = int((found['end'] - found['start']).sum())
+        print("%s: %d bursts, %.2f%% of %d samples, %.2f s" % (
+            path, len(found), 100.0 * covered / max(len(iq), 1), len(iq), elapsed))
+        if options.quiet:
+            continue
+        for burst in found:
+            print("  %10d %10d %8.1f dB %+10.0f Hz" % tuple(burst))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# demodulates FSK/GFSK IQ captures without GNU Radio
+#
+# usage: fsk-demod.py [options] xyloc|chronos|fsk capture [bit file]
+#
+#   xyloc    Xyloc top_block.py chain, 1 Msps, correlator flags as in /tmp/bits
+#   chronos  ChronosWatch.py gfsk_demod chain, 500 ksps, as in /tmp/chronos.bits
+#   fsk      generic 2FSK for the Basic-Modulation captures, 1 Msps 10 kbps
+#
+# the bit file holds one symbol per byte like a GNU Radio file sink
+
+from __future__ import print_function
+
+import time
+from optparse import OptionParser
+
+from rftools import bursts, demod
+from rftools.iqfile import FORMATS, IQFile
+
+PRESETS = {
+    'xyloc': lambda rate: demod.xyloc_chain(rate or 1e6),
+    'chronos': lambda rate: demod.gfsk_chain(rate or 500e3, 2),
+    'fsk': lambda rate: demod.gfsk_chain(rate or 1e6, 100, cutoff=50e3, transition=20e3),
+}
+
+CHUNK = 1 << 18
+
+
+def run(make_chain, iq, out=None, chunk=CHUNK, index=None):
+    """Push a capture through a chain, returning (samples, symbols, seconds).
+
+    With a burst index only the bursts are read, each through a fresh
+    chain so timing recovery starts over per burst.
+    """
+    if index is None:
+        pieces = [((b for _, b in iq.chunks(chunk)), make_chain())]
+    else:
+        pieces = (([b[i:i + chunk] for i in range(0, len(b), chunk)], make_chain())
+                  for _, b in bursts.iter_bursts(iq, index))
+    samples = symbols = 0
+    start = time.time()
+    for blocks, chain in pieces:
+        for block in blocks:
+            bits = chain.work(block)
+            samples += len(block)
+            symbols += len(bits)
+            if out is not None:
+                out.write(bits.tobytes())
+    return samples, symbols, time.time() - start
+
+
+def run_gnuradio(preset, iq, rate):
+    """Time the equivalent GNU Radio chain, or return None without it."""
+    try:
+        from gnuradio import analog, blocks, digital, filter, gr
+        from gnuradio.filter import firdes
+    except ImportError:
+        return None
+    path = iq.path
+    rate = rate or {'xyloc': 1e6, 'chronos': 500e3, 'fsk': 1e6}[preset]
+    tb = gr.top_block()
+    if iq.fmt == 'complex16s':
+        head = [blocks.file_source(gr.sizeof_short, path, False),
+                blocks.interleaved_short_to_complex(False, False),
+                blocks.multiply_const_cc(1.0 / 32768)]
+    elif iq.fmt == 'complex':
+        head = [blocks.file_source(gr.sizeof_gr_complex, path, False)]
+    else:
+        return None
+    if preset == 'xyloc':
+        mix = blocks.multiply_vcc(1)
+        tb.connect(analog.sig_source_c(rate, analog.GR_COS_WAVE, 20e3, 1, 0), (mix, 1))
+        chain = [mix,
+                 filter.fir_filter_ccf(1, firdes.low_pass(1, rate, 150e3, 100e3, firdes.WIN_HAMMING, 6.76)),
+                 analog.quadrature_demod_cf(1),
+                 digital.clock_recovery_mm_ff(8, .008, 0, .175, .005),
+                 digital.binary_slicer_fb(),
+                 digital.correlate_access_code_bb("0011001101010101", 0)]
+    else:
+        cutoff, transition, sps = (150e3, 100e3, 2) if preset == 'chronos' else (50e3, 20e3, 100)
+        chain = [filter.fir_filter_ccf(1, firdes.low_pass(1, rate, cutoff, transition, firdes.WIN_HAMMING, 6.76)),
+                 digital.gfsk_demod(samples_per_symbol=sps, sensitivity=1.0, gain_mu=0.175, mu=0.5,
+                                    omega_relative_limit=0.005, freq_error=0.0, verbose=False, log=False)]
+    tb.connect(*(head + chain + [blocks.null_sink(gr.sizeof_char)]))
+    start = time.time()
+    tb.run()
+    return time.time() - start
+
+
+def main():
+    parser = OptionParser(usage="%prog: [options] " + "|".join(sorted(PRESETS)) + " capture [bit file]")
+    parser.add_option("-s", "--samp-rate", type="float", default=None,
+                      help="capture sample rate [default=from name, else per preset]")
+    parser.add_option("-f", "--format", type="choice", choices=sorted(FORMATS), default=None,
+                      help="sample format: %s [default=from extension]" % ", ".join(sorted(FORMATS)))
+    parser.add_option("--chunk", type="int", default=CHUNK,
+                      help="samples per block [default=%default]")
+    parser.add_option("--bursts", action="store_true", default=False,
+                      help="only demodulate the bursts in the index, see burst-index.py")
+    parser.add_option("--benchmark", action="store_true", default=False,
+                      help="report throughput, and the GNU Radio chain's if installed")
+    (options, args) = parser.parse_args()
+    if len(args) < 2 or args[0] not in PRESETS:
+        parser.error("need a preset and a capture")
+
+    iq = IQFile(args[1], options.format, options.samp_rate)
+    index = None
+    if options.bursts:
+        index = bursts.load_index(iq.path)
+        if index is None:
+            index = bursts.find_bursts(iq)
+            bursts.save_index(iq.path, index)
+    out = open(args[2], 'wb') if len(args) > 2 else None
+    samples, symbols, elapsed = run(lambda: PRESETS[args[0]](iq.samp_rate),
+                                    iq, out, options.chunk, index)
+    if out is not None:
+        out.close()
+
+    if options.benchmark or out is None:
+        elapsed = max(elapsed, 1e-9)
+        print("numpy:     %d samples, %d symbols in %.3f s, %.2f Msps"
+              % (samples, symbols, elapsed, samples / elapsed / 1e6))
+    if options.benchmark:
+        gr_elapsed = run_gnuradio(args[0], iq, iq.samp_rate)
+        if gr_elapsed is None:
+            print("gnuradio:  not installed or format unsupported, skipped")
+        else:
+            gr_elapsed = max(gr_elapsed, 1e-9)
+            print("gnuradio:  %.3f s, %.2f Msps" % (gr_elapsed, samples / gr_elapsed / 1e6))
+
+
+if __name__ == '__main__':
+    main()
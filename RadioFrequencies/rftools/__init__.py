@@ -0,0 +1 @@
+"""Offline helpers shared by the decoders and flowgraphs in RadioFrequencies."""
@@ -0,0 +1,160 @@
+"""Burst detection and a sidecar index over long IQ recordings.
+
+One pass over the capture computes a moving average of the power and
+thresholds it with hysteresis: a burst opens when the average rises high
+dB above the noise floor and closes when it falls below low dB. Bursts
+shorter than min_length samples are dropped. Each burst is recorded as
+
+    start, end   sample range, padded back by one averaging window
+    peak         peak averaged power in dB
+    offset       center frequency offset in Hz, from the mean phase step
+
+and the table is saved next to the capture as <capture>.bursts.npz,
+together with the detection parameters it was made with. An index older
+than its capture, or made with other parameters, is stale.
+"""
+
+from __future__ import division
+
+import os
+
+import numpy as np
+
+INDEX_DTYPE = np.dtype([
+    ('start', '<i8'),
+    ('end', '<i8'),
+    ('peak', '<f4'),
+    ('offset', '<f4'),
+])
+
+CHUNK = 1 << 20
+
+WINDOW = 100
+HIGH = 10.0
+LOW = 6.0
+MIN_LENGTH = 1000
+
+
+def index_path(path):
+    return path + '.bursts.npz'
+
+
+def noise_floor(iq, window, blocks=64, size=1 << 14):
+    """Median averaged power in dB over blocks spread across the capture."""
+    if len(iq) <= window:
+        return -120.0
+    levels = []
+    ones = np.ones(window) / window
+    for start in np.linspace(0, max(len(iq) - size, 0), blocks).astype(int):
+        x = iq.read(start, size)
+        levels.append(np.convolve(x.real ** 2 + x.imag ** 2, ones, mode='valid'))
+    return 10 * np.log10(np.median(np.concatenate(levels)) + 1e-20)
+
+
+def find_bursts(iq, window=WINDOW, high=HIGH, low=LOW, min_length=MIN_LENGTH,
+                floor=None, chunk=CHUNK):
+    """Scan iq, an IQFile, and return the bursts as an INDEX_DTYPE array."""
+    if floor is None:
+        floor = noise_floor(iq, window)
+    on = 10 ** ((floor + high) / 10)
+    off = 10 ** ((floor + low) / 10)
+    rate = iq.samp_rate or 1.0
+    ones = np.ones(window) / window
+
+    bursts = []
+    history = np.zeros(window - 1)
+    last = np.complex64(0)
+    state = False
+    current = None      # [start, peak power, summed lag product] of an open burst
+
+    for base, x in iq.chunks(chunk):
+        power = x.real.astype(np.float64) ** 2 + x.imag.astype(np.float64) ** 2
+        buf = np.concatenate((history, power))
+        avg = np.convolve(buf, ones, mode='valid')
+        history = buf[len(buf) - len(history):]
+        lag = x * np.conj(np.concatenate(([last], x[:-1])))
+        last = x[-1]
+
+        # hysteresis: the state is set by whichever threshold crossed last
+        n = np.arange(len(x))
+        last_on = np.maximum.accumulate(np.where(avg > on, n, -1))
+        last_off = np.maximum.accumulate(np.where(avg < off, n, -1))
+        if state:
+            active = last_on >= last_off
+        else:
+            active = (last_on > last_off) & (last_on >= 0)
+
+        edges = np.flatnonzero(np.diff(np.concatenate(([state], active)).view(np.int8)))
+        bounds = np.concatenate(([0], edges, [len(x)])).astype(np.intp)
+        bounds = np.unique(bounds)
+        peaks = np.maximum.reduceat(avg, bounds[:-1])
+        lags = np.add.reduceat(lag, bounds[:-1])
+
+        for k in range(len(bounds) - 1):
+            a, b = bounds[k], bounds[k + 1]
+            if not active[a]:
+                # a burst ending right on the chunk boundary has no edge
+                # of its own here, np.unique folded it into bounds[0]
+                if current is not None:
+                    bursts.append(_close(current, base + a, window, min_length, rate))
+                    current = None
+                continue
+            if current is None:
+                current = [base + a, peaks[k], lags[k]]
+            else:
+                current[1] = max(current[1], peaks[k])
+                current[2] += lags[k]
+            if b < len(x):
+                bursts.append(_close(current, base + b, window, min_length, rate))
+                current = None
+        state = bool(active[-1]) if len(x) else state
+
+    if current is not None:
+        bursts.append(_close(current, len(iq), window, min_length, rate))
+    bursts = [b for b in bursts if b is not None]
+    return np.array(bursts, dtype=INDEX_DTYPE)
+
+
+def _close(current, end, window, min_length, rate):
+    start, peak, lag = current
+    if end - start < min_length:
+        return None
+    return (max(start - window, 0), end, 10 * np.log10(peak + 1e-20),
+            np.angle(lag) * rate / (2 * np.pi))
+
+
+def _params(window=WINDOW, high=HIGH, low=LOW, min_length=MIN_LENGTH, floor=None):
+    # an estimated floor is stored as nan
+    return np.array([window, high, low, min_length, np.nan if floor is None else floor])
+
+
+def save_index(path, bursts, **params):
+    """Save bursts as the index of path; params are those given to find_bursts."""
+    np.savez(index_path(path), bursts=bursts, params=_params(**params))
+
+
+def load_index(path, **params):
+    """The sidecar index of path, or None if there is none or it is stale.
+
+    params are the find_bursts parameters the caller wants; an index made
+    with any other is stale.
+    """
+    sidecar = index_path(path)
+    if not os.path.exists(sidecar) or os.path.getmtime(sidecar) < os.path.getmtime(path):
+        return None
+    try:
+        with np.load(sidecar) as index:
+            saved, bursts = index['params'], index['bursts']
+    except (IOError, KeyError, ValueError):
+        return None
+    wanted = _params(**params)
+    if saved.shape != wanted.shape or not np.all((saved == wanted) | np.isnan(saved) & np.isnan(wanted)):
+        return None
+    return bursts
+
+
+def iter_bursts(iq, bursts, pad=0):
+    """Yield (start, samples) for every indexed burst, reading nothing else."""
+    for burst in bursts:
+        start = max(int(burst['start']) - pad, 0)
+        yield start, iq.read(start, int(burst['end']) + pad - start)
@@ -0,0 +1,61 @@
+"""Critically sampled polyphase filterbank channelizer.
+
+Splits a wideband stream at samp_rate into nchan channels, each at
+samp_rate / nchan and centered channel_offsets() away from the capture's
+center, like pfb.channelizer_ccf. Every nchan input samples give one
+output sample per channel: the last taps worth of input is weighted by
+the prototype low pass, folded into nchan polyphase sums and transformed
+with one FFT.
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from rftools import demod
+
+
+def prototype(nchan, transition=0.2, window='hamming'):
+    """Low pass with its cutoff at half the channel spacing, nchan taps per branch."""
+    taps = demod.low_pass(1, nchan, 0.5, transition, window)
+    pad = -len(taps) % nchan
+    return np.concatenate((taps, np.zeros(pad, dtype=np.float32)))
+
+
+def channel_offsets(nchan, samp_rate):
+    """Frequency offset of each output column from the capture center."""
+    return np.fft.fftfreq(nchan, 1.0 / samp_rate)
+
+
+class Channelizer(object):
+    """work() maps a block of wideband samples to a (time, nchan) array."""
+
+    def __init__(self, nchan, taps=None):
+        self.nchan = nchan
+        if taps is None:
+            taps = prototype(nchan)
+        if len(taps) % nchan:
+            raise ValueError("need a multiple of %d taps" % nchan)
+        # branch p of the folded window sees taps[p * nchan:(p + 1) * nchan],
+        # applied to the newest samples last
+        self.branches = np.asarray(taps[::-1], dtype=np.float32).reshape(-1, nchan)
+        self.history = np.zeros((len(self.branches) - 1) * nchan, dtype=np.complex64)
+        self.pending = np.zeros(0, dtype=np.complex64)
+
+    def work(self, x):
+        buf = np.concatenate((self.history, self.pending, x))
+        usable = (len(buf) - len(self.history)) // self.nchan * self.nchan
+        blocks = buf[:len(self.history) + usable].reshape(-1, self.nchan)
+        self.history = buf[usable:len(self.history) + usable]
+        self.pending = buf[len(self.history) + usable:]
+
+        depth = len(self.branches)
+        steps = len(blocks) - depth + 1
+        if steps <= 0:
+            return np.zeros((0, self.nchan), dtype=np.complex64)
+        folded = np.zeros((steps, self.nchan), dtype=np.complex64)
+        for p in range(depth):
+            folded += blocks[p:p + steps] * self.branches[p]
+        # windows start on a multiple of nchan, so bin k is already the
+        # channel mixed down from k * samp_rate / nchan
+        return np.fft.fft(folded, axis=1).astype(np.complex64)
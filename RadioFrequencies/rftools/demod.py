@@ -0,0 +1,226 @@
+"""Block processing FSK/GFSK demodulator mirroring the GNU Radio chains.
+
+Each stage keeps its state between calls to work(), so a capture can be
+pushed through in chunks of any size and give the same output as one
+large block. The stages follow the blocks used by the flowgraphs:
+
+    Rotator         sig_source_c + multiply_vcc frequency shift
+    Fir             fir_filter_ccf with firdes.low_pass taps
+    QuadDemod       quadrature_demod_cf
+    ClockRecoveryMM clock_recovery_mm_ff
+    BinarySlicer    binary_slicer_fb
+    AccessCode      correlate_access_code_bb
+"""
+
+from __future__ import division
+
+import math
+
+import numpy as np
+
+from rftools import linecode
+
+# firdes max_attenuation() in dB, used to size the filter
+_ATTENUATION = {
+    'hamming': 53.0,
+    'hann': 44.0,
+    'blackman': 74.0,
+    'rectangular': 21.0,
+    'blackman-harris': 92.0,
+}
+
+
+def _window(name, ntaps, beta):
+    if name == 'hamming':
+        return np.hamming(ntaps)
+    if name == 'hann':
+        return np.hanning(ntaps)
+    if name == 'blackman':
+        return np.blackman(ntaps)
+    if name == 'rectangular':
+        return np.ones(ntaps)
+    if name == 'kaiser':
+        return np.kaiser(ntaps, beta)
+    if name == 'blackman-harris':
+        n = 2 * np.pi * np.arange(ntaps) / (ntaps - 1)
+        return (0.35875 - 0.48829 * np.cos(n) + 0.14128 * np.cos(2 * n)
+                - 0.01168 * np.cos(3 * n))
+    raise ValueError("unknown window %r" % name)
+
+
+def low_pass(gain, samp_rate, cutoff, transition, window='hamming', beta=6.76):
+    """Taps identical to firdes.low_pass for the same arguments."""
+    if window == 'kaiser':
+        attenuation = beta / 0.1102 + 8.7
+    else:
+        attenuation = _ATTENUATION[window]
+    ntaps = int(attenuation * samp_rate / (22.0 * transition))
+    ntaps |= 1
+    m = (ntaps - 1) // 2
+    n = np.arange(-m, m + 1)
+    fwt0 = 2 * np.pi * cutoff / samp_rate
+    with np.errstate(invalid='ignore', divide='ignore'):
+        taps = np.where(n == 0, fwt0 / np.pi, np.sin(n * fwt0) / (n * np.pi))
+    taps *= _window(window, ntaps, beta)
+    return (taps * gain / taps.sum()).astype(np.float32)
+
+
+class Rotator(object):
+    """Multiply by a complex exponential at freq, phase continuous across calls."""
+
+    def __init__(self, freq, samp_rate):
+        self.step = 2 * np.pi * freq / samp_rate
+        self.phase = 0.0
+
+    def work(self, x):
+        phase = self.phase + self.step * np.arange(len(x))
+        self.phase = (self.phase + self.step * len(x)) % (2 * np.pi)
+        return (x * np.exp(1j * phase)).astype(np.complex64)
+
+
+class Fir(object):
+    """Decimating FIR filter with history carried between calls."""
+
+    def __init__(self, taps, decimation=1):
+        self.taps = np.asarray(taps, dtype=np.float32)
+        self.decimation = decimation
+        self.history = None
+        self.phase = 0
+
+    def work(self, x):
+        if self.history is None:
+            self.history = np.zeros(len(self.taps) - 1, dtype=x.dtype)
+        buf = np.concatenate((self.history, x))
+        # direct convolution, so the output does not depend on block size
+        y = np.convolve(buf, self.taps, mode='valid')
+        self.history = buf[len(buf) - len(self.history):]
+        if self.decimation > 1:
+            y = y[self.phase::self.decimation]
+            self.phase = (self.phase - len(x)) % self.decimation
+        return y.astype(x.dtype)
+
+
+class QuadDemod(object):
+    """gain * arg(x[n] * conj(x[n - 1]))."""
+
+    def __init__(self, gain):
+        self.gain = gain
+        self.last = np.complex64(0)
+
+    def work(self, x):
+        if not len(x):
+            return np.zeros(0, dtype=np.float32)
+        # in double precision: single precision products round differently
+        # with the alignment of the block, which the timing loop would amplify
+        x = x.astype(np.complex128)
+        prev = np.concatenate(([self.last], x[:-1]))
+        self.last = x[-1]
+        return (self.gain * np.angle(x * np.conj(prev))).astype(np.float32)
+
+
+class ClockRecoveryMM(object):
+    """Mueller and Muller timing recovery, as clock_recovery_mm_ff.
+
+    The timing loop is a recursion over output symbols, so it runs as a
+    Python loop over symbols rather than samples. Samples are linearly
+    interpolated between neighbours instead of with the 8 tap MMSE filter,
+    which is close enough for the few samples per symbol used here.
+    """
+
+    def __init__(self, omega, gain_omega, mu, gain_mu, omega_relative_limit):
+        self.omega = omega
+        self.omega_mid = omega
+        self.omega_limit = omega * omega_relative_limit
+        self.gain_omega = gain_omega
+        self.mu = mu
+        self.gain_mu = gain_mu
+        self.last = 0.0
+        self.carry = np.zeros(0, dtype=np.float32)
+        self.skip = 0
+
+    def work(self, x):
+        buf = np.concatenate((self.carry, x)).tolist()
+        out = []
+        ii = self.skip
+        mu, omega, last = self.mu, self.omega, self.last
+        lo, hi = self.omega_mid - self.omega_limit, self.omega_mid + self.omega_limit
+        gain_omega, gain_mu = self.gain_omega, self.gain_mu
+        end = len(buf) - 1
+        while ii < end:
+            a = buf[ii]
+            sample = a + mu * (buf[ii + 1] - a)
+            mm = (sample if last >= 0 else -sample) - (last if sample >= 0 else -last)
+            last = sample
+            omega = min(max(omega + gain_omega * mm, lo), hi)
+            mu += omega + gain_mu * mm
+            step = int(math.floor(mu))
+            ii += step
+            mu -= step
+            out.append(sample)
+        self.mu, self.omega, self.last = mu, omega, last
+        self.carry = np.array(buf[ii:], dtype=np.float32)
+        self.skip = max(ii - len(buf), 0)
+        return np.array(out, dtype=np.float32)
+
+
+class BinarySlicer(object):
+
+    def work(self, x):
+        return (x >= 0).view(np.uint8)
+
+
+class AccessCode(object):
+    """Set bit 1 on the bit following each access code match."""
+
+    def __init__(self, code, threshold=0):
+        self.code = code
+        self.threshold = threshold
+        self.carry = np.zeros(0, dtype=np.uint8)
+
+    def work(self, bits):
+        buf = np.concatenate((self.carry, bits))
+        hits = linecode.find_access_code(buf, self.code, self.threshold) - len(self.carry)
+        out = bits.copy()
+        out[hits[(hits >= 0) & (hits < len(bits))]] |= 2
+        self.carry = buf[max(len(buf) - len(self.code), 0):]
+        return out
+
+
+class Chain(object):
+    """Stages applied in order; work() maps a block of samples to bits."""
+
+    def __init__(self, *stages):
+        self.stages = stages
+
+    def work(self, x):
+        for stage in self.stages:
+            x = stage.work(x)
+        return x
+
+
+def xyloc_chain(samp_rate=1e6):
+    """The Xyloc top_block.py chain, minus squelch and throttle."""
+    return Chain(
+        Rotator(20e3, samp_rate),
+        Fir(low_pass(1, samp_rate, 150e3, 100e3, 'hamming', 6.76)),
+        QuadDemod(1),
+        ClockRecoveryMM(8, .008, 0, .175, .005),
+        BinarySlicer(),
+        AccessCode("0011001101010101"),
+    )
+
+
+def gfsk_chain(samp_rate, samples_per_symbol, sensitivity=1.0, gain_mu=0.175,
+               mu=0.5, omega_relative_limit=0.005, freq_error=0.0,
+               cutoff=150e3, transition=100e3, access_code=None):
+    """low_pass_filter_0 followed by digital.gfsk_demod, as in ChronosWatch.py."""
+    stages = [
+        Fir(low_pass(1, samp_rate, cutoff, transition, 'hamming', 6.76)),
+        QuadDemod(1.0 / sensitivity),
+        ClockRecoveryMM(samples_per_symbol * (1 + freq_error), .25 * gain_mu * gain_mu,
+                        mu, gain_mu, omega_relative_limit),
+        BinarySlicer(),
+    ]
+    if access_code:
+        stages.append(AccessCode(access_code))
+    return Chain(*stages)
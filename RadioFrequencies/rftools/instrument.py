@@ -0,0 +1,239 @@
+"""Per block counters sampled from a running flowgraph.
+
+    with instrument.recording(tb, "run.csv", interval=1.0):
+        tb.run()
+
+which is short for
+
+    instrument.enable()                 # before tb.start()
+    probe = instrument.Probe(tb, interval=1.0)
+    probe.start()
+    tb.run()
+    probe.stop()
+    probe.dump("run.csv")
+    probe.summary()
+
+Blocks are found by walking the flowgraph's attributes and descending
+into hierarchical blocks, so every row is named after the attribute GRC
+gave it, e.g. digital_gfsk_demod_0.clock_recovery. Items consumed and
+produced are always available. Work time and buffer fullness come from
+GNU Radio's performance counters, which only count when [PerfCounters]
+on = True; enable() switches them on for this process and must be called
+before the flowgraph is started. Without them those columns stay empty.
+
+busy is the share of wall time a block spent inside work(). The block
+closest to 100% is the one holding the flowgraph back.
+
+Throughput(tb).report() prints the items and rate of every block since
+the previous call, for progress lines while a flowgraph runs.
+"""
+
+from __future__ import division, print_function
+
+import contextlib
+import csv
+import sys
+import threading
+import time
+
+from gnuradio import gr
+
+COLUMNS = ('time', 'block', 'consumed', 'produced', 'work_time', 'input_full', 'output_full')
+
+
+def enable():
+    """Switch the performance counters on; False if this GNU Radio has none."""
+    try:
+        gr.prefs().set_bool("PerfCounters", "on", True)
+    except AttributeError:
+        return False
+    return True
+
+
+def _ticks_per_second():
+    tps = getattr(gr, 'high_res_timer_tps', None)
+    return float(tps()) if tps else 1e9
+
+
+def _counter(block, name, *args):
+    try:
+        return getattr(block, name)(*args)
+    except (AttributeError, RuntimeError, TypeError, IndexError):
+        return None
+
+
+def find_blocks(flowgraph):
+    """(name, block) for every leaf block reachable from flowgraph's attributes."""
+    found = []
+    seen = set([id(flowgraph)])
+
+    def walk(prefix, obj):
+        if isinstance(obj, (list, tuple)):
+            for k, item in enumerate(obj):
+                walk("%s[%d]" % (prefix, k), item)
+            return
+        if id(obj) in seen:
+            return
+        if isinstance(obj, gr.hier_block2):
+            seen.add(id(obj))
+            visit(prefix + '.', obj)
+        elif hasattr(obj, 'nitems_written'):
+            seen.add(id(obj))
+            found.append((prefix, obj))
+
+    def visit(prefix, obj):
+        for attr, value in sorted(vars(obj).items()):
+            if not attr.startswith('_'):
+                walk(prefix + attr, value)
+
+    visit('', flowgraph)
+    return found
+
+
+class Probe(object):
+    """Samples the counters of every block in a flowgraph every interval seconds."""
+
+    def __init__(self, flowgraph, interval=1.0):
+        self.blocks = find_blocks(flowgraph)
+        self.interval = interval
+        self.tps = _ticks_per_second()
+        self.rows = []
+        self._start = None
+        self._done = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        now = time.time() - self._start
+        for name, block in self.blocks:
+            self.rows.append((
+                now, name,
+                _counter(block, 'nitems_read', 0),
+                _counter(block, 'nitems_written', 0),
+                _counter(block, 'pc_work_time_total'),
+                _counter(block, 'pc_input_buffers_full', 0),
+                _counter(block, 'pc_output_buffers_full', 0),
+            ))
+
+    def _run(self):
+        while not self._done.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self._start = time.time()
+        self.sample()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling, taking one last sample of the final counts."""
+        self._done.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.sample()
+
+    def dump(self, path):
+        """Write the time series as CSV, one row per block per sample."""
+        with open(path, 'w') as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            for row in self.rows:
+                writer.writerow(['' if v is None else v for v in row])
+
+    def table(self):
+        """Per block (name, items, items/s, busy, mean and peak input fullness)."""
+        series = {}
+        for row in self.rows:
+            series.setdefault(row[1], []).append(row)
+        table = []
+        for name, _ in self.blocks:
+            rows = series.get(name)
+            if not rows:
+                continue
+            first, last = rows[0], rows[-1]
+            elapsed = max(last[0] - first[0], 1e-9)
+            # sinks produce nothing, count what they consumed instead
+            col = 3 if last[3] is not None else 2
+            produced = last[col]
+            rate = None
+            if produced is not None and first[col] is not None:
+                rate = (produced - first[col]) / elapsed
+            busy = None
+            if last[4] is not None and first[4] is not None:
+                busy = (last[4] - first[4]) / self.tps / elapsed
+            full = [r[5] for r in rows if r[5] is not None]
+            table.append((name, produced, rate, busy,
+                          sum(full) / len(full) if full else None,
+                          max(full) if full else None))
+        # busiest first; blocks without counters sort last
+        table.sort(key=lambda r: -1 if r[3] is None else r[3], reverse=True)
+        return table
+
+    def summary(self, out=sys.stderr):
+        def fmt(value, spec):
+            return "-" if value is None else spec % value
+
+        out.write("%-48s %14s %12s %7s %7s %7s\n" % (
+            "block", "items", "items/s", "busy", "in avg", "in max"))
+        for name, produced, rate, busy, mean, peak in self.table():
+            out.write("%-48s %14s %12s %7s %7s %7s\n" % (
+                name, fmt(produced, "%d"), fmt(rate, "%.4g"), fmt(busy and 100 * busy, "%.1f%%"),
+                fmt(mean and 100 * mean, "%.0f%%"), fmt(peak and 100 * peak, "%.0f%%")))
+
+
+class Throughput(object):
+    """Prints items and rate of every block in a flowgraph since the last report.
+
+    The rows cover the whole flowgraph, sources through sinks, with the
+    blocks inside hierarchical ones such as replay.source. Sinks show
+    what they consumed. Output buffer fullness needs enable() before the
+    flowgraph is started, and is left as - otherwise.
+    """
+
+    def __init__(self, flowgraph):
+        self.blocks = find_blocks(flowgraph)
+        self._last = (time.time(), {})
+
+    def stats(self):
+        """(name, items, output buffer fullness or None) per block."""
+        rows = []
+        for name, block in self.blocks:
+            items = _counter(block, 'nitems_written', 0)
+            if items is None:
+                items = _counter(block, 'nitems_read', 0)
+            rows.append((name, items, _counter(block, 'pc_output_buffers_full', 0)))
+        return rows
+
+    def report(self, out=sys.stderr):
+        now = time.time()
+        then, before = self._last
+        elapsed = max(now - then, 1e-9)
+        rows = self.stats()
+        for name, items, full in rows:
+            rate = "-" if items is None else "%.3f" % ((items - before.get(name, 0)) / elapsed / 1e6)
+            occupancy = "-" if full is None else "%3.0f%%" % (100 * full)
+            out.write("%-48s %14s items %8s Msps  buffer %s\n" % (
+                name, "-" if items is None else items, rate, occupancy))
+        self._last = (now, dict((name, items or 0) for name, items, _ in rows))
+
+
+@contextlib.contextmanager
+def recording(flowgraph, path, interval=1.0, out=sys.stderr):
+    """Probe flowgraph for the duration of the with block.
+
+    The time series is written to path and the summary printed on the way
+    out. With path None nothing is probed. Enter before the flowgraph is
+    started, so the performance counters are on.
+    """
+    if path is None:
+        yield None
+        return
+    enable()
+    probe = Probe(flowgraph, interval)
+    probe.start()
+    try:
+        yield probe
+    finally:
+        probe.stop()
+        probe.dump(path)
+        probe.summary(out)
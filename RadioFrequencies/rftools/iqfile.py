@@ -0,0 +1,131 @@
+"""Memory mapped IQ capture reader.
+
+Captures are mapped, never read whole. complex64 captures are handed out
+as views of the mapping; integer captures are scaled into one reused
+float32 buffer per iterator, a batch at a time.
+
+Formats, picked from the extension unless given:
+
+    complex, cfile, fc32   complex64, as written by a GNU Radio file sink
+    complex16s, cs16       interleaved int16 I/Q
+    cs8                    interleaved int8 I/Q (hackrf_transfer)
+    cu8                    interleaved uint8 I/Q (rtl_sdr)
+
+Sample rate and center frequency are read from names such as
+RTL-SDR-433MHz-1MSps-... or New-HackRF-2_400GHz-2MSps-..., where an
+underscore stands for the decimal point.
+"""
+
+from __future__ import division
+
+import os
+import re
+
+import numpy as np
+
+# name: (mapped dtype, offset, scale); integer samples become (x - offset) * scale
+FORMATS = {
+    'complex': (np.complex64, 0, 1),
+    'complex16s': (np.int16, 0, 1 / 32768.0),
+    'cs8': (np.int8, 0, 1 / 128.0),
+    'cu8': (np.uint8, 127.5, 1 / 127.5),
+}
+
+_EXTENSIONS = {
+    '.complex': 'complex',
+    '.cfile': 'complex',
+    '.fc32': 'complex',
+    '.complex16s': 'complex16s',
+    '.cs16': 'complex16s',
+    '.cs8': 'cs8',
+    '.cu8': 'cu8',
+}
+
+_UNITS = {'k': 1e3, 'm': 1e6, 'g': 1e9}
+_RATE = re.compile(r'(\d+(?:_\d+)?)([kMG])sps', re.IGNORECASE)
+_FREQ = re.compile(r'(\d+(?:_\d+)?)([kMG])Hz', re.IGNORECASE)
+
+
+def detect_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in _EXTENSIONS:
+        raise ValueError("%s: cannot tell the sample format, pass one of %s"
+                         % (path, ", ".join(sorted(FORMATS))))
+    return _EXTENSIONS[ext]
+
+
+def parse_name(path):
+    """Sample rate and center frequency found in a capture name, or None."""
+    name = os.path.basename(path)
+
+    def value(match):
+        if not match:
+            return None
+        return float(match.group(1).replace('_', '.')) * _UNITS[match.group(2).lower()]
+
+    return value(_RATE.search(name)), value(_FREQ.search(name))
+
+
+class IQFile(object):
+    """A memory mapped capture of len(self) complex samples."""
+
+    def __init__(self, path, fmt=None, samp_rate=None, center_freq=None):
+        self.path = path
+        self.fmt = fmt or detect_format(path)
+        if self.fmt not in FORMATS:
+            raise ValueError("unknown sample format %r" % self.fmt)
+        name_rate, name_freq = parse_name(path)
+        self.samp_rate = samp_rate or name_rate
+        self.center_freq = center_freq or name_freq
+
+        dtype, self.offset, self.scale = FORMATS[self.fmt]
+        self.dtype = np.dtype(dtype)
+        # integer formats hold I and Q as separate items
+        self.width = 1 if self.dtype.kind == 'c' else 2
+        items = os.path.getsize(path) // self.dtype.itemsize // self.width * self.width
+        if items:
+            self.raw = np.memmap(path, dtype=self.dtype, mode='r', shape=(items,))
+        else:
+            self.raw = np.zeros(0, dtype=self.dtype)
+
+    def __len__(self):
+        return len(self.raw) // self.width
+
+    def __repr__(self):
+        return "IQFile(%r, fmt=%r, samp_rate=%r, center_freq=%r)" % (
+            self.path, self.fmt, self.samp_rate, self.center_freq)
+
+    def read(self, start, count, out=None):
+        """count samples from start as complex64.
+
+        complex64 captures return a view of the mapping. Other formats are
+        converted into out, a float32 buffer of at least 2 * count items,
+        or into a new array.
+        """
+        start = max(start, 0)
+        stop = min(start + count, len(self))
+        raw = self.raw[start * self.width:stop * self.width]
+        if self.width == 1:
+            return raw
+        if out is None:
+            out = np.empty(len(raw), dtype=np.float32)
+        buf = out[:len(raw)]
+        if self.offset:
+            np.subtract(raw, self.offset, out=buf)
+            buf *= self.scale
+        else:
+            np.multiply(raw, self.scale, out=buf, casting='unsafe')
+        return buf.view(np.complex64)
+
+    def chunks(self, size, overlap=0, start=0, stop=None):
+        """Yield (offset, block) with size new samples per block.
+
+        Each block also repeats the last overlap samples of the one before,
+        offset being the index of block[0]. Integer captures reuse one
+        buffer, so a block is only valid until the next one is requested.
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        out = None if self.width == 1 else np.empty((size + overlap) * 2, dtype=np.float32)
+        for lo in range(start, stop, size):
+            first = max(lo - overlap, start)
+            yield first, self.read(first, min(lo + size, stop) - first, out)
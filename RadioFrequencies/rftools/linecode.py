@@ -0,0 +1,132 @@
+"""Table driven line codes and bulk bit field extraction.
+
+Symbols are one per byte, as written by a GNU Radio file sink after a
+binary slicer: bit 0 carries the data and bit 1 is set by
+correlate_access_code_bb on the symbol following a match.
+"""
+
+from __future__ import division
+
+import binascii
+
+import numpy as np
+
+
+class LineCode(object):
+    """Maps fixed width groups of chips to bits through a lookup table.
+
+    patterns maps a tuple of chips to the bit it encodes. Any group not in
+    the table is a decoding error.
+    """
+
+    def __init__(self, name, patterns):
+        widths = set(len(p) for p in patterns)
+        if len(widths) != 1:
+            raise ValueError("%s: chip patterns must all be the same width" % name)
+        self.name = name
+        self.width = widths.pop()
+        self.table = np.full(1 << self.width, -1, dtype=np.int8)
+        for pattern, bit in patterns.items():
+            self.table[_chips_index(pattern)] = bit
+
+    def __repr__(self):
+        return "LineCode(%r)" % self.name
+
+    def decode(self, chips):
+        """Decode chips shaped (..., n * width) into (bits, ok).
+
+        bits is shaped (..., n); ok is False for rows holding any invalid
+        group. Bits of invalid groups are zero.
+        """
+        chips = np.asarray(chips)
+        groups = chips.reshape(chips.shape[:-1] + (-1, self.width))
+        index = np.zeros(groups.shape[:-1], dtype=np.intp)
+        for k in range(self.width):
+            index <<= 1
+            index |= groups[..., k] & 1
+        values = self.table[index]
+        return (values > 0).view(np.uint8), (values >= 0).all(axis=-1)
+
+
+def _chips_index(pattern):
+    index = 0
+    for chip in pattern:
+        index = (index << 1) | chip
+    return index
+
+
+def pwm(zero, one):
+    """Pulse width modulation with arbitrary chip patterns for 0 and 1."""
+    return LineCode('pwm', {tuple(zero): 0, tuple(one): 1})
+
+
+def manchester(ieee=True):
+    """Manchester; IEEE 802.3 sends 0 as high-low, G.E. Thomas the reverse."""
+    if ieee:
+        return LineCode('manchester', {(1, 0): 0, (0, 1): 1})
+    return LineCode('manchester-thomas', {(0, 1): 0, (1, 0): 1})
+
+
+NRZ = LineCode('nrz', {(0,): 0, (1,): 1})
+
+
+def find_flags(symbols, limit=None, flag=2):
+    """Offsets of the symbols flagged by correlate_access_code_bb.
+
+    Only offsets below limit are returned, so callers can ask for frames
+    that fit in the buffer.
+    """
+    if limit is None:
+        limit = len(symbols)
+    return np.flatnonzero(symbols[:max(limit, 0)] & flag)
+
+
+def find_access_code(bits, code, threshold=0):
+    """Search a raw bitstream for an access code, like correlate_access_code_bb.
+
+    code is a string of '0'/'1'. Returns the offset of the bit following
+    each match with at most threshold bit errors.
+    """
+    code = np.array([int(c) for c in code], dtype=np.uint8)
+    n = len(bits) - len(code) + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.intp)
+    errors = np.zeros(n, dtype=np.uint16)
+    for k in range(len(code)):
+        errors += (bits[k:k + n] & 1) != code[k]
+    return np.flatnonzero(errors <= threshold) + len(code)
+
+
+def windows(symbols, starts, length):
+    """Gather the data bit of length symbols from every start, shaped (n, length)."""
+    return symbols[np.asarray(starts)[:, None] + np.arange(length)] & 1
+
+
+def pack(bits):
+    """Pack bit rows into big endian bytes, left padding to a whole byte."""
+    bits = np.asarray(bits, dtype=np.uint8)
+    pad = -bits.shape[-1] % 8
+    if pad:
+        zeros = np.zeros(bits.shape[:-1] + (pad,), dtype=np.uint8)
+        bits = np.concatenate((zeros, bits), axis=-1)
+    return np.packbits(bits, axis=-1)
+
+
+def field(bits, start, length):
+    """Extract an unsigned field of up to 64 bits from every row of bits."""
+    if length > 64:
+        raise ValueError("field of %d bits does not fit in 64" % length)
+    sub = np.asarray(bits)[..., start:start + length]
+    zeros = np.zeros(sub.shape[:-1] + (64 - length,), dtype=np.uint8)
+    packed = np.packbits(np.concatenate((zeros, sub), axis=-1), axis=-1)
+    return np.ascontiguousarray(packed).view('>u8')[..., 0].astype(np.uint64)
+
+
+def to_int(bits):
+    """Value of a single bit row of any length as a Python int."""
+    return int(binascii.hexlify(pack(bits).tobytes()) or b'0', 16)
+
+
+def to_hex(bits):
+    """Hex digits of a single bit row, left padded to a whole byte."""
+    return binascii.hexlify(pack(bits).tobytes()).decode('ascii')
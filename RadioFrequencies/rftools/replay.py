@@ -0,0 +1,113 @@
+"""Stand-in for osmosdr.source that replays a recorded capture.
+
+    src = replay.source("capture.complex")          # paced by set_sample_rate
+    src = replay.source("capture.complex", rate=0)  # as fast as possible
+
+It takes the same setters the flowgraphs call on osmosdr.source, so a
+flowgraph can swap it in and run on a box with no SDR attached. The
+tuning setters only record their values; the capture is replayed as is.
+report() prints items produced and output buffer fullness for each block
+inside the source only, the latter needing [PerfCounters] on = True in
+the GNU Radio config; instrument.Throughput reports the whole flowgraph.
+"""
+
+from __future__ import division, print_function
+
+import sys
+import time
+
+from gnuradio import blocks, gr
+
+from rftools.iqfile import IQFile
+
+
+class source(gr.hier_block2):
+
+    def __init__(self, path, rate=None, fmt=None, repeat=True):
+        gr.hier_block2.__init__(self, "replay_source",
+                                gr.io_signature(0, 0, 0),
+                                gr.io_signature(1, 1, gr.sizeof_gr_complex))
+        capture = IQFile(path, fmt)
+        self.path = path
+        self.fmt = capture.fmt
+        self.capture_rate = capture.samp_rate
+        self.fixed_rate = rate
+        self.samp_rate = rate or capture.samp_rate or 1e6
+        self.settings = {}
+
+        if self.fmt == 'complex':
+            chain = [blocks.file_source(gr.sizeof_gr_complex, path, repeat)]
+        elif self.fmt == 'complex16s':
+            chain = [blocks.file_source(gr.sizeof_short, path, repeat),
+                     blocks.interleaved_short_to_complex(False, False),
+                     blocks.multiply_const_cc(1 / 32768.0)]
+        elif self.fmt == 'cs8':
+            chain = [blocks.file_source(gr.sizeof_char, path, repeat),
+                     blocks.interleaved_char_to_complex(False),
+                     blocks.multiply_const_cc(1 / 128.0)]
+        else:
+            raise ValueError("%s: cannot replay %s captures" % (path, self.fmt))
+
+        # rate 0 replays as fast as the flowgraph consumes
+        self.throttle = None
+        if rate != 0:
+            self.throttle = blocks.throttle(gr.sizeof_gr_complex, self.samp_rate)
+            chain.append(self.throttle)
+        self.blocks = chain
+        self.connect(*(chain + [self]))
+        self._last = (time.time(), None)
+
+    def set_sample_rate(self, samp_rate, chan=0):
+        if not self.fixed_rate:
+            self.samp_rate = samp_rate
+            if self.throttle is not None:
+                self.throttle.set_sample_rate(samp_rate)
+        return self.samp_rate
+
+    def get_sample_rate(self, chan=0):
+        return self.samp_rate
+
+    def _setting(name):
+        def setter(self, value, chan=0):
+            self.settings[name] = value
+            return value
+
+        def getter(self, chan=0):
+            return self.settings.get(name)
+        return setter, getter
+
+    set_center_freq, get_center_freq = _setting('center_freq')
+    set_freq_corr, get_freq_corr = _setting('freq_corr')
+    set_dc_offset_mode, get_dc_offset_mode = _setting('dc_offset_mode')
+    set_iq_balance_mode, get_iq_balance_mode = _setting('iq_balance_mode')
+    set_gain_mode, get_gain_mode = _setting('gain_mode')
+    set_gain, get_gain = _setting('gain')
+    set_if_gain, get_if_gain = _setting('if_gain')
+    set_bb_gain, get_bb_gain = _setting('bb_gain')
+    set_antenna, get_antenna = _setting('antenna')
+    set_bandwidth, get_bandwidth = _setting('bandwidth')
+    del _setting
+
+    def stats(self):
+        """(name, items produced, output buffer fullness or None) per block."""
+        rows = []
+        for block in self.blocks:
+            try:
+                full = block.pc_output_buffers_full(0)
+            except (AttributeError, RuntimeError):
+                full = None
+            rows.append((block.name(), block.nitems_written(0), full))
+        return rows
+
+    def report(self, out=sys.stderr):
+        """Print per block throughput since the previous report or creation."""
+        now = time.time()
+        rows = self.stats()
+        then, before = self._last
+        elapsed = max(now - then, 1e-9)
+        for k, (name, items, full) in enumerate(rows):
+            prev = before[k][1] if before else 0
+            occupancy = "-" if full is None else "%3.0f%%" % (100 * full)
+            out.write("replay %-32s %12d items %8.3f Msps  buffer %s\n" % (
+                name, items, (items - prev) / elapsed / 1e6, occupancy))
+        self._last = (now, rows)
@@ -0,0 +1,73 @@
+"""Filter tap designs shared by the flowgraphs.
+
+The flowgraphs redesign their low pass in every set_samp_rate() call, and
+a slider sweep makes the same handful of calls over and over; a 150 kHz
+filter with a 10 kHz transition is thousands of taps at 10 Msps. Designs
+are kept here in an LRU of SIZE entries keyed by every firdes.low_pass
+argument, so repeats are a dictionary lookup:
+
+    self.low_pass_filter_0.set_taps(taps.low_pass(1, samp_rate, 150e3, 100e3))
+
+precompute() designs a filter for the usual RTL-SDR rates in a background
+thread at startup, so the first change to one of them needs no design
+either.
+"""
+
+from __future__ import division
+
+import threading
+from collections import OrderedDict
+
+try:
+    from gnuradio.filter import firdes
+except ImportError:
+    # GNU Radio 3.6, as used by the Xyloc flowgraph
+    from gnuradio.gr import firdes
+
+SIZE = 64
+
+# rates rtl_sdr and osmosdr offer
+COMMON_RATES = (250e3, 500e3, 1e6, 1.024e6, 1.4e6, 1.8e6, 1.92e6, 2.048e6,
+                2.4e6, 2.56e6, 2.88e6, 3.2e6)
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def low_pass(gain, samp_rate, cutoff, transition, window=firdes.WIN_HAMMING, beta=6.76):
+    """firdes.low_pass as a tuple, designed once per set of arguments."""
+    key = (gain, samp_rate, cutoff, transition, window, beta)
+    with _lock:
+        taps = _cache.pop(key, None)
+        if taps is not None:
+            _cache[key] = taps
+            return taps
+    # designed outside the lock, a second caller racing for the same key
+    # only repeats the work
+    taps = tuple(firdes.low_pass(gain, samp_rate, cutoff, transition, window, beta))
+    with _lock:
+        _cache[key] = taps
+        while len(_cache) > SIZE:
+            _cache.popitem(last=False)
+    return taps
+
+
+def precompute(cutoff, transition, rates=COMMON_RATES, gain=1,
+               window=firdes.WIN_HAMMING, beta=6.76, background=True):
+    """Design the low pass for every rate, in a daemon thread unless background is False."""
+    def design():
+        for rate in rates:
+            low_pass(gain, rate, cutoff, transition, window, beta)
+
+    if not background:
+        design()
+        return None
+    thread = threading.Thread(target=design)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def clear():
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,42 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rftools import bursts
+from rftools.iqfile import IQFile
+
+
+class FindBurstsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        rng = np.random.RandomState(1)
+        x = ((rng.randn(40000) + 1j * rng.randn(40000)) * 0.01).astype(np.complex64)
+        x[5000:10000] += 1
+        x[20000:25000] += 1
+        path = os.path.join(self.dir, 'capture.complex')
+        x.tofile(path)
+        self.iq = IQFile(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def find(self, chunk):
+        found = bursts.find_bursts(self.iq, window=100, floor=-37, chunk=chunk)
+        return found[['start', 'end']].tolist()
+
+    def test_chunk_size_does_not_change_the_bursts(self):
+        whole = self.find(len(self.iq))
+        self.assertEqual(whole, [(4900, 10099), (19900, 25099)])
+        # 10099 ends a chunk exactly where the first burst closes
+        for chunk in (997, 4096, 5000, 9999, 10000, 10099, 10100, 20099, 1 << 20):
+            self.assertEqual(self.find(chunk), whole, "chunk %d" % chunk)
+
+
+if __name__ == '__main__':
+    unittest.main()